@@ -0,0 +1,140 @@
+"""Concurrency benchmark for the TermSync API.
+
+Hammers a running server with a fixed number of concurrent clients and reports
+the throughput (requests/sec) and latency percentiles. Run it once against the
+previous (sync pymongo) build and once against the current (motor) build, with
+the same mongod behind both, to compare.
+
+Usage (from the repo root, with the API and mongod running):
+    python -m benchmarks.concurrency --url http://127.0.0.1:2727 --clients 500
+"""
+
+# global imports
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import uuid4
+import httpx
+
+
+# endpoints hit by every virtual client, in rotation
+ENDPOINTS = [
+    "/",
+    "/projects/all/",
+    "/projects/{project}",
+    "/update/projects",
+]
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    """Latency percentile in milliseconds (latencies must be sorted)"""
+
+    if not latencies:
+        return None
+    index = min(len(latencies) - 1, int(len(latencies) * p))
+    return round(latencies[index] * 1000, 2)
+
+
+async def setup(client: httpx.AsyncClient) -> tuple[str, str]:
+    """Create a throwaway user and project to benchmark with
+
+    Returns:
+        tuple[str, str]: session token and project name
+    """
+
+    username = f"bench-{uuid4().hex[:8]}"
+    response = await client.post(
+        "/users/",
+        json={
+            "user": {"username": username, "full_name": "benchmark user"},
+            "password": "password",
+        },
+    )
+    response.raise_for_status()
+    token = response.json()["token"]
+
+    project = f"bench project {username}"
+    response = await client.post(
+        "/projects/",
+        headers={"token-uuid": token},
+        json={"name": project, "description": "benchmark project"},
+    )
+    response.raise_for_status()
+
+    return token, project
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    token: str,
+    project: str,
+    deadline: float,
+    latencies: list[float],
+    errors: list[int],
+) -> None:
+    """Virtual client, sends requests back to back until the deadline"""
+
+    i = 0
+    while time.perf_counter() < deadline:
+        url = ENDPOINTS[i % len(ENDPOINTS)].format(project=project)
+        i += 1
+
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, headers={"token-uuid": token})
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError:
+            errors.append(0)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str, clients: int, duration: float) -> dict:
+    """Run the benchmark and return the results"""
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        token, project = await setup(client)
+
+        latencies: list[float] = []
+        errors: list[int] = []
+        deadline = time.perf_counter() + duration
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                worker(client, token, project, deadline, latencies, errors)
+                for _ in range(clients)
+            ]
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:2727")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.clients, args.duration))
+    for key, value in results.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""Load test of every endpoint of the users, projects, login and hello world
+routers.
+
+Seeds a dataset (users, and projects with tasks and members), then runs
+concurrent virtual users against the app in this process. Each virtual user
+owns a project and goes through a scenario calling every endpoint, leaving
+the data as it found it, until the time is up. Throughput and p50/p95/p99
+latencies are reported per endpoint, written to a json report, and compared
+with a baseline report to flag regressions (exit code 1).
+
+Usage (from the repo root):
+    python -m benchmarks.endpoints --mongo-url mongodb://127.0.0.1:27017 \
+        --output report.json --baseline benchmarks/baselines/endpoints.json
+
+Without --mongo-url it runs against mongomock. The app runs in the same
+process and event loop as the virtual users (no network), and the update
+stream (/update/projects/stream) is left out, as it never ends.
+"""
+
+# global imports
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+from mongomock_motor import AsyncMongoMockClient
+
+# relative imports
+from src.server.main import app
+from src.server.database import Database
+from src.server.dependencies import db_depend
+from src.server.models import User_DB, Project, Discrete_Task, Milestone_Task
+from .concurrency import percentile
+
+PASSWORD = "password"
+
+
+class BenchmarkDatabase(Database):
+    """Database on a throwaway 'termsync_benchmark' database"""
+
+    def __init__(self, mongo_url: str | None) -> None:
+        super().__init__()
+        if mongo_url is None:
+            self.client = AsyncMongoMockClient()
+        else:
+            self.client = AsyncIOMotorClient(mongo_url)
+        self.db = self.client.termsync_benchmark
+
+
+def random_project(name: str, members: list[str], tasks: int) -> Project:
+    """Project with a mix of discrete and milestone tasks"""
+
+    project = Project(name=name, owner=members[0], members=members)
+    for i in range(tasks):
+        if random.random() < 0.5:
+            task = Discrete_Task(name=f"task {i}", completed=random.random() < 0.5)
+        else:
+            milestones = random.randint(1, 20)
+            task = Milestone_Task(
+                name=f"task {i}",
+                milestones=milestones,
+                completed=random.randint(0, milestones),
+            )
+        project.add_task(task)
+
+    return project
+
+
+async def seed(db: Database, users: int, projects: int, tasks: int, members: int):
+    """Background data the virtual users run into: users to search for and add
+    to projects, and projects (with tasks) they are members of"""
+
+    usernames = [f"user{i}" for i in range(users)]
+    for username in usernames:
+        await db.post_user(
+            User_DB(username=username, full_name=f"user {username}", password=PASSWORD)
+        )
+
+    for i in range(projects):
+        project_members = random.sample(usernames, min(members, users))
+        await db.add_project(random_project(f"project {i}", project_members, tasks))
+
+
+class VirtualUser:
+    """Client going through every endpoint, recording the latencies by route"""
+
+    def __init__(
+        self, client: httpx.AsyncClient, index: int, admin_token: str, memberships: int
+    ) -> None:
+        self.client = client
+        self.username = f"bench{index}"
+        self.project = f"bench project {index}"
+        self.other = f"user{index}"  # seeded user to add to the project
+        self.admin_token = admin_token
+        self.memberships = memberships
+        self.iteration = 0
+
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def request(
+        self, route: str, url: str, token: str | None = None, **kwargs
+    ) -> httpx.Response:
+        """Send a request and record its latency under the route template
+        (e.g. "PUT /projects/{project_name}")"""
+
+        method = route.split(" ", 1)[0]
+        headers = {"token-uuid": token if token is not None else self.token}
+
+        start = time.perf_counter()
+        response = await self.client.request(method, url, headers=headers, **kwargs)
+        latency = time.perf_counter() - start
+
+        if response.is_success:
+            self.latencies.setdefault(route, []).append(latency)
+        else:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+    async def setup(self, db: Database) -> None:
+        response = await self.client.post(
+            "/users/",
+            json={
+                "user": {"username": self.username, "full_name": "benchmark user"},
+                "password": PASSWORD,
+            },
+        )
+        response.raise_for_status()
+        self.token = response.json()["token"]
+
+        response = await self.client.post(
+            "/projects/",
+            headers={"token-uuid": self.token},
+            json={"name": self.project, "description": "benchmark project"},
+        )
+        response.raise_for_status()
+
+        # member of some seeded projects, so the project list has some weight
+        await db.db.projects.update_many(
+            {"name": {"$in": [f"project {i}" for i in range(self.memberships)]}},
+            {"$push": {"members": self.username}},
+        )
+
+    async def scenario(self) -> None:
+        """One pass through every endpoint"""
+
+        self.iteration += 1
+        me = self.username
+        project = f"/projects/{self.project}"
+        task = f"{project}/tasks/bench task"
+        temp_user = f"{me}-temp-{self.iteration}"
+        temp_project = f"{self.project} temp {self.iteration}"
+
+        await self.request("GET /", "/")
+
+        # users
+        await self.request("GET /users/{username}", f"/users/{self.other}")
+        await self.request(
+            "GET /users/", "/users/", params={"search": self.other[:5], "limit": 20}
+        )
+        await self.request(
+            "PUT /users/{username}",
+            f"/users/{me}",
+            json={"username": me, "full_name": f"benchmark user {self.iteration}"},
+        )
+        response = await self.request(
+            "POST /users/",
+            "/users/",
+            json={
+                "user": {"username": temp_user, "full_name": "temporary user"},
+                "password": PASSWORD,
+            },
+        )
+        await self.request(
+            "POST /admin/{username}", f"/admin/{temp_user}", token=self.admin_token
+        )
+        if response.is_success:
+            await self.request(
+                "DELETE /users/{username}",
+                f"/users/{temp_user}",
+                token=response.json()["token"],
+                json=PASSWORD,
+            )
+
+        # projects
+        await self.request("GET /projects/all/", "/projects/all/")
+        response = await self.request("GET /projects/{project_name}", project)
+        if response.is_success:
+            updated = {**response.json(), "description": f"version {self.iteration}"}
+            await self.request("PUT /projects/{project_name}", project, json=updated)
+        await self.request("POST /projects/", "/projects/", json={"name": temp_project})
+        await self.request(
+            "DELETE /projects/{project_name}", f"/projects/{temp_project}"
+        )
+
+        # members, moderators and tasks
+        members = f"{project}/members/{self.other}"
+        moderators = f"{project}/moderators/{self.other}"
+        await self.request(
+            "POST /projects/{project_name}/members/{member_username}", members
+        )
+        await self.request(
+            "POST /projects/{project_name}/moderators/{member_username}", moderators
+        )
+        # an int completion, or the task is read as a Discrete_Task
+        await self.request(
+            "POST /projects/{project_name}/tasks/",
+            f"{project}/tasks/",
+            json={"name": "bench task", "milestones": 10, "completed": 0},
+        )
+        await self.request(
+            "PUT /projects/{project_name}/tasks/{task_name}",
+            task,
+            json={"name": "bench task", "milestones": 20, "completed": 0},
+        )
+        await self.request(
+            "PUT /projects/{project_name}/tasks/{task_name}/completion",
+            f"{task}/completion",
+            params={"completion": 2 + self.iteration % 18},  # 0 and 1 read as bools
+        )
+        await self.request(
+            "POST /projects/{project_name}/tasks/{task_name}/members/{member_username}",
+            f"{task}/members/{self.other}",
+        )
+        await self.request(
+            "DELETE /projects/{project_name}/tasks/{task_name}/members/{member_username}",
+            f"{task}/members/{self.other}",
+        )
+        await self.request("DELETE /projects/{project_name}/tasks/{task_name}", task)
+        await self.request(
+            "DELETE /projects/{project_name}/moderators/{member_username}", moderators
+        )
+        await self.request(
+            "DELETE /projects/{project_name}/members/{member_username}", members
+        )
+        await self.request("GET /update/projects", "/update/projects")
+
+        # login last, it replaces the session token
+        response = await self.request(
+            "POST /login/", "/login/", json={"username": me, "password": PASSWORD}
+        )
+        if response.is_success:
+            self.token = response.json()["token"]
+
+    async def run(self, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            await self.scenario()
+
+
+async def run(
+    mongo_url: str | None,
+    vus: int,
+    duration: float,
+    users: int,
+    projects: int,
+    tasks: int,
+    members: int,
+) -> dict:
+    """Seed the database, run the virtual users and return the report"""
+
+    db = BenchmarkDatabase(mongo_url)
+    await db.client.drop_database("termsync_benchmark")
+    await db.ensure_indexes()
+    await seed(db, users, projects, tasks, members)
+
+    async def db_depend_override() -> Database:
+        return db
+
+    app.dependency_overrides[db_depend] = db_depend_override
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", timeout=60
+    ) as client:
+        response = await client.post(
+            "/users/",
+            json={
+                "user": {"username": "benchadmin", "full_name": "benchmark admin"},
+                "password": PASSWORD,
+            },
+        )
+        response.raise_for_status()
+        admin_token = response.json()["token"]
+        await db.make_admin("benchadmin")
+
+        virtual_users = [
+            VirtualUser(client, i, admin_token, min(members, projects))
+            for i in range(vus)
+        ]
+        for virtual_user in virtual_users:
+            await virtual_user.setup(db)
+
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*[vu.run(deadline) for vu in virtual_users])
+        elapsed = time.perf_counter() - start
+
+    app.dependency_overrides.pop(db_depend)
+    await db.client.drop_database("termsync_benchmark")
+
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    for virtual_user in virtual_users:
+        for route, values in virtual_user.latencies.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, count in virtual_user.errors.items():
+            errors[route] = errors.get(route, 0) + count
+
+    endpoints = {}
+    for route in sorted(latencies.keys() | errors.keys()):
+        values = sorted(latencies.get(route, []))
+        endpoints[route] = {
+            "requests": len(values),
+            "errors": errors.get(route, 0),
+            "requests_per_second": round(len(values) / elapsed, 1),
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+        }
+
+    return {
+        "config": {
+            "database": "mongod" if mongo_url is not None else "mongomock",
+            "vus": vus,
+            "duration": duration,
+            "users": users,
+            "projects": projects,
+            "tasks": tasks,
+            "members": members,
+            "python": platform.python_version(),
+        },
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_second": round(
+            sum(endpoint["requests"] for endpoint in endpoints.values()) / elapsed, 1
+        ),
+        "endpoints": endpoints,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of a report against a baseline: endpoints whose p95 latency
+    went up, or whose throughput went down, by more than the tolerance, and
+    endpoints that started failing
+
+    Args:
+        report (dict): report of this run
+        baseline (dict): report to compare with
+        tolerance (float): allowed relative change (e.g. 0.2 for 20%)
+
+    Returns:
+        list[str]: a line per regression, empty if there are none
+    """
+
+    regressions = []
+    for route, result in report["endpoints"].items():
+        previous = baseline["endpoints"].get(route)
+        if previous is None:
+            continue
+
+        if result["errors"] and not previous["errors"]:
+            regressions.append(f"{route}: {result['errors']} errors")
+
+        if result["p95_ms"] is not None and previous["p95_ms"] is not None:
+            if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{route}: p95 {previous['p95_ms']} -> {result['p95_ms']} ms"
+                )
+
+        if result["requests_per_second"] < previous["requests_per_second"] * (
+            1 - tolerance
+        ):
+            regressions.append(
+                f"{route}: {previous['requests_per_second']} ->"
+                f" {result['requests_per_second']} requests/sec"
+            )
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--vus", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--users", type=int, default=200, help="seeded users")
+    parser.add_argument("--projects", type=int, default=100, help="seeded projects")
+    parser.add_argument("--tasks", type=int, default=20, help="tasks per project")
+    parser.add_argument(
+        "--members", type=int, default=10, help="members per seeded project"
+    )
+    parser.add_argument("--output", default=None, help="json report to write")
+    parser.add_argument("--baseline", default=None, help="json report to compare to")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed change vs baseline"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run(
+            args.mongo_url,
+            args.vus,
+            args.duration,
+            args.users,
+            args.projects,
+            args.tasks,
+            args.members,
+        )
+    )
+
+    print(f"requests_per_second: {report['requests_per_second']}")
+    for route, result in report["endpoints"].items():
+        print(
+            f"{route}: {result['requests_per_second']} req/s, p50"
+            f" {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99"
+            f" {result['p99_ms']} ms, {result['errors']} errors"
+        )
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["config"] != report["config"]:
+            print("warning: the baseline was run with a different configuration")
+
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
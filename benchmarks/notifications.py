@@ -0,0 +1,112 @@
+"""Benchmark for the project member notification fan-out.
+
+Compares the previous fan-out (a find_one and a conditional $push per member,
+2N round trips) with Database.notify_members (a single update_many), for
+projects of 10, 100 and 1,000 members.
+
+Usage (from the repo root):
+    python -m benchmarks.notifications --mongo-url mongodb://127.0.0.1:27017
+
+Without --mongo-url it runs against mongomock, which has no network round
+trips, so the difference it shows is a lower bound.
+"""
+
+# global imports
+import argparse
+import asyncio
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from mongomock_motor import AsyncMongoMockClient
+
+# relative imports
+from src.server.database import Database
+from src.server.models import User_DB
+
+
+class BenchmarkDatabase(Database):
+    """Database on a throwaway 'termsync_benchmark' database"""
+
+    def __init__(self, mongo_url: str | None) -> None:
+        super().__init__()
+        if mongo_url is None:
+            self.client = AsyncMongoMockClient()
+        else:
+            self.client = AsyncIOMotorClient(mongo_url)
+        self.db = self.client.termsync_benchmark
+
+
+async def notify_members_loop(db: Database, project_name: str, members: list[str]):
+    """The previous fan-out, one find_one and one $push per member"""
+
+    for username in members:
+        user_db = User_DB(**await db.db.users.find_one({"username": username}))
+        if project_name not in user_db.update_projects:
+            await db.db.users.update_one(
+                {"username": username},
+                {"$push": {"update_projects": project_name}},
+            )
+
+
+async def measure(db: Database, fan_out, members: list[str], repeat: int) -> float:
+    """Average time (ms) of a fan-out, starting from no pending notifications"""
+
+    total = 0
+    for i in range(repeat):
+        await db.db.users.update_many({}, {"$set": {"update_projects": []}})
+        start = time.perf_counter()
+        await fan_out(db, f"project {i}", members)
+        total += time.perf_counter() - start
+
+    return total / repeat * 1000
+
+
+async def run(mongo_url: str | None, sizes: list[int], repeat: int) -> list[dict]:
+    db = BenchmarkDatabase(mongo_url)
+    await db.db.users.drop()
+    await db.ensure_indexes()
+
+    # seed the largest project's members, smaller projects use a subset
+    await db.db.users.insert_many(
+        [
+            User_DB(
+                username=f"member{i}", full_name=f"member {i}", password="password"
+            ).model_dump()
+            for i in range(max(sizes))
+        ]
+    )
+
+    results = []
+    for size in sizes:
+        members = [f"member{i}" for i in range(size)]
+        loop_ms = await measure(db, notify_members_loop, members, repeat)
+        update_many_ms = await measure(db, Database.notify_members, members, repeat)
+        results.append(
+            {
+                "members": size,
+                "loop_ms": round(loop_ms, 2),
+                "update_many_ms": round(update_many_ms, 2),
+            }
+        )
+
+    await db.client.drop_database("termsync_benchmark")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.mongo_url, args.sizes, args.repeat))
+
+    print(f"{'members':>8} {'loop (ms)':>12} {'update_many (ms)':>18}")
+    for result in results:
+        print(
+            f"{result['members']:>8} {result['loop_ms']:>12} {result['update_many_ms']:>18}"
+        )
+
+
+if __name__ == "__main__":
+    main()
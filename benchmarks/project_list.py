@@ -0,0 +1,148 @@
+"""Benchmark for the project list of a user who is a member of many projects.
+
+Compares three ways of getting every project's [done, total]:
+    pydantic:  load the full project documents and sum Project.progress
+    counters:  read the done/total counters stored on the project documents
+    aggregate: compute them inside mongo with PROJECT_PROGRESS_PIPELINE
+and checks that the counters and the aggregation match Project.progress.
+
+Usage (from the repo root):
+    python -m benchmarks.project_list --mongo-url mongodb://127.0.0.1:27017
+
+Without --mongo-url it runs against mongomock, which does not implement
+$reduce, so only the pydantic and counters variants are measured.
+"""
+
+# global imports
+import argparse
+import asyncio
+import random
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from mongomock_motor import AsyncMongoMockClient
+
+# relative imports
+from src.server.database import Database
+from src.server.models import Project, Discrete_Task, Milestone_Task
+
+
+USERNAME = "member"
+
+
+class BenchmarkDatabase(Database):
+    """Database on a throwaway 'termsync_benchmark' database"""
+
+    def __init__(self, mongo_url: str | None) -> None:
+        super().__init__()
+        if mongo_url is None:
+            self.client = AsyncMongoMockClient()
+        else:
+            self.client = AsyncIOMotorClient(mongo_url)
+        self.db = self.client.termsync_benchmark
+
+
+def random_project(i: int, tasks: int) -> Project:
+    """Project with a mix of discrete and milestone tasks"""
+
+    project = Project(name=f"project {i}", members=[USERNAME])
+    for j in range(tasks):
+        if random.random() < 0.5:
+            task = Discrete_Task(name=f"task {j}", completed=random.random() < 0.5)
+        else:
+            milestones = random.randint(0, 20)
+            task = Milestone_Task(
+                name=f"task {j}",
+                milestones=milestones,
+                completed=random.randint(0, milestones),
+            )
+        project.add_task(task)
+
+    return project
+
+
+async def list_pydantic(db: Database) -> dict:
+    """The previous project list, full documents through pydantic"""
+
+    response = {}
+    async for document in db.db.projects.find({"members": USERNAME}):
+        project = Project(**document)
+        response[project.name] = project.progress
+
+    return response
+
+
+async def list_counters(db: Database) -> dict:
+    response = {}
+    async for project in db.get_all_project(USERNAME, source="counters"):
+        response[project["name"]] = [project["done"], project["total"]]
+
+    return response
+
+
+async def list_aggregate(db: Database) -> dict:
+    response = {}
+    async for project in db.get_all_project(USERNAME, source="aggregate"):
+        response[project["name"]] = [project["done"], project["total"]]
+
+    return response
+
+
+async def measure(db: Database, list_projects, repeat: int) -> tuple[float, dict]:
+    """Average time (ms) of a project list, and its result"""
+
+    total = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await list_projects(db)
+        total += time.perf_counter() - start
+
+    return total / repeat * 1000, result
+
+
+async def run(mongo_url: str | None, projects: int, tasks: int, repeat: int) -> dict:
+    db = BenchmarkDatabase(mongo_url)
+    await db.db.projects.drop()
+    await db.ensure_indexes()
+
+    await db.db.projects.insert_many(
+        [
+            {
+                **project.model_dump(),
+                **Database._progress_counters(project),
+            }
+            for project in (random_project(i, tasks) for i in range(projects))
+        ]
+    )
+
+    results = {}
+    pydantic_ms, expected = await measure(db, list_pydantic, repeat)
+    results["pydantic_ms"] = round(pydantic_ms, 2)
+
+    counters_ms, counters = await measure(db, list_counters, repeat)
+    assert counters == expected, "stored counters do not match Project.progress"
+    results["counters_ms"] = round(counters_ms, 2)
+
+    if mongo_url is not None:
+        aggregate_ms, aggregate = await measure(db, list_aggregate, repeat)
+        assert aggregate == expected, "aggregation does not match Project.progress"
+        results["aggregate_ms"] = round(aggregate_ms, 2)
+
+    await db.client.drop_database("termsync_benchmark")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=20, help="tasks per project")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.mongo_url, args.projects, args.tasks, args.repeat))
+    for key, value in results.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark for the size and serialization time of a large project response.
+
+Builds a project with many tasks (5000 by default) and compares:
+    json:    rendering the response with FastAPI's default JSONResponse
+    orjson:  rendering it with ORJSONResponse (the projects and users routers)
+and the size of the body sent without compression, with gzip and with brotli
+(as CompressionMiddleware does), with the time the compression takes.
+
+Usage (from the repo root):
+    python -m benchmarks.serialization --tasks 5000
+"""
+
+# global imports
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+# relative imports
+from src.server.models import Project, Discrete_Task, Milestone_Task
+from src.server.compression import Compressor
+
+
+def large_project(tasks: int) -> Project:
+    """Project with a mix of discrete and milestone tasks, each with a
+    description and a few of the project's members"""
+
+    members = [f"member {i}" for i in range(20)]
+    project = Project(
+        name="large project",
+        description="benchmark project",
+        owner=members[0],
+        members=members,
+        moderators=members[:3],
+    )
+    for j in range(tasks):
+        description = f"task {j}: " + " ".join(
+            random.choices(["write", "review", "test", "ship", "the", "report"], k=12)
+        )
+        if j % 2:
+            task = Discrete_Task(
+                name=f"task {j}",
+                description=description,
+                members=random.sample(members, 3),
+                completed=random.random() < 0.5,
+            )
+        else:
+            task = Milestone_Task(
+                name=f"task {j}",
+                description=description,
+                members=random.sample(members, 3),
+                milestones=10,
+                completed=random.randint(0, 10),
+            )
+        project.tasks.append(task)
+
+    return project
+
+
+def timed(function, repeat: int) -> float:
+    """Median time of a function in milliseconds"""
+
+    function()  # warm up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return round(statistics.median(times) * 1000, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    project = large_project(args.tasks)
+
+    # what the endpoint hands to the response class: the validated project
+    field = create_response_field("Response_get_project", Project)
+    content = asyncio.run(serialize_response(field=field, response_content=project))
+    validate = timed(
+        lambda: asyncio.run(serialize_response(field=field, response_content=project)),
+        args.repeat,
+    )
+
+    print(f"project with {args.tasks} tasks")
+    print(f"  response validation (both)  {validate:>9} ms")
+    for name, response_class in [("json", JSONResponse), ("orjson", ORJSONResponse)]:
+        render = timed(lambda: response_class(content), args.repeat)
+        print(f"  {name:<6} render              {render:>9} ms")
+
+    body = ORJSONResponse(content).body
+    print(f"  {'identity':<8} {len(body):>10} bytes")
+    for encoding in ["gzip", "br"]:
+        compress = lambda: Compressor(encoding, 6, 5).finish(body)  # noqa: E731
+        size = len(compress())
+        print(
+            f"  {encoding:<8} {size:>10} bytes ({size / len(body):.1%})"
+            f" in {timed(compress, args.repeat)} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark for the pydantic validation cost of a project request.
+
+GET /projects/{name} turns a project document into a Project, then into the
+response body. For projects of a few sizes, compares:
+    load, validated:  Project(**document)
+    load, trusted:    Project.from_document(document) (TRUSTED_READS=true)
+    response, validated:  FastAPI's response model validation and dump
+    response, direct:     project.model_dump(mode="json") (what the endpoint
+                          sends now)
+and the total validation cost per request before and after.
+
+Usage (from the repo root):
+    python -m benchmarks.validation --tasks 100 1000 5000
+"""
+
+# global imports
+import argparse
+import asyncio
+from bson import ObjectId
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+# relative imports
+from src.server.models import Project
+from benchmarks.serialization import large_project, timed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    field = create_response_field("Response_get_project", Project)
+
+    print(f"{'tasks':>6} {'load':>9} {'trusted':>9} {'response':>9} {'direct':>9}")
+    for tasks in args.tasks:
+        document = {"_id": ObjectId(), **large_project(tasks).model_dump()}
+        project = Project(**document)
+
+        load = timed(lambda: Project(**document), args.repeat)
+        trusted = timed(lambda: Project.from_document(document), args.repeat)
+        response = timed(
+            lambda: asyncio.run(
+                serialize_response(field=field, response_content=project)
+            ),
+            args.repeat,
+        )
+        direct = timed(lambda: project.model_dump(mode="json"), args.repeat)
+
+        print(f"{tasks:>6} {load:>9} {trusted:>9} {response:>9} {direct:>9}")
+        print(
+            f"{'':>6} per request: {round(load + response, 2)} ms validated,"
+            f" {round(trusted + direct, 2)} ms trusted"
+        )
+
+
+if __name__ == "__main__":
+    main()
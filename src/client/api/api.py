@@ -1,10 +1,13 @@
 from uuid import UUID
+from typing import Iterator
 import httpx
 from httpx import Response
 from models import User, Project, Discrete_Task, Milestone_Task
+import copy
 import hashlib
+import json
 
-from utils import NotAdmin, get_settings
+from utils import NotAdmin, get_settings, apply_changes
 
 
 class API:
@@ -14,8 +17,63 @@ class API:
         self.host = host
         self.port = port
         self.server = f"http://{host}:{port}"
+        # httpx asks for compressed responses (Accept-Encoding: gzip, deflate,
+        # and br since the brotli package is installed) and decodes them
         self.client = httpx.Client(base_url=self.server)
 
+        # url -> (ETag, json body) of the last version of tagged resources
+        self.etags: dict[str, tuple[str, any]] = {}
+
+    def conditional_get(self, url: str, token: str) -> tuple[int, any]:
+        """GET a resource the server tags with an ETag (projects and users).
+        The last version is kept and its ETag sent in If-None-Match, so an
+        unchanged resource is not downloaded again
+
+        Args:
+            url (str): resource url
+            token (str): session token
+
+        Returns:
+            tuple[int, any]: status code (200 when the kept version is still
+            current) and json body (None on errors)
+        """
+
+        headers = {"content-type": "application/json", "token-uuid": token}
+        cached = self.etags.get(url)
+        if cached is not None:
+            headers["if-none-match"] = cached[0]
+
+        response = self.client.get(url, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            return 200, cached[1]
+
+        if response.status_code != 200:
+            self.etags.pop(url, None)
+            return response.status_code, None
+
+        data = response.json()
+        if "etag" in response.headers:
+            self.etags[url] = (response.headers["etag"], data)
+
+        return 200, data
+
+    def if_match(self, url: str) -> dict:
+        """If-Match header with the ETag of the kept version of a resource, so
+        a write based on it fails (412) if someone changed it in the meantime
+
+        Args:
+            url (str): resource url
+
+        Returns:
+            dict: headers to add to the request
+        """
+
+        cached = self.etags.get(url)
+        if cached is None:
+            return {}
+        return {"if-match": cached[0]}
+
     # USER METHODS
 
     def get_username(self, token: UUID) -> str:
@@ -131,27 +189,29 @@ class API:
             User: user data
         """
 
-        response = self.client.get(
-            f"/users/{username}",
-            headers={"content-type": "application/json", "token-uuid": token},
-        )
+        status_code, data = self.conditional_get(f"/users/{username}", token)
 
-        if response.status_code == 200:
-            return User(**response.json())
+        if status_code == 200:
+            return User(**data)
         else:
             return None
 
-    def get_multiple_users(self, token: str, username: str) -> list[str]:
-        """Query the server for all users with a similar username
+    def get_multiple_users(
+        self, token: str, username: str, limit: int = 20
+    ) -> list[str]:
+        """Query the server for users with a similar username, best matches first
 
         Args:
             username (str): username to query by
+            limit (int, optional): maximum number of results. Defaults to 20.
 
         Returns:
             list[str]: search results
         """
         response = self.client.get(
-            f"/users/?search={username}", headers={"token-uuid": token}
+            "/users/",
+            params={"search": username, "limit": limit},
+            headers={"token-uuid": token},
         )
 
         if response.status_code == 200:
@@ -295,16 +355,57 @@ class API:
             Project: project data
         """
 
+        status_code, data = self.conditional_get(f"/projects/{project_name}", token)
+
+        if status_code == 200:
+            return Project(**data)
+        else:
+            return status_code
+
+    def sync_project(self, token: str, project_name: str) -> Project:
+        """Get project data from API, catching up the kept copy of the project
+        with the changes made since instead of downloading all of it again
+
+        Args:
+            token (str): session token
+            project_name (str): name of project
+
+        Returns:
+            Project: project data
+        """
+
+        url = f"/projects/{project_name}"
+        cached = self.etags.get(url)
+        if cached is None:
+            return self.get_project(token, project_name)
+
+        etag, data = cached
         response = self.client.get(
-            f"/projects/{project_name}",
+            f"{url}/changes",
+            params={"since": data.get("revision", 0)},
             headers={"content-type": "application/json", "token-uuid": token},
         )
 
-        if response.status_code == 200:
-            return Project(**response.json())
-        else:
+        if response.status_code != 200:
+            self.etags.pop(url, None)
             return response.status_code
 
+        changes = response.json()
+        if "snapshot" in changes:
+            data = changes["snapshot"]
+        else:
+            try:
+                data = apply_changes(copy.deepcopy(data), changes["changes"])
+            except (KeyError, ValueError):
+                # the copy is off, start over from the whole project
+                self.etags.pop(url, None)
+                return self.get_project(token, project_name)
+        data["revision"] = changes["revision"]
+
+        self.etags[url] = (response.headers.get("etag", etag), data)
+
+        return Project(**data)
+
     def get_all_projects(self, token: str) -> dict:
         """Get all projects the user is a member of
 
@@ -322,6 +423,32 @@ class API:
         else:
             return response.status_code
 
+    def stream_all_projects(self, token: str) -> Iterator[tuple[str, list[int]]]:
+        """Get all projects the user is a member of, streamed as newline
+        delimited json so they can be shown before the whole list arrives
+
+        Args:
+            token (str): session token
+
+        Raises:
+            httpx.HTTPStatusError: the server refused the request
+
+        Yields:
+            tuple[str, list[int]]: project name and progress
+        """
+
+        with self.client.stream(
+            "GET",
+            "/projects/all/",
+            headers={"token-uuid": token, "accept": "application/x-ndjson"},
+        ) as response:
+            response.raise_for_status()
+
+            for line in response.iter_lines():
+                if line:
+                    project = json.loads(line)
+                    yield project["name"], project["progress"]
+
     def put_project(self, token: str, project_name: str, updated_data: Project) -> int:
         """Update project data
 
@@ -339,7 +466,11 @@ class API:
 
         response = self.client.put(
             f"/projects/{project_name}",
-            headers={"content-type": "application/json", "token-uuid": token},
+            headers={
+                "content-type": "application/json",
+                "token-uuid": token,
+                **self.if_match(f"/projects/{project_name}"),
+            },
             json=updated_data.model_dump(),
         )
 
@@ -522,7 +653,7 @@ class API:
 
         response = self.client.put(
             f"/projects/{project_name}/tasks/{task_name}",
-            headers={"token-uuid": token},
+            headers={"token-uuid": token, **self.if_match(f"/projects/{project_name}")},
             json=updated_data.model_dump(),
         )
 
@@ -629,13 +760,44 @@ class API:
 
         response = self.client.put(
             f"/projects/{project_name}/tasks/{task_name}/completion?completion={progress}",
-            headers={"token-uuid": token},
+            headers={"token-uuid": token, **self.if_match(f"/projects/{project_name}")},
         )
 
         if response.status_code == 403:
             raise NotAdmin
         return response
 
+    def project_batch(
+        self, token: str, project_name: str, operations: list[dict]
+    ) -> list[dict] | int:
+        """Apply several changes to a project in a single request (e.g.
+        adding a list of members)
+
+        Args:
+            token (str): session token
+            project_name (str): project name
+            operations (list[dict]): operations to apply, in order, like
+            {"op": "add_member", "username": "..."}
+
+        Returns:
+            list[dict] | int: result of each operation ({"status", "detail"}),
+            or the http status code if the request failed. Nothing is changed
+            if one of the operations failed
+        """
+
+        response = self.client.post(
+            f"/projects/{project_name}/batch",
+            json=operations,
+            headers={"content-type": "application/json", "token-uuid": token},
+        )
+
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 400:
+            # an operation failed, the results say which
+            return response.json()["detail"]
+        return response.status_code
+
     def get_project_updates(self, token: str) -> Response:
         """Get list of all projects that have been updated since last seen
 
@@ -650,6 +812,41 @@ class API:
 
         return response
 
+    def stream_project_updates(self, token: str) -> Iterator[tuple[str, any]]:
+        """Listen to the server's project update stream (server-sent events).
+        The server sends a heartbeat every 15 seconds when idle, so a read
+        timeout means the connection is gone
+
+        Args:
+            token (str): session token
+
+        Raises:
+            httpx.HTTPStatusError: the server refused the stream (e.g. expired token)
+            httpx.HTTPError: the connection failed or timed out
+
+        Yields:
+            tuple[str, any]: event ("update" or "heartbeat") and its data
+        """
+
+        with self.client.stream(
+            "GET",
+            "/update/projects/stream",
+            headers={"token-uuid": token},
+            timeout=httpx.Timeout(10, read=45),
+        ) as response:
+            response.raise_for_status()
+
+            event, data = None, None
+            for line in response.iter_lines():
+                if line.startswith("event:"):
+                    event = line.removeprefix("event:").strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line.removeprefix("data:"))
+                elif line == "" and event is not None:
+                    # a blank line ends the event
+                    yield event, data
+                    event, data = None, None
+
 
 # get api settings
 HOST = get_settings("HOST")
@@ -118,28 +118,36 @@ class App:
             exit(0)
 
     def get_update(self) -> None:
-        """Thread that periodically checks in with the api. It determines if the client is still connected,
-        and handles the project update functionality"""
+        """Thread that listens to the api's project update stream. It determines if the client is still
+        connected (the server sends heartbeats when idle), and handles the project update functionality
+        """
 
         while self.state == State.RUNNING:
             token = get_token()
+            if token is None:
+                self.status = Status.DISCONNECTED
+                sleep(3)
+                continue
 
             try:
-                response = self.api.get_project_updates(token)
-
-                if response.status_code == 200:
+                for event, data in self.api.stream_project_updates(token):
+                    if event == "update" and len(data) > 0:
+                        write_update_cache(*data)
 
-                    if len(response.json()) > 0 or read_update_cache() != [""]:
+                    if read_update_cache() != [""]:
                         self.status = Status.UPDATE
-
-                        if len(response.json()) > 0:
-                            write_update_cache(*response.json())
                     else:
                         self.status = Status.CONNECTED
+
+                    # reconnect with the new token if the user logged in again
+                    if get_token() != token or self.state != State.RUNNING:
+                        break
                 else:
+                    # the server ended the stream (the session expired)
                     self.status = Status.DISCONNECTED
-
-                sleep(3)
             except:
                 self.status = Status.DISCONNECTED
-                continue
+
+            # wait a bit before reconnecting, unless the user just logged in again
+            if get_token() == token:
+                sleep(3)
@@ -3,6 +3,8 @@ from rich.panel import Panel
 from rich.progress import Progress
 from rich.text import Text
 from random import choice
+from typing import Iterable
+import httpx
 
 from models import Project, Discrete_Task, Milestone_Task
 from ui import console
@@ -94,18 +96,17 @@ def show_project(
         # console.print(
         #     "You have to enter the name of the project to show\n", style="warning"
         # )
-        projects = api.get_all_projects(token)
-        if type(projects) is int:
+        try:
+            print_all_projects(api.stream_all_projects(token))
+        except httpx.HTTPStatusError as error:
             console.print(
-                f"Could not retrieve list of projects (HTTP Error {projects})\n",
+                f"Could not retrieve list of projects (HTTP Error {error.response.status_code})\n",
                 style="danger",
             )
-        else:
-            print_all_projects(projects)
         return
 
     # api call
-    project = api.get_project(token, project_name)
+    project = api.sync_project(token, project_name)
 
     if type(project) is int:
         if project == 404:
@@ -170,29 +171,34 @@ def print_project(project_data: Project, console: Console = console) -> None:
     console.print(data)
 
 
-def print_all_projects(projects: dict, console: Console = console) -> None:
-    """Print all projects the user is a member of
+def print_all_projects(
+    projects: Iterable[tuple[str, list[int]]], console: Console = console
+) -> None:
+    """Print all projects the user is a member of, as they arrive
 
     Args:
-        projects (dict): list of projects, format: {project: project.progress}
+        projects (Iterable[tuple[str, list[int]]]): projects, format:
+        (project, project.progress)
         console (Console, optional): _description_. Defaults to console.
     """
 
     # random color for printing
     color = choice(["red", "blue", "green", "cyan", "purple", "magenta", "yellow"])
 
-    # if user is not part of any projects
-    if len(projects.keys()) == 0:
-        console.print("You are not part of any projects\n", style=color)
-        return
-
     # proint projects
-    for project in projects:
+    empty = True
+    for project, progress in projects:
+        empty = False
         console.print(f"[{color}]{project}[/]\n")
         console.print(
-            f"Progress: [{projects[project][0]}/{projects[project][1]}]\n",
+            f"Progress: [{progress[0]}/{progress[1]}]\n",
         )
 
+    # if user is not part of any projects
+    if empty:
+        console.print("You are not part of any projects\n", style=color)
+        return
+
     console.print()  # add space
 
 
@@ -246,6 +252,11 @@ def edit_project(
 
     if rc == 200:
         console.print("\nProject updated successfully!\n", style="success")
+    elif rc == 412:
+        console.print(
+            "\nSomeone else changed the project in the meantime, please try again\n",
+            style="danger",
+        )
     elif (
         rc == 400
     ):  # only possible with a modified client, thought to include this anyway
@@ -304,12 +315,70 @@ def delete_project(
         )
 
 
-def project_members_add(
-    *project_name: str,
+def input_usernames(prompt: str) -> list[str]:
+    """Ask for one or more usernames, separated by commas
+
+    Args:
+        prompt (str): input prompt
+
+    Returns:
+        list[str]: usernames entered
+    """
+
+    return [
+        username.strip() for username in input(prompt).split(",") if username.strip()
+    ]
+
+
+def print_batch_results(
+    usernames: list[str],
+    results: list[dict] | int,
+    success: str,
     console: Console = console,
-    api: API = api,
 ) -> None:
-    """Add a single member to a project. Must be the owner, a moderator, or a server admin.
+    """Print the outcome of a batch of changes, one line per user
+
+    Args:
+        usernames (list[str]): user of each operation of the batch
+        results (list[dict] | int): results returned by api.project_batch
+        success (str): message for the operations that went through
+    """
+
+    if type(results) is int:
+        if results == 404:
+            console.print("\nCould not find project\n", style="danger")
+        elif results == 403:
+            console.print("\nYou are not a member of this project\n", style="danger")
+        else:
+            console.print(
+                f"\nCould not update the project (HTTP Error {results})\n",
+                style="danger",
+            )
+        return
+
+    # nothing is changed if one of the operations failed
+    failed = any(result["status"] != 200 for result in results)
+
+    console.print()
+    for username, result in zip(usernames, results):
+        if result["status"] == 200 and failed:
+            console.print(
+                f"{username}: not {success}, the other changes failed", style="warning"
+            )
+        elif result["status"] == 200:
+            console.print(f"{username}: {success}", style="success")
+        else:
+            console.print(
+                f"{username}: {result['detail']} (HTTP Error {result['status']})",
+                style="danger",
+            )
+    console.print()
+
+
+def project_members_add(
+    *project_name: str, console: Console = console, api: API = api
+) -> None:
+    """Add members to a project. Must be the owner, a moderator, or a server admin.
 
     Raises:
         NotLoggedIn: invalid token
@@ -324,34 +393,29 @@ def project_members_add(
         raise NotLoggedIn
 
     # input
-    username = str(input("Username of user to add: "))
-    if username == "":
+    usernames = input_usernames("Usernames of users to add (separated by commas): ")
+    if not usernames:
         console.print("\nYou must enter a username of someone to add\n", style="danger")
         return
 
-    # api call
-    try:
-        rc = api.project_add_member(token, project_name, username)
-    except NotAdmin:
-        console.print(
-            "You must be the owner, a moderator, or an admin to add a user to this project!\n",
-            style="danger",
-        )
-        return
+    # api call, all users in a single request
+    results = api.project_batch(
+        token,
+        project_name,
+        [{"op": "add_member", "username": username} for username in usernames],
+    )
 
-    # handle response
-    if rc == 200:
-        console.print("\nUser added successfully to project\n", style="success")
-    else:
-        console.print(
-            f"\nUser could not be added to the project (HTTP Error {rc})\n",
-            style="danger",
-        )
+    print_batch_results(usernames, results, "added to the project", console=console)
 
 
 def project_members_remove(
     *project_name: str, console: Console = console, api: API = api
 ) -> None:
+    """Remove members from a project. Must be the owner, a moderator, or a server admin.
+
+    Raises:
+        NotLoggedIn: invalid token
+    """
 
     # join project name into a single string
     project_name = " ".join(project_name)
@@ -362,33 +426,21 @@ def project_members_remove(
         raise NotLoggedIn
 
     # input
-    username = str(input("Username of user to remove: "))
-    if username == "":
+    usernames = input_usernames("Usernames of users to remove (separated by commas): ")
+    if not usernames:
         console.print(
             "\nYou must enter a username of someone to remove\n", style="danger"
         )
         return
 
-    # api call
-    try:
-        rc = api.project_remove_member(token, project_name, username)
-    except NotAdmin:
-        console.print(
-            "You must be the owner, a moderator, or an admin to remove a user from this project!\n",
-            style="danger",
-        )
-        return
+    # api call, all users in a single request
+    results = api.project_batch(
+        token,
+        project_name,
+        [{"op": "remove_member", "username": username} for username in usernames],
+    )
 
-    # handle response
-    if rc == 200:
-        console.print("\nUser removed successfully from project\n", style="success")
-    elif rc == 404:
-        console.print("\nUser is not part of the project\n", style="warning")
-    else:
-        console.print(
-            f"\nUser could not be removed from the project (HTTP Error {rc})\n",
-            style="danger",
-        )
+    print_batch_results(usernames, results, "removed from the project", console=console)
 
 
 def project_members(function: str, *args, console: Console = console) -> None:
@@ -404,6 +456,11 @@ def project_members(function: str, *args, console: Console = console) -> None:
 def project_moderators_add(
     *project_name: str, console: Console = console, api: API = api
 ) -> None:
+    """Promote project members to moderators. Must be the owner or a server admin.
+
+    Raises:
+        NotLoggedIn: invalid token
+    """
 
     # join project name into a single string
     project_name = " ".join(project_name)
@@ -414,41 +471,33 @@ def project_moderators_add(
         raise NotLoggedIn
 
     # input
-    username = str(input("Username of member to promote: "))
-    if username == "":
+    usernames = input_usernames(
+        "Usernames of members to promote (separated by commas): "
+    )
+    if not usernames:
         console.print(
             "\nYou must enter a username of someone to promote\n", style="danger"
         )
         return
 
-    # api call
-    try:
-        rc = api.project_add_moderator(token, project_name, username)
-    except NotAdmin:
-        console.print(
-            "You must be the owner or an admin to add a moderator to this project!\n",
-            style="danger",
-        )
-        return
+    # api call, all users in a single request
+    results = api.project_batch(
+        token,
+        project_name,
+        [{"op": "add_moderator", "username": username} for username in usernames],
+    )
 
-    # handle response
-    if rc == 200:
-        console.print("\nUser promoted to moderator successfully\n", style="success")
-    elif rc == 404:
-        console.print(
-            "\nUser must be a member of the project before making them a moderator. Please add them to the project then try again\n",
-            style="warning",
-        )
-    else:
-        console.print(
-            f"\nUser could not be promoted (HTTP Error {rc})\n",
-            style="danger",
-        )
+    print_batch_results(usernames, results, "promoted to moderator", console=console)
 
 
 def project_moderators_remove(
     *project_name: str, console: Console = console, api: API = api
 ) -> None:
+    """Demote project moderators. Must be the owner or a server admin.
+
+    Raises:
+        NotLoggedIn: invalid token
+    """
 
     # join project name into a single string
     project_name = " ".join(project_name)
@@ -459,36 +508,23 @@ def project_moderators_remove(
         raise NotLoggedIn
 
     # input
-    username = str(input("Username of moderator to demote: "))
-    if username == "":
+    usernames = input_usernames(
+        "Usernames of moderators to demote (separated by commas): "
+    )
+    if not usernames:
         console.print(
             "\nYou must enter a username of someone to demote\n", style="danger"
         )
         return
 
-    # api call
-    try:
-        rc = api.project_remove_moderator(token, project_name, username)
-    except NotAdmin:
-        console.print(
-            "You must be the owner or an admin to remove a moderator from this project!\n",
-            style="danger",
-        )
-        return
+    # api call, all users in a single request
+    results = api.project_batch(
+        token,
+        project_name,
+        [{"op": "remove_moderator", "username": username} for username in usernames],
+    )
 
-    # handle response
-    if rc == 200:
-        console.print("\nUser demoted from moderator successfully\n", style="success")
-    elif rc == 404:
-        console.print(
-            "\nUser is not a moderator within this project\n",
-            style="warning",
-        )
-    else:
-        console.print(
-            f"\nUser could not be demoted (HTTP Error {rc})\n",
-            style="danger",
-        )
+    print_batch_results(usernames, results, "demoted from moderator", console=console)
 
 
 def project_moderators(function: str, *args) -> callable:
@@ -596,8 +632,13 @@ def project_tasks_edit(
         )
         return
 
-    task_index = [task.name for task in project.tasks].index(task_name)
-    task = project.tasks[task_index]
+    task = project.get_task(task_name)
+    if task is None:
+        console.print(
+            f"\nThere is no task with that name within '{project_name}'\n",
+            style="danger",
+        )
+        return
 
     # more input
     task_description = str(input(f"\nTask Description [{task.description}]: "))
@@ -631,6 +672,11 @@ def project_tasks_edit(
 
     if rc == 200:
         console.print("\nTask updated successfully\n", style="success")
+    elif rc == 412:
+        console.print(
+            "\nSomeone else changed the project in the meantime, please try again\n",
+            style="danger",
+        )
     elif rc == 404:
         console.print("\nTask not found\n", style="danger")
     else:
@@ -675,6 +721,11 @@ def project_tasks_delete(
 def project_tasks_members_add(
     *project_name: str, console: Console = console, api: API = api
 ) -> None:
+    """Add members of the project to a task. Must be the owner, a moderator, or a server admin.
+
+    Raises:
+        NotLoggedIn: invalid token
+    """
 
     # check token
     token = get_token()
@@ -692,38 +743,34 @@ def project_tasks_members_add(
         )
         return
 
-    username = str(input("\nEnter username of user to add: "))
-    if username == "":
+    usernames = input_usernames(
+        "\nEnter usernames of users to add (separated by commas): "
+    )
+    if not usernames:
         console.print("\nYou must enter a user to add to the task\n", style="danger")
         return
 
-    # api call
-    try:
-        rc = api.project_task_post_member(token, project_name, task_name, username)
-    except NotAdmin:
-        console.print(
-            "\nYou must be the owner, a moderator, or an admin to add users to tasks"
-        )
-        return
+    # api call, all users in a single request
+    results = api.project_batch(
+        token,
+        project_name,
+        [
+            {"op": "add_task_member", "task_name": task_name, "username": username}
+            for username in usernames
+        ],
+    )
 
-    if rc == 200:
-        console.print("\nUser added to the task successfully\n", style="success")
-    elif rc == 400:
-        console.print(
-            "\nUser is not part of the project. Add them as a member of the project first!\n",
-            style="danger",
-        )
-    elif rc == 404:
-        console.print("\nTask not found\n", style="danger")
-    else:
-        console.print(
-            f"\nUser could not be added to task (HTTP Error {rc})\n", style="danger"
-        )
+    print_batch_results(usernames, results, "added to the task", console=console)
 
 
 def project_tasks_members_remove(
     *project_name: str, console: Console = console, api: API = api
 ) -> None:
+    """Remove members from a task. Must be the owner, a moderator, or a server admin.
+
+    Raises:
+        NotLoggedIn: invalid token
+    """
 
     # check token
     token = get_token()
@@ -741,49 +788,26 @@ def project_tasks_members_remove(
         )
         return
 
-    username = str(input("\nEnter username of user to remove: "))
-    if username == "":
+    usernames = input_usernames(
+        "\nEnter usernames of users to remove (separated by commas): "
+    )
+    if not usernames:
         console.print(
             "\nYou must enter a user to remove from the task\n", style="danger"
         )
         return
 
-    # api call
-    try:
-        response = api.project_task_delete_member(
-            token, project_name, task_name, username
-        )
-    except NotAdmin:
-        console.print(
-            "\nYou must be the owner, a moderator, or an admin to remove users from tasks"
-        )
-        return
-
-    # new method to handle api responses
-    match response.status_code:
-        case 200:
-            console.print(
-                "\nUser removed from the task successfully\n", style="success"
-            )
-        case _:
-            console.print(
-                f"\nHTTP Error {response.status_code}: {response.json()['detail']}\n",
-                style="danger",
-            )
+    # api call, all users in a single request
+    results = api.project_batch(
+        token,
+        project_name,
+        [
+            {"op": "remove_task_member", "task_name": task_name, "username": username}
+            for username in usernames
+        ],
+    )
 
-    # if rc == 200:
-    #     console.print("\nUser removed from the task successfully\n", style="success")
-    # elif rc == 400:
-    #     console.print(
-    #         "\nUser is not part of the task\n",
-    #         style="danger",
-    #     )
-    # elif rc == 404:
-    #     console.print("\nTask not found\n", style="danger")
-    # else:
-    #     console.print(
-    #         f"\nUser could not be removed from task (HTTP Error {rc})\n", style="danger"
-    #     )
+    print_batch_results(usernames, results, "removed from the task", console=console)
 
 
 def project_tasks_progress(
@@ -816,15 +840,13 @@ def project_tasks_progress(
         return
 
     # get task from project
-    try:
-        task_index = [task.name for task in project.tasks].index(task_name)
-    except ValueError:
+    task = project.get_task(task_name)
+    if task is None:
         console.print(
             f"\nThere is no task with that name within '{project_name}'\n",
             style="danger",
         )
         return
-    task = project.tasks[task_index]
 
     # more input
     if type(task) is Milestone_Task:
@@ -860,6 +882,11 @@ def project_tasks_progress(
     match response.status_code:
         case 200:
             console.print("\nProgress updated successfully\n", style="success")
+        case 412:
+            console.print(
+                "\nSomeone else changed the project in the meantime, please try again\n",
+                style="danger",
+            )
         case _:
             console.print(
                 f"\nCould not update task progress (HTTP Error {response.status_code}: {response.json()['detail']})",
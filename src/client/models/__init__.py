@@ -1,3 +1,4 @@
 from .user import User
+from .username_set import Username_Set
 from .task import Task, Discrete_Task, Milestone_Task
 from .project import Project
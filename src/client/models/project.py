@@ -1,9 +1,10 @@
-from pydantic import BaseModel, WithJsonSchema
+from pydantic import BaseModel, Field, WithJsonSchema, PrivateAttr
 from typing import List, Annotated, Union
 from bson import ObjectId
 
 from .task import Task, Milestone_Task, Discrete_Task
 from .user import User
+from .username_set import Username_Set
 from utils import replace
 
 # ! Circular import, used only for type hinting
@@ -22,7 +23,8 @@ class Project(BaseModel):
     #     Union[List[ObjectId] | None], WithJsonSchema({"type": "string"})
     # ] = []  # list of people allowed to modify things
 
-    moderators: List[str] | None = []  # list of people allowed to modify things
+    # people allowed to modify things
+    moderators: Username_Set | None = Field(default_factory=Username_Set)
 
     name: str  # unique
     description: str | None = None
@@ -30,23 +32,137 @@ class Project(BaseModel):
 
     # members: List[ObjectId | str] | None = []  # user id or username
 
-    members: List[str] | None = []  # usernames of members
+    # usernames of members
+    members: Username_Set | None = Field(default_factory=Username_Set)
+
+    # task name -> position in the task list (see _task_position), and the
+    # list it was built from
+    _task_index: dict[str, int] | None = PrivateAttr(None)
+    _indexed_tasks: list | None = PrivateAttr(None)
 
     # allow ObjectId
     model_config = {"arbitrary_types_allowed": True}
 
     # task related methods
+    def _task_position(self, task_name: str) -> int | None:
+        """Position of a task in the task list, from the name index. The index
+        is built on first use and kept up to date by the task methods below.
+        Tasks added or removed on the list directly change its length (or the
+        list itself), which rebuilds the index, and a position is checked
+        before it is returned. A task put in the place of one with another
+        name has to go through replace_task to be found by its own name
+
+        Args:
+            task_name (str): name of the task
+
+        Returns:
+            int | None: position, None if there is no such task
+        """
+
+        if self.tasks is None:
+            return None
+
+        index = self._task_index
+        if (
+            index is None
+            or self._indexed_tasks is not self.tasks
+            or len(index) != len(self.tasks)
+        ):
+            index = self._build_task_index()
+
+        position = index.get(task_name)
+        if position is not None and self.tasks[position].name != task_name:
+            # a task was replaced on the list directly
+            position = self._build_task_index().get(task_name)
+
+        return position
+
+    def _build_task_index(self) -> dict[str, int]:
+        index = {}
+        for position, task in enumerate(self.tasks):
+            index.setdefault(task.name, position)  # first one, like list.index
+
+        self._task_index = index
+        self._indexed_tasks = self.tasks
+        return index
+
+    def get_task(self, task_name: str) -> Task | None:
+        """Task by name
+
+        Args:
+            task_name (str): name of the task
+
+        Returns:
+            Task | None: the task, None if there is no such task
+        """
+
+        position = self._task_position(task_name)
+        if position is None:
+            return None
+        return self.tasks[position]
+
+    def has_task(self, task_name: str) -> bool:
+        """Check if the project has a task with this name"""
+
+        return self._task_position(task_name) is not None
+
+    def replace_task(self, task_name: str, task: Task) -> bool:
+        """Put a task in the place of another one (e.g. its updated version)
+
+        Args:
+            task_name (str): name of the task to replace
+            task (Task): new task
+
+        Returns:
+            bool: False if there is no such task
+        """
+
+        position = self._task_position(task_name)
+        if position is None:
+            return False
+
+        self.tasks[position] = task
+        if task.name != task_name:
+            del self._task_index[task_name]
+            self._task_index[task.name] = position
+        return True
+
+    def pop_task(self, task_name: str) -> Task | None:
+        """Take a task out of the project. The tasks after it move up one
+        place, so their positions in the index are moved with them
+
+        Args:
+            task_name (str): name of the task
+
+        Returns:
+            Task | None: the removed task, None if there is no such task
+        """
+
+        position = self._task_position(task_name)
+        if position is None:
+            return None
+
+        task = self.tasks.pop(position)
+        del self._task_index[task_name]
+        for moved in self.tasks[position:]:
+            if moved.name in self._task_index:
+                self._task_index[moved.name] -= 1
+        return task
+
     def add_task(self, task: Task) -> bool:
-        """Add a single task to the project (could get messy if I tried to
-        accomodate for multiple tasks at once, so I will do it like this for
-        now)"""
+        """Add a single task to the project, unless there is a task with the
+        same name already
+
+        Returns:
+            bool: False if the name is taken
+        """
 
-        # check if there is a task with that name already, then add it
-        if task in self.tasks:
+        if self.has_task(task.name):
             return False
-        else:
-            self.tasks.append(task)
-            return True
+
+        self.tasks.append(task)
+        self._task_index[task.name] = len(self.tasks) - 1
+        return True
 
     def remove_task(self, *tasks: Task) -> bool:
         """Remove one or more tasks from the project
@@ -59,16 +175,39 @@ class Project(BaseModel):
         """
         not_found: bool = False
         for task in tasks:
-            for existing_task in self.tasks:
-                if task == existing_task:
-                    self.tasks.remove(task)
-                    continue
+            if self.pop_task(task.name) is None:
                 not_found = True
         if not_found:
             return False
         return True
 
     # member related methods
+    def role_of(self, username: str, task_name: str | None = None) -> str | None:
+        """Role of a user in the project, from the most to the least
+        privileged: "owner", "moderator", "task member" (of the given task)
+        or "member". Every check is a set or index lookup
+
+        Args:
+            username (str): username of the user
+            task_name (str | None, optional): task to check the membership
+            of. Defaults to None.
+
+        Returns:
+            str | None: role, None if the user is not part of the project
+        """
+
+        if username == self.owner:
+            return "owner"
+        if username in self.moderators:
+            return "moderator"
+        if task_name is not None:
+            task = self.get_task(task_name)
+            if task is not None and username in task.members:
+                return "task member"
+        if username in self.members:
+            return "member"
+        return None
+
     def add_member(self, *member_names: str) -> bool:
         """Add members to the project"""
 
@@ -77,7 +216,7 @@ class Project(BaseModel):
             if member in self.members:
                 duplicates = True
                 continue
-            self.members.append(member)
+            self.members.add(member)
         # if everything went well, return true. if some users could not be
         # added, return false
         if duplicates:
@@ -113,7 +252,7 @@ class Project(BaseModel):
             if moderator in self.moderators:
                 duplicate = True
                 continue
-            self.moderators.append(moderator)
+            self.moderators.add(moderator)
 
         # if there was a duplicate, return false to show something happened
         if duplicate:
@@ -1,9 +1,10 @@
 from __future__ import annotations
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Annotated
 from bson import ObjectId
 
 from .user import User
+from .username_set import Username_Set
 
 
 # "abstract" Task class
@@ -12,7 +13,7 @@ class Task(BaseModel):
 
     name: str  # unique within project
     description: str | None = None
-    members: List[str] | None = []  # username
+    members: Username_Set | None = Field(default_factory=Username_Set)  # username
 
     def __eq__(self, other: Task) -> bool:
         return self.name == other.name
@@ -32,7 +33,7 @@ class Task(BaseModel):
             if member in self.members:
                 duplicates = True
                 continue
-            self.members.append(member)
+            self.members.add(member)
 
         # if everything went well, return true. if some users could not be added, return false
         if duplicates:
@@ -12,6 +12,7 @@ from .utils import (
     pop_update_cache,
     read_update_cache,
     wipe_update_cache,
+    apply_changes,
 )
 
 from .exceptions import NotAdmin, NotLoggedIn
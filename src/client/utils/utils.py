@@ -199,3 +199,53 @@ def pop_update_cache(updating: str) -> None:
             fp.write("\n".join(cache))
         else:
             fp.write("")
+
+
+def apply_changes(project: dict, changes: list[dict]) -> dict:
+    """Apply the changes of a project (from /projects/{name}/changes) to a copy
+    of it. Changes are {"op": "set" | "add" | "remove", "path", "value"}, where
+    the path is a project field, or "tasks", a task name and optionally one of
+    the task's fields
+
+    Args:
+        project (dict): copy of the project, changed in place
+        changes (list[dict]): changes to apply, in order
+
+    Raises:
+        KeyError: a change does not fit the copy (e.g. an unknown task)
+
+    Returns:
+        dict: the changed project
+    """
+
+    for change in changes:
+        op, path, value = change["op"], change["path"], change.get("value")
+
+        target, field = project, path[0]
+        if path[0] == "tasks" and len(path) > 1:
+            # the task, by name
+            task = next(
+                (task for task in project["tasks"] if task["name"] == path[1]), None
+            )
+            if task is None:
+                raise KeyError(path[1])
+
+            if len(path) == 2:
+                if op == "set":
+                    replace(project["tasks"], task, value)
+                else:
+                    project["tasks"].remove(task)
+                continue
+
+            target, field = task, path[2]
+
+        if op == "set":
+            target[field] = value
+        elif op == "add":
+            # members and moderators are sets, tasks have unique names
+            if value not in target[field]:
+                target[field].append(value)
+        elif value in target[field]:
+            target[field].remove(value)
+
+    return project
@@ -0,0 +1,87 @@
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+import atexit
+import datetime
+import json
+import logging
+import os
+
+
+class DailyFileHandler(logging.FileHandler):
+    """File handler writing to one file per day, named after the date
+    (e.g. 2024-02-20.log). It switches files at midnight, when the first
+    record of the new day comes in"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.date = datetime.date.today()
+        super().__init__(self._path(self.date), delay=True)
+
+    def _path(self, date: datetime.date) -> str:
+        return os.path.join(self.directory, f"{date}.log")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        today = datetime.date.today()
+        if today != self.date:
+            # reopened on the next write
+            self.close()
+            self.date = today
+            self.baseFilename = os.path.abspath(self._path(today))
+
+        super().emit(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats access log records as json lines"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            **getattr(record, "access", {"message": record.getMessage()}),
+        }
+
+        return json.dumps(entry)
+
+
+def setup_access_log(
+    directory: str, name: str = "termsync.access"
+) -> tuple[logging.Logger, QueueListener]:
+    """Create the access logger. Requests only put their records on a queue,
+    a background thread formats them and writes them to the daily log file,
+    so the event loop never waits on the disk
+
+    Args:
+        directory (str): folder to keep the log files in
+        name (str, optional): name of the logger. Defaults to "termsync.access".
+
+    Returns:
+        tuple[logging.Logger, QueueListener]: logger for the middleware, and
+        the listener thread writing its records (already started)
+    """
+
+    queue = SimpleQueue()
+
+    file_handler = DailyFileHandler(directory)
+    file_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(queue, file_handler)
+    listener.start()
+
+    # write what is left in the queue on exit
+    atexit.register(stop_access_log, listener)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.handlers = [QueueHandler(queue)]
+    logger.propagate = False  # keep it out of uvicorn's logs
+
+    return logger, listener
+
+
+def stop_access_log(listener: QueueListener) -> None:
+    """Write the records left in the queue, then stop the listener thread.
+    Does nothing if it is already stopped"""
+
+    if listener._thread is not None:
+        listener.stop()
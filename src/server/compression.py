@@ -0,0 +1,240 @@
+from starlette.datastructures import Headers, MutableHeaders
+from anyio.to_thread import run_sync
+import brotli
+import os
+import re
+import zlib
+
+# responses smaller than this (bytes) are sent as they are, compressing them
+# costs more time than it saves on the wire
+try:
+    COMPRESSION_MIN_SIZE = int(os.environ["COMPRESSION_MIN_SIZE"])
+except KeyError:
+    COMPRESSION_MIN_SIZE = 1024
+
+# bodies from this size (bytes) are compressed on a worker thread, to keep the
+# event loop free (zlib and brotli release the GIL while they work)
+THREAD_MIN_SIZE = 64 * 1024
+
+# encodings the server can send, preferred first when the client weighs them
+# the same
+ENCODINGS = ("br", "gzip")
+
+# encoding suffix of the ETags in a request's If-Match or If-None-Match header
+ETAG_SUFFIX = re.compile(r'-(?:{})"'.format("|".join(ENCODINGS)))
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Pick the content encoding of a response from the request's
+    Accept-Encoding header (e.g. "gzip, deflate, br" or "br;q=0.5, gzip")
+
+    Args:
+        accept_encoding (str): Accept-Encoding header of the request
+
+    Returns:
+        str | None: "br", "gzip", or None to send the response as it is
+    """
+
+    weights = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+
+    return best
+
+
+def encode_etag(etag: str, encoding: str) -> str:
+    """ETag of the compressed representation of a response (e.g. "abc" becomes
+    "abc-br"). The compressed and identity bodies are different
+    representations, so they can't share a strong ETag (RFC 9110 8.8.3)
+
+    Args:
+        etag (str): ETag set by the endpoint
+        encoding (str): content encoding of the body
+
+    Returns:
+        str: ETag of the encoded body
+    """
+
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def decode_etags(header: str) -> str:
+    """Take the encoding suffixes off the ETags of an If-Match or If-None-Match
+    header, the endpoints compare them with the ETag of the resource
+
+    Args:
+        header (str): If-Match or If-None-Match header of the request
+
+    Returns:
+        str: header with the ETags the endpoints set
+    """
+
+    return ETAG_SUFFIX.sub('"', header)
+
+
+class Compressor:
+    """Incremental gzip or brotli compressor. Every chunk is flushed, so a
+    streamed response still reaches the client one chunk at a time"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 31: deflate with a gzip header and trailer
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with brotli or gzip, whichever
+    the client prefers (Accept-Encoding). Bodies under the minimum size,
+    responses that are already encoded and server-sent event streams (kept
+    as they are so proxies pass every event through) are left alone"""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+
+        # the endpoints see the ETags they set, whichever encoding the client's
+        # copy was sent in (in place, the outer middlewares read the scope back)
+        if_none_match = request_headers.get("if-none-match")
+        scope["headers"] = [
+            (
+                (name, decode_etags(value.decode("latin-1")).encode("latin-1"))
+                if name in (b"if-match", b"if-none-match")
+                else (name, value)
+            )
+            for name, value in scope["headers"]
+        ]
+
+        start = None  # response start, held until the first body chunk
+        compressor = None  # None while sending the response as it is
+
+        async def send_wrapper(message) -> None:
+            nonlocal start, compressor
+
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start is not None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                if "content-encoding" in headers:
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+
+                # the body depends on Accept-Encoding, whether it is compressed
+                # this time or not, caches must keep the representations apart
+                headers.add_vary_header("Accept-Encoding")
+                if (
+                    encoding is None
+                    or headers.get("content-type", "").startswith("text/event-stream")
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    if start["status"] == 304 and "etag" in headers:
+                        # confirm the copy the client has, in its encoding
+                        headers["etag"] = self._cached_etag(
+                            headers["etag"], if_none_match
+                        )
+                    await send({**start, "headers": headers.raw})
+                    start = None
+                    await send(message)
+                    return
+
+                compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["content-encoding"] = encoding
+                if "etag" in headers:
+                    headers["etag"] = encode_etag(headers["etag"], encoding)
+                del headers["content-length"]
+                if more_body:
+                    body = compressor.compress(body)
+                else:
+                    # whole body at once, its compressed length is known
+                    if len(body) >= THREAD_MIN_SIZE:
+                        body = await run_sync(compressor.finish, body)
+                    else:
+                        body = compressor.finish(body)
+                    headers["content-length"] = str(len(body))
+
+                await send({**start, "headers": headers.raw})
+                start = None
+                await send({**message, "body": body})
+                return
+
+            if compressor is None:
+                await send(message)
+                return
+
+            body = compressor.compress(body) if more_body else compressor.finish(body)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _cached_etag(etag: str, if_none_match: str | None) -> str:
+        # the 304 carries the ETag of the representation the client has, which
+        # is the compressed one if it sent that one's ETag
+        if if_none_match is None:
+            return etag
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        for encoding in ENCODINGS:
+            if encode_etag(etag, encoding).removeprefix("W/") in tags:
+                return encode_etag(etag, encoding)
+        return etag
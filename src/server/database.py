@@ -1,12 +1,38 @@
 # global imports
-from pymongo import MongoClient, cursor
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCursor,
+    AsyncIOMotorCommandCursor,
+)
+import motor.frameworks.asyncio as motor_asyncio
+from pymongo import IndexModel, UpdateOne, ReturnDocument, ASCENDING
+from pymongo.errors import PyMongoError, OperationFailure, DuplicateKeyError
+from redis.asyncio import Redis
 from uuid import UUID
 from bson import ObjectId
-from typing import Union, List
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, Union, List
+from datetime import datetime, timezone
+import asyncio
+import logging
 import os
+import re
 
 # relative imports
-from .models import Token, Token_DB, User, User_DB, Project
+from .models import (
+    Token,
+    Token_DB,
+    User,
+    User_DB,
+    Project,
+    Task,
+    Auth_Context,
+    Username_Set,
+)
+from .session_cache import SessionCache
+from .events import Event, EventBus, MemoryEventBus, RedisEventBus
+from .metrics import MongoCommandListener, instrument_executor, metrics
+from .db_calls import db_call_listener
 
 try:
     DB_HOST = os.environ["PYMONGO_DATABASE_HOST"]
@@ -15,16 +41,333 @@ except KeyError:
     DB_HOST = "127.0.0.1"
     DB_PORT = 27017
 
+# session cache configuration
+try:
+    SESSION_CACHE_ENABLED = os.environ["SESSION_CACHE_ENABLED"].lower() != "false"
+except KeyError:
+    SESSION_CACHE_ENABLED = True
+
+try:
+    SESSION_CACHE_SIZE = int(os.environ["SESSION_CACHE_SIZE"])  # sessions
+except KeyError:
+    SESSION_CACHE_SIZE = 10000
+
+try:
+    SESSION_CACHE_TTL = float(os.environ["SESSION_CACHE_TTL"])  # seconds
+except KeyError:
+    SESSION_CACHE_TTL = 60
+
+# notify project members of changes without making the request wait for it
+try:
+    NOTIFY_IN_BACKGROUND = os.environ["NOTIFY_IN_BACKGROUND"].lower() == "true"
+except KeyError:
+    NOTIFY_IN_BACKGROUND = False
+
+# event bus backend: "memory" reaches this process only, "redis" every process
+# connected to the same redis server
+try:
+    EVENT_BUS = os.environ["EVENT_BUS"].lower()
+except KeyError:
+    EVENT_BUS = "memory"
+
+try:
+    REDIS_URL = os.environ["REDIS_URL"]
+except KeyError:
+    REDIS_URL = "redis://127.0.0.1:6379"
+
+# how many times a commutative project write (e.g. adding a member) is tried
+# again when another write to the project got in first
+try:
+    WRITE_RETRIES = int(os.environ["WRITE_RETRIES"])
+except KeyError:
+    WRITE_RETRIES = 5
+
+# build models from database documents without validating them again, the
+# server validated everything it wrote (documents written by hand or by an
+# older version may not fit the models, keep it off for those)
+try:
+    TRUSTED_READS = os.environ["TRUSTED_READS"].lower() == "true"
+except KeyError:
+    TRUSTED_READS = False
+
+# how long (seconds) the project change log keeps changes, clients further
+# behind get a snapshot of the project instead
+try:
+    CHANGE_LOG_TTL = int(os.environ["CHANGE_LOG_TTL"])
+except KeyError:
+    CHANGE_LOG_TTL = 86400
+
+# most revisions sent as changes, a snapshot is cheaper past that
+try:
+    CHANGE_LOG_MAX = int(os.environ["CHANGE_LOG_MAX"])
+except KeyError:
+    CHANGE_LOG_MAX = 100
+
+# where the project list gets its progress from: "counters" reads the counters
+# stored on the project documents, "aggregate" computes them from the tasks
+try:
+    PROJECT_PROGRESS_SOURCE = os.environ["PROJECT_PROGRESS_SOURCE"].lower()
+except KeyError:
+    PROJECT_PROGRESS_SOURCE = "counters"
+
+# [done, total] of a task, same as Task.progress: pydantic parses a task with a
+# boolean "completed" as a Discrete_Task, anything else as a Milestone_Task
+TASK_PROGRESS = {
+    "$cond": [
+        {"$eq": [{"$type": "$$this.completed"}, "bool"]},
+        [{"$cond": ["$$this.completed", 1, 0]}, 1],
+        [
+            {"$ifNull": ["$$this.completed", 0]},
+            {"$ifNull": ["$$this.milestones", 0]},
+        ],
+    ]
+}
+
+# sums TASK_PROGRESS over the tasks of every project the user is a member of,
+# returns the same {"name", "done", "total"} documents as the stored counters
+PROJECT_PROGRESS_PIPELINE = [
+    {
+        "$lookup": {
+            "from": "tasks",
+            "localField": "name",
+            "foreignField": "project",
+            "as": "tasks",
+        }
+    },
+    {"$project": {"_id": 0, "name": 1, "tasks": {"$ifNull": ["$tasks", []]}}},
+    {
+        "$project": {
+            "name": 1,
+            "progress": {
+                "$reduce": {
+                    "input": "$tasks",
+                    "initialValue": [0, 0],
+                    "in": {
+                        "$let": {
+                            "vars": {"task": TASK_PROGRESS},
+                            "in": [
+                                {
+                                    "$add": [
+                                        {"$arrayElemAt": ["$$value", 0]},
+                                        {"$arrayElemAt": ["$$task", 0]},
+                                    ]
+                                },
+                                {
+                                    "$add": [
+                                        {"$arrayElemAt": ["$$value", 1]},
+                                        {"$arrayElemAt": ["$$task", 1]},
+                                    ]
+                                },
+                            ],
+                        }
+                    },
+                }
+            },
+        }
+    },
+    {
+        "$project": {
+            "name": 1,
+            "done": {"$arrayElemAt": ["$progress", 0]},
+            "total": {"$arrayElemAt": ["$progress", 1]},
+        }
+    },
+]
+
+# case insensitive string comparison (strength 2 ignores case, not accents)
+USERNAME_COLLATION = {"locale": "en", "strength": 2}
+
+# indexes needed by the queries below, created at startup by ensure_indexes
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        # case insensitive, used by the prefix part of search_users
+        IndexModel(
+            [("username", ASCENDING)], name="username_ci", collation=USERNAME_COLLATION
+        ),
+    ],
+    # username trigrams, used by the substring part of search_users
+    "user_search": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        # multikey, the candidates of a search in the order they are returned
+        IndexModel([("trigrams", ASCENDING), ("username", ASCENDING)]),
+    ],
+    "projects": [
+        IndexModel([("name", ASCENDING)], unique=True),
+        # multikey, used by get_all_project (filter on members, sorted by name)
+        IndexModel([("members", ASCENDING), ("name", ASCENDING)]),
+    ],
+    # tasks of the projects, each in its own document (see _load_tasks)
+    "tasks": [
+        IndexModel([("project", ASCENDING), ("name", ASCENDING)], unique=True),
+        # a project's tasks in the order they were added, for pages of them
+        IndexModel([("project", ASCENDING), ("_id", ASCENDING)]),
+        # multikey, the tasks of a project a user is a member of
+        IndexModel(
+            [("project", ASCENDING), ("members", ASCENDING), ("_id", ASCENDING)]
+        ),
+    ],
+    # the changes made by each revision of a project, for delta sync
+    "project_changes": [
+        IndexModel([("project_id", ASCENDING), ("revision", ASCENDING)], unique=True),
+        # TTL index, this is how the log is compacted
+        IndexModel([("time", ASCENDING)], expireAfterSeconds=CHANGE_LOG_TTL),
+    ],
+    "sessions": [
+        IndexModel([("token", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+        # TTL index, mongo deletes sessions once their expiration date passes
+        IndexModel([("expiration", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+logger = logging.getLogger(__name__)
+
+
+class RevisionConflict(Exception):
+    """A project write was based on a revision of the project that is not
+    current anymore (another write got in first, or the client's copy sent in
+    If-Match is out of date). The API answers 412 Precondition Failed"""
+
+    def __init__(self, revision: int, etag: str) -> None:
+        super().__init__(f"Project has been modified (revision {revision})")
+        self.revision = revision  # current revision of the project
+        self.etag = etag  # current ETag of the project
+
+
+def load(model: type[BaseModel], document: dict) -> BaseModel:
+    """Build a model from a database document, validated unless reads are
+    trusted (TRUSTED_READS)
+
+    Args:
+        model (type[BaseModel]): model class
+        document (dict): database document
+
+    Returns:
+        BaseModel: model instance
+    """
+
+    if TRUSTED_READS:
+        if model is Project:
+            return Project.from_document(document)
+        return model.model_construct(**document)
+    return model(**document)
+
+
+# count the busy and queued threads of motor's thread pool for /metrics
+instrument_executor(motor_asyncio, metrics)
+
 
 class Database:
-    """Pymongo database interface class"""
+    """Asynchronous (motor) database interface class. Every method is a
+    coroutine, so the endpoints never block the event loop waiting on Mongo"""
 
     def __init__(self) -> None:
-        self.client = MongoClient(host=DB_HOST, port=DB_PORT)
+        self.client = AsyncIOMotorClient(
+            host=DB_HOST,
+            port=DB_PORT,
+            event_listeners=[MongoCommandListener(metrics), db_call_listener],
+        )
         self.db = self.client.termsync
+        self.session_cache = SessionCache(
+            maxsize=SESSION_CACHE_SIZE,
+            ttl=SESSION_CACHE_TTL,
+            enabled=SESSION_CACHE_ENABLED,
+        )
+
+        # member notifications running in the background
+        self.notify_in_background = NOTIFY_IN_BACKGROUND
+        self._background_tasks: set[asyncio.Task] = set()
+
+        # change notifications, the notification writer is the first subscriber
+        self.events: EventBus = (
+            RedisEventBus(Redis.from_url(REDIS_URL))
+            if EVENT_BUS == "redis"
+            else MemoryEventBus()
+        )
+        self.events.add_handler(self._write_notifications)
+
+    # INDEX METHODS
+    async def ensure_indexes(self) -> bool:
+        """Create the indexes in INDEXES. Indexes that already exist are left
+        alone, so this is safe to call again to check on them
+
+        Returns:
+            bool: True if every index is in place
+        """
+
+        rc = True
+        for collection, indexes in INDEXES.items():
+            try:
+                await self.db[collection].create_indexes(indexes)
+            except PyMongoError as e:
+                logger.error(f"Could not create indexes on {collection}: {e}")
+                rc = False
+
+        return rc
+
+    async def get_index_report(self) -> dict:
+        """Report the state of the indexes of every collection in INDEXES and
+        how many times each one was used since the mongod started
+
+        Returns:
+            dict: {collection: {"missing": [...], "indexes": {name: {...}}}}
+        """
+
+        report = {}
+        for collection, indexes in INDEXES.items():
+            info = await self.db[collection].index_information()
+
+            # usage statistics ($indexStats is not supported everywhere)
+            try:
+                stats = (
+                    await self.db[collection]
+                    .aggregate([{"$indexStats": {}}])
+                    .to_list(None)
+                )
+            except (OperationFailure, NotImplementedError):
+                stats = []
+            usage = {index["name"]: index["accesses"] for index in stats}
+
+            report[collection] = {
+                "missing": [
+                    index.document["name"]
+                    for index in indexes
+                    if index.document["name"] not in info
+                ],
+                "indexes": {
+                    name: {
+                        "key": dict(index["key"]),
+                        "unique": index.get("unique", False),
+                        "expireAfterSeconds": index.get("expireAfterSeconds"),
+                        "ops": usage[name]["ops"] if name in usage else None,
+                        "since": usage[name]["since"] if name in usage else None,
+                    }
+                    for name, index in info.items()
+                },
+            }
+
+        return report
+
+    # ETAG METHODS
+    @staticmethod
+    def etag(document: dict) -> str:
+        """Strong ETag of a user or project document. Every write to the parts
+        of the document the API returns increments its revision, and the id
+        tells apart a document deleted then created again under the same name
+        (starting over at revision 0)
+
+        Args:
+            document (dict): document, at least its _id and revision
+
+        Returns:
+            str: ETag header value
+        """
+
+        return f'"{document["_id"]}-{document.get("revision", 0)}"'
 
     # USER METHODS
-    def get_user(self, user: str | ObjectId) -> User:
+    async def get_user(self, user: str | ObjectId) -> User:
         """Method that gets user data from database by username or id
 
         Args:
@@ -35,15 +378,15 @@ class Database:
         """
 
         if type(user) is str:
-            query = self.db.users.find_one({"username": user})
+            query = await self.db.users.find_one({"username": user})
         if type(user) is ObjectId:
-            query = self.db.users.find_one({"_id": user})
+            query = await self.db.users.find_one({"_id": user})
 
         if query is None:
             return query
-        return User(**query)
+        return load(User, query)
 
-    def get_user_db(self, username: str | ObjectId) -> User_DB:
+    async def get_user_db(self, username: str | ObjectId) -> User_DB:
         """Method that returns all user info from database by username or id
 
         Args:
@@ -54,42 +397,244 @@ class Database:
         """
 
         if type(username) is str:
-            query = self.db.users.find_one({"username": username})
+            query = await self.db.users.find_one({"username": username})
         if type(username) is ObjectId:
-            query = self.db.users.find_one({"_id": username})
+            query = await self.db.users.find_one({"_id": username})
 
         if query is None:
             return query
 
-        return User_DB(**query)
+        return load(User_DB, query)
+
+    async def get_user_etag(self, username: str) -> str:
+        """ETag of a user's data, without loading it
 
-    def get_user_id(self, username: str) -> ObjectId:
+        Args:
+            username (str): username
 
-        query = self.db.users.find_one({"username": username})
+        Returns:
+            str: ETag, None if there is no such user
+        """
+
+        query = await self.db.users.find_one(
+            {"username": username}, {"_id": 1, "revision": 1}
+        )
         if query is None:
             return query
-        return query["_id"]
+        return self.etag(query)
+
+    async def get_user_with_etag(self, username: str) -> tuple[User, str] | None:
+        """User data together with its ETag, from the same read
+
+        Args:
+            username (str): username
+
+        Returns:
+            tuple[User, str] | None: user data and ETag, None if there is no
+            such user
+        """
+
+        query = await self.db.users.find_one({"username": username})
+        if query is None:
+            return query
+        return load(User, query), self.etag(query)
 
-    def search_users(self, username: str) -> list[User]:
-        """Method that searches the database for users that
-        somewhat match the username"
+    async def get_existing_usernames(self, usernames: list[str]) -> set[str]:
+        """Which of the usernames belong to a user, in a single query
 
         Args:
-            username (str): User username
+            usernames (list[str]): usernames to look up
 
         Returns:
-            list[User]: list of results
+            set[str]: the usernames that exist
         """
 
-        # query for name, case insensitive
+        if not usernames:
+            return set()
+
         query = self.db.users.find(
-            {"username": {"$regex": username, "$options": "i"}},
-            {"username": 1, "_id": 0},
+            {"username": {"$in": list(usernames)}}, {"_id": 0, "username": 1}
         )
+        return {user["username"] async for user in query}
 
-        return query
+    async def get_user_id(self, username: str) -> ObjectId:
+
+        query = await self.db.users.find_one({"username": username})
+        if query is None:
+            return query
+        return query["_id"]
+
+    @staticmethod
+    def _trigrams(text: str) -> list[str]:
+        """Lowercase trigrams (every 3 character substring) of a text"""
+
+        text = text.lower()
+        return sorted({a + b + c for a, b, c in zip(text, text[1:], text[2:])})
+
+    async def iter_search_users(
+        self, search: str, limit: int | None = None, after: dict | None = None
+    ) -> AsyncIterator[tuple[str, dict]]:
+        """Search users by username, case insensitive, streaming the results
+        straight from the database cursors. Usernames starting with the search
+        come first (on the case insensitive index), then the ones containing
+        it (on the trigram collection, or a scan of its username index for
+        searches under 3 characters), each in alphabetical order
+
+        Args:
+            search (str): text to search for
+            limit (int | None, optional): maximum number of results. Defaults
+            to all of them.
+            after (dict | None, optional): position of the last result of the
+            previous page, to get the next one. Defaults to the first page.
+
+        Yields:
+            tuple[str, dict]: username, and its position
+        """
+
+        after = after or {"phase": "prefix", "username": None}
+        count = 0
+
+        if after["phase"] == "prefix":
+            # range over the case insensitive index, U+FFFF sorts after every
+            # character so the range covers every username with the prefix
+            query = {"$gte": search, "$lt": search + "\uffff"}
+            if after["username"] is not None:
+                query["$gt"] = after["username"]
+
+            cursor = self.db.users.find(
+                {"username": query},
+                {"_id": 0, "username": 1},
+                collation=USERNAME_COLLATION,
+            ).sort("username", ASCENDING)
+            if limit is not None:
+                cursor = cursor.limit(limit)
+
+            async for user in cursor:
+                yield user["username"], {
+                    "phase": "prefix",
+                    "username": user["username"],
+                }
+                count += 1
+
+            if count == limit:
+                return
+
+            after = {"phase": "substring", "username": None}
+
+        # trigrams only narrow the search down, the matches are checked below.
+        # searches too short to have any scan the usernames in the index for
+        # the substring instead (an index scan, the collection is not read)
+        trigrams = self._trigrams(search)
+        if trigrams:
+            query = {"trigrams": {"$all": trigrams}}
+        else:
+            query = {"username": {"$regex": re.escape(search), "$options": "i"}}
+        if after["username"] is not None:
+            query.setdefault("username", {})["$gt"] = after["username"]
+
+        cursor = self.db.user_search.find(query, {"_id": 0, "username": 1}).sort(
+            "username", ASCENDING
+        )
+        try:
+            async for user in cursor:
+                username = user["username"].lower()
+                if search.lower() not in username or username.startswith(
+                    search.lower()
+                ):
+                    continue
+
+                yield user["username"], {
+                    "phase": "substring",
+                    "username": user["username"],
+                }
+                count += 1
+                if count == limit:
+                    return
+        finally:
+            await cursor.close()
+
+    async def search_users(
+        self, search: str, limit: int = 20, after: dict | None = None
+    ) -> tuple[list[str], dict | None]:
+        """Search users by username, a page at a time (see iter_search_users)
+
+        Args:
+            search (str): text to search for
+            limit (int, optional): maximum number of results. Defaults to 20.
+            after (dict | None, optional): position returned with the previous
+            page, to get the next one. Defaults to the first page.
+
+        Returns:
+            tuple[list[str], dict | None]: usernames, and the position of the
+            next page (None if this is the last one)
+        """
+
+        results = []
+        position = None
+        async for username, position in self.iter_search_users(search, limit, after):
+            results.append(username)
+
+        if len(results) < limit:
+            return results, None
 
-    def post_user(self, user_data: User_DB) -> list[bool, ObjectId]:
+        return results, position
+
+    async def _index_user_search(self, username: str) -> None:
+        """Add or refresh the username's trigrams in the search collection"""
+
+        await self.db.user_search.update_one(
+            {"username": username},
+            {"$set": {"trigrams": self._trigrams(username)}},
+            upsert=True,
+        )
+
+    async def index_user_search(self, only_missing: bool = False) -> int:
+        """Fill the trigram search collection from the users collection
+
+        Args:
+            only_missing (bool, optional): only users not in it yet (created
+            before it existed). Defaults to False.
+
+        Returns:
+            int: number of users indexed
+        """
+
+        pipeline = [{"$project": {"_id": 0, "username": 1}}]
+        if only_missing:
+            pipeline += [
+                {
+                    "$lookup": {
+                        "from": "user_search",
+                        "localField": "username",
+                        "foreignField": "username",
+                        "as": "search",
+                    }
+                },
+                {"$match": {"search": {"$size": 0}}},
+            ]
+
+        indexed = 0
+        batch = []
+        async for user in self.db.users.aggregate(pipeline):
+            batch.append(
+                UpdateOne(
+                    {"username": user["username"]},
+                    {"$set": {"trigrams": self._trigrams(user["username"])}},
+                    upsert=True,
+                )
+            )
+            if len(batch) == 500:
+                await self.db.user_search.bulk_write(batch, ordered=False)
+                indexed += len(batch)
+                batch = []
+
+        if batch:
+            await self.db.user_search.bulk_write(batch, ordered=False)
+            indexed += len(batch)
+
+        return indexed
+
+    async def post_user(self, user_data: User_DB) -> list[bool, ObjectId]:
         """Method that creates a user in the database
 
         Args:
@@ -99,14 +644,18 @@ class Database:
             Union[bool, ObjectId]: return code and the id of the newly inserted user
         """
 
-        request = self.db.users.insert_one(user_data.model_dump())
+        request = await self.db.users.insert_one(
+            {**user_data.model_dump(), "revision": 0}
+        )
 
         if request.acknowledged is False:
             return False, None
 
+        await self._index_user_search(user_data.username)
+
         return True, request.inserted_id
 
-    def update_user(
+    async def update_user(
         self,
         user_data: User,
         username: str,
@@ -121,13 +670,20 @@ class Database:
             bool: return code
         """
 
-        request = self.db.users.update_one(
-            {"username": username}, {"$set": user_data.model_dump()}
+        request = await self.db.users.update_one(
+            {"username": username},
+            {"$set": user_data.model_dump(), "$inc": {"revision": 1}},
         )
+        self.session_cache.invalidate_user(username)
+
+        # renamed
+        if request.modified_count > 0 and user_data.username != username:
+            await self.db.user_search.delete_one({"username": username})
+            await self._index_user_search(user_data.username)
 
         return request.acknowledged
 
-    def delete_user(self, username: str) -> bool:
+    async def delete_user(self, username: str) -> bool:
         """Delete user from the database
 
         Args:
@@ -136,11 +692,13 @@ class Database:
         Returns:
             bool: return code
         """
-        request = self.db.users.delete_one({"username": username})
+        request = await self.db.users.delete_one({"username": username})
+        self.session_cache.invalidate_user(username)
+        await self.db.user_search.delete_one({"username": username})
 
         return request.acknowledged
 
-    def make_admin(self, username: str) -> bool:
+    async def make_admin(self, username: str) -> bool:
         """Make a user an admin
 
         Args:
@@ -150,14 +708,15 @@ class Database:
             bool: return code
         """
 
-        request = self.db.users.update_one(
+        request = await self.db.users.update_one(
             {"username": username}, {"$set": {"power": "admin"}}
         )
+        self.session_cache.invalidate_user(username)
 
         return request.acknowledged
 
     # TOKEN METHODS
-    def get_token(self, token_uuid: UUID) -> Token_DB:
+    async def get_token(self, token_uuid: UUID) -> Token_DB:
         """Get token from database via UUID, needed when checking or deleting
         token
 
@@ -168,12 +727,76 @@ class Database:
             dict: Token_DB data
         """
 
-        query = self.db.sessions.find_one({"token": str(token_uuid)})
+        query = await self.db.sessions.find_one({"token": str(token_uuid)})
         if query is None:
             return query
-        return Token_DB(**query)
+        return load(Token_DB, query)
+
+    async def get_auth_context(self, token_uuid: UUID) -> Auth_Context:
+        """Get the session of a token together with its user in a single query
+        (a $lookup from sessions to users), needed to authenticate requests.
+        Results are kept in the session cache
+
+        Args:
+            token_uuid (UUID): token UUID
+
+        Returns:
+            Auth_Context: session, user and admin flag
+        """
 
-    def post_token(self, token: Token, user_id: ObjectId) -> bool:
+        auth = self.session_cache.get(str(token_uuid))
+        if auth is not None:
+            return auth
+
+        # not stored if the session or user is invalidated during the query
+        generation = self.session_cache.generation
+
+        query = await self.db.sessions.aggregate(
+            [
+                {"$match": {"token": str(token_uuid)}},
+                {"$limit": 1},
+                {
+                    "$lookup": {
+                        "from": "users",
+                        "localField": "user_id",
+                        "foreignField": "_id",
+                        "as": "user",
+                    }
+                },
+                {"$unwind": {"path": "$user", "preserveNullAndEmptyArrays": True}},
+                {
+                    "$project": {
+                        "_id": 0,
+                        "token": 1,
+                        "user_id": 1,
+                        "expiration": 1,
+                        "user.username": 1,
+                        "user.full_name": 1,
+                        "user.profile_picture": 1,
+                        "user.power": 1,
+                    }
+                },
+            ]
+        ).to_list(1)
+
+        if not query:
+            return None
+
+        session = query[0]
+        user = session.pop("user", None)
+        if not user:
+            return Auth_Context(token=load(Token_DB, session))
+
+        auth = Auth_Context(
+            token=load(Token_DB, session),
+            user=load(User, user),
+            admin=user.get("power") == "admin",
+        )
+        self.session_cache.set(str(token_uuid), auth, generation)
+
+        return auth
+
+    async def post_token(self, token: Token, user_id: ObjectId) -> bool:
         """Create session token, triggered when logging in
 
         Args:
@@ -188,17 +811,17 @@ class Database:
         token_db = token.convert(user_id)
 
         # insert Token_DB instance into database
-        request = self.db.sessions.insert_one(token_db.model_dump())
+        request = await self.db.sessions.insert_one(token_db.model_dump())
         return request.acknowledged
 
-    def get_token_by_user(self, user_id: ObjectId) -> Token:
-        query = self.db.sessions.find_one({"user_id": user_id})
+    async def get_token_by_user(self, user_id: ObjectId) -> Token:
+        query = await self.db.sessions.find_one({"user_id": user_id})
 
         if query is None:
             return query
         return Token(**query)
 
-    def delete_token(self, token_uuid: UUID) -> bool:
+    async def delete_token(self, token_uuid: UUID) -> bool:
         """Method that deletes session token if the user logs in again or if
         the token is expired
 
@@ -209,50 +832,1519 @@ class Database:
             bool: return code
         """
 
-        request = self.db.sessions.delete_one({"token": str(token_uuid)})
+        request = await self.db.sessions.delete_one({"token": str(token_uuid)})
+        self.session_cache.invalidate(str(token_uuid))
 
         return request.acknowledged
 
     # PROJECT METHODS
-    def get_all_project(self, username: str) -> cursor:
+    def get_all_project(
+        self,
+        username: str,
+        source: str | None = None,
+        after: str | None = None,
+        limit: int | None = None,
+    ) -> AsyncIOMotorCursor | AsyncIOMotorCommandCursor:
+        """Get the name and progress of every project the user is a member of,
+        ordered by name. Either way only names and progress leave the
+        database, the tasks are never loaded
 
-        request = self.db.projects.find({"members": {"$elemMatch": {"$eq": username}}})
+        Args:
+            username (str): username of the member
+            source (str | None, optional): "counters" to read the stored
+            counters, "aggregate" to compute the progress from the tasks.
+            Defaults to PROJECT_PROGRESS_SOURCE.
+            after (str | None, optional): only projects named after this one
+            (the last one of the previous page). Defaults to None.
+            limit (int | None, optional): maximum number of projects. Defaults
+            to all of them.
+
+        Returns:
+            AsyncIOMotorCursor | AsyncIOMotorCommandCursor: cursor over
+            {"name", "done", "total"} documents
+        """
+
+        query = {"members": {"$elemMatch": {"$eq": username}}}
+        if after is not None:
+            query["name"] = {"$gt": after}
+
+        if (source or PROJECT_PROGRESS_SOURCE) == "aggregate":
+            pipeline = [{"$match": query}, {"$sort": {"name": ASCENDING}}]
+            if limit is not None:
+                pipeline.append({"$limit": limit})
+            return self.db.projects.aggregate([*pipeline, *PROJECT_PROGRESS_PIPELINE])
+
+        request = self.db.projects.find(
+            query,
+            {"_id": 0, "name": 1, "done": 1, "total": 1},
+        ).sort("name", ASCENDING)
+        if limit is not None:
+            request = request.limit(limit)
 
         return request
 
-    def add_project(self, project: Project) -> bool:
+    async def add_project(self, project: Project) -> bool:
+
+        # the project is created with its tasks in its document, so it never
+        # shows up without them, and the insert claims the name
+        document = {
+            **project.model_dump(),
+            **self._progress_counters(project),
+            "revision": 0,
+        }
+        try:
+            request = await self.db.projects.insert_one(document)
+        except DuplicateKeyError:
+            return False
+
+        # only then clear the tasks a deleted project of the same name left
+        # behind, and move the tasks to the task collection
+        await self.db.tasks.delete_many(
+            {"project": project.name, "project_id": {"$ne": request.inserted_id}}
+        )
+        await self._migrate_project_tasks({**document, "_id": request.inserted_id})
 
-        request = self.db.projects.insert_one(project.model_dump())
+        await self.events.publish(Event(type="project.created", project=project.name))
 
         return request.acknowledged
 
-    def get_project(self, project_name: str) -> Project:
+    @staticmethod
+    def _load_project(document: dict, tasks: list[dict]) -> Project:
+        # the version and revision of each task are kept for its writes
+        versions, revisions = {}, {}
+        for task in tasks:
+            task.pop("project_id", None)
+            versions[task["name"]] = task.pop("version", None) or 0
+            revisions[task["name"]] = task.pop("revision", None) or 0
+
+        project = load(Project, {**document, "tasks": tasks})
+        project._document_id = document["_id"]
+        project._task_versions = versions
+        project._task_revisions = revisions
+        return project
+
+    async def _load_tasks(
+        self,
+        document: dict,
+        after: ObjectId | None = None,
+        limit: int | None = None,
+        member: str | None = None,
+        task_name: str | None = None,
+    ) -> list[dict]:
+        """Task documents of a project, in the order the tasks were added
+
+        Args:
+            document (dict): project document
+            after (ObjectId | None, optional): only tasks added after this one
+            (the last one of the previous page). Defaults to None.
+            limit (int | None, optional): maximum number of tasks. Defaults to
+            all of them.
+            member (str | None, optional): only tasks this user is a member
+            of. Defaults to None.
+            task_name (str | None, optional): only this task. Defaults to None.
+
+        Returns:
+            list[dict]: task documents, with their _id
+        """
+
+        # not the ones a deleted project of the same name left behind
+        query = {
+            "project": document["name"],
+            "project_id": {"$in": [document["_id"], None]},
+        }
+        if task_name is not None:
+            query["name"] = task_name
+        if member is not None:
+            query["members"] = member
+        if after is not None:
+            query["_id"] = {"$gt": after}
+
+        request = self.db.tasks.find(query, {"project": 0}).sort("_id", ASCENDING)
+        if limit is not None:
+            request = request.limit(limit)
+
+        return await request.to_list(None)
+
+    async def _read_project(self, document: dict, member: str | None = None) -> Project:
+        """Project of a project document, with all of its tasks. Nothing is
+        written: the tasks of a project not moved to the task collection yet
+        are read from its document (see migrate_tasks)
+
+        Args:
+            document (dict): project document
+            member (str | None, optional): only the tasks of this member.
+            Defaults to None.
+
+        Returns:
+            Project: project
+        """
+
+        if "tasks" in document:
+            tasks = [
+                task
+                for task in document["tasks"] or []
+                if member is None or member in task.get("members", [])
+            ]
+            return self._load_project(document, tasks)
+
+        return self._load_project(
+            document, await self._load_tasks(document, member=member)
+        )
+
+    def project_etag(self, project: Project) -> str:
+        """ETag of a project loaded from the database"""
+
+        return self.etag({"_id": project._document_id, "revision": project.revision})
+
+    def task_etag_matches(
+        self, if_match: str, project: Project, task_name: str
+    ) -> bool:
+        """Check an If-Match header sent with a write to a single task: the
+        client's copy of the project only has to be as recent as the last
+        write to that task, writes to the other tasks since do not matter
+
+        Args:
+            if_match (str): If-Match header of the request
+            project (Project): project, loaded with the task (see get_project)
+            task_name (str): name of the task
+
+        Returns:
+            bool: True if the client's copy of the task is current
+        """
+
+        if if_match.strip() == "*":
+            return True
+
+        task_revision = project._task_revisions.get(task_name, 0)
+        for tag in if_match.split(","):
+            document_id, _, revision = tag.strip().strip('"').rpartition("-")
+            if (
+                document_id == str(project._document_id)
+                and revision.isdigit()
+                and task_revision <= int(revision) <= project.revision
+            ):
+                return True
+
+        return False
+
+    async def get_project(
+        self, project_name: str, task_name: str | None = None
+    ) -> Project:
+        """Project to write to, with its tasks in the task collection (they
+        are moved there first if they are still in its document)
+
+        Args:
+            project_name (str): name of the project
+            task_name (str | None, optional): only load this task (the
+            progress of the project is still the one of all its tasks).
+            Defaults to all of them.
+
+        Raises:
+            RevisionConflict: the project kept changing while its tasks were
+            being moved
+
+        Returns:
+            Project: project, None if there is no such project
+        """
+
+        request = await self.db.projects.find_one({"name": project_name})
+        if request is None:
+            return request
+
+        if "tasks" in request:
+            request = await self._migrated_project(request)
+            if request is None:
+                return request
+
+        if task_name is None:
+            return self._load_project(request, await self._load_tasks(request))
+
+        tasks = await self._load_tasks(request, task_name=task_name)
+        project = self._load_project(request, tasks)
+        project._progress = [request.get("done", 0), request.get("total", 0)]
+        return project
+
+    async def get_project_etag(self, project_name: str) -> tuple[str, list[str]]:
+        """ETag and members of a project, without loading the whole project
+
+        Args:
+            project_name (str): name of the project
+
+        Returns:
+            tuple[str, list[str]]: ETag and members, None if there is no such
+            project
+        """
+
+        request = await self.db.projects.find_one(
+            {"name": project_name}, {"_id": 1, "revision": 1, "members": 1}
+        )
+        if request is None:
+            return request
+
+        return self.etag(request), request.get("members") or []
+
+    async def get_project_with_etag(self, project_name: str) -> tuple[Project, str]:
+        """Project together with its ETag. The project document is read
+        before the tasks, and task writes are made before the revision they
+        belong to (see _write_task): the tasks are never older than the ETag
+
+        Args:
+            project_name (str): name of the project
+
+        Returns:
+            tuple[Project, str]: project and ETag, None if there is no such
+            project
+        """
+
+        request = await self.db.projects.find_one({"name": project_name})
+        if request is None:
+            return request
+
+        return await self._read_project(request), self.etag(request)
+
+    async def get_project_page(
+        self,
+        project_name: str,
+        after: ObjectId | None = None,
+        limit: int | None = None,
+        member: str | None = None,
+    ) -> tuple[Project, str, ObjectId | None]:
+        """Project with a page of its tasks, and its ETag. The progress of the
+        project is the one of all its tasks (the stored counters)
+
+        Args:
+            project_name (str): name of the project
+            after (ObjectId | None, optional): position of the page, the last
+            task of the previous one. Defaults to the first page.
+            limit (int | None, optional): tasks per page. Defaults to all.
+            member (str | None, optional): only the tasks of this member.
+            Defaults to None.
+
+        Returns:
+            tuple[Project, str, ObjectId | None]: project, ETag and position
+            of the next page (None if this is the last one). None if there is
+            no such project
+        """
 
-        request = self.db.projects.find_one({"name": project_name})
+        request = await self.db.projects.find_one({"name": project_name})
         if request is None:
             return request
 
-        return Project(**request)
+        if "tasks" in request:
+            # not moved yet, all of them are in the document (a single page)
+            project = await self._read_project(request, member)
+            return project, self.etag(request), None
+
+        tasks = await self._load_tasks(request, after, limit, member)
+        following = None
+        if limit is not None and len(tasks) == limit:
+            following = tasks[-1]["_id"]
+
+        project = self._load_project(request, tasks)
+        project._progress = [request.get("done", 0), request.get("total", 0)]
+
+        return project, self.etag(request), following
+
+    async def update_project(self, project: Project, updated_project: Project) -> bool:
+        """Replace the project's data. Each task is only written over if it is
+        still as it was loaded, and the other fields if they are (see
+        _write_tasks and _commit_task_writes)
+
+        Args:
+            project (Project): project, as loaded from the database
+            updated_project (Project): updated data
+
+        Raises:
+            RevisionConflict: the project was modified since it was loaded
+
+        Returns:
+            bool: return code
+        """
+
+        previous = project.model_dump(exclude={"revision"})
+        changes = [
+            {"op": "set", "path": [field], "value": value}
+            for field, value in updated_project.model_dump(exclude={"revision"}).items()
+            if previous[field] != value
+        ]
+
+        written = await self._write_tasks(project, updated_project.tasks)
+        if written is None:
+            return False
+
+        task_writes, conflict = written
+        return await self._commit_task_writes(
+            project,
+            task_writes,
+            "project.updated",
+            notify=list(updated_project.members),
+            changes=changes,
+            fields={
+                change["path"][0]: change["value"]
+                for change in changes
+                if change["path"][0] != "tasks"
+            },
+            conflict=conflict,
+        )
+
+    async def _log_changes(
+        self, project: Project, revision: int, changes: list[dict]
+    ) -> None:
+        """Record the changes of a write to the project in its change log,
+        under the revision the write moved the project to. Patch operations
+        are {"op": "set" | "add" | "remove", "path": [...], "value": ...},
+        where the path is a project field, or "tasks", a task name and
+        optionally one of the task's fields
+
+        Args:
+            project (Project): project, as loaded before the write
+            revision (int): revision the write moved the project to
+            changes (list[dict]): patch operations, in order
+        """
+
+        if project._document_id is None:
+            return
+
+        try:
+            await self.db.project_changes.insert_one(
+                {
+                    "project_id": project._document_id,
+                    "revision": revision,
+                    "changes": changes,
+                    "time": datetime.now(timezone.utc),
+                }
+            )
+        except PyMongoError as e:
+            # the gap makes clients fall back to a snapshot
+            logger.error(f"Could not log the changes of {project.name}: {e}")
+
+    async def get_project_changes(
+        self, project_name: str, since: int
+    ) -> tuple[list[str], str, dict] | None:
+        """Changes made to a project since a revision, from its change log.
+        If the log does not go back that far anymore (compacted), or there
+        are more than CHANGE_LOG_MAX revisions to catch up on, the whole
+        project is sent instead
+
+        Args:
+            project_name (str): name of the project
+            since (int): revision the client has
+
+        Returns:
+            tuple[list[str], str, dict] | None: members (to check
+            permissions), ETag, and {"revision", "changes"} or {"revision",
+            "snapshot"}. None if there is no such project
+        """
+
+        current = await self.db.projects.find_one(
+            {"name": project_name}, {"_id": 1, "revision": 1, "members": 1}
+        )
+        if current is None:
+            return current
+
+        revision = current.get("revision", 0)
+        members = current.get("members") or []
+
+        if 0 <= since <= revision and revision - since <= CHANGE_LOG_MAX:
+            entries = self.db.project_changes.find(
+                {
+                    "project_id": current["_id"],
+                    "revision": {"$gt": since, "$lte": revision},
+                }
+            ).sort("revision", ASCENDING)
+            entries = await entries.to_list(None)
+
+            # only if nothing is missing
+            if [entry["revision"] for entry in entries] == list(
+                range(since + 1, revision + 1)
+            ):
+                changes = [change for entry in entries for change in entry["changes"]]
+                return (
+                    members,
+                    self.etag(current),
+                    {"revision": revision, "changes": changes},
+                )
+
+        document = await self.db.projects.find_one({"name": project_name})
+        if document is None:
+            return document
 
-    def update_project(self, project_name: str, updated_project: Project) -> bool:
+        project = await self._read_project(document)
+        return (
+            document.get("members") or [],
+            self.etag(document),
+            {"revision": document.get("revision", 0), "snapshot": project.model_dump()},
+        )
+
+    async def delete_project(self, project_name: str) -> bool:
 
-        request = self.db.projects.update_one(
-            {"name": project_name}, {"$set": updated_project.model_dump()}
+        document = await self.db.projects.find_one_and_delete(
+            {"name": project_name}, {"_id": 1}
         )
+        if document is not None:
+            # only its own tasks, a new project may have taken the name already
+            await self.db.tasks.delete_many(
+                {
+                    "project": project_name,
+                    "project_id": {"$in": [document["_id"], None]},
+                }
+            )
+
+        await self.events.publish(Event(type="project.deleted", project=project_name))
+
+        return True
+
+    # PROGRESS COUNTER METHODS
+    @staticmethod
+    def _progress_counters(project: Project) -> dict:
+        """Progress counters stored on the project document, so the project
+        list does not need to load the tasks
+
+        Returns:
+            dict: {"done": int, "total": int}
+        """
 
-        # update all members
-        for username in updated_project.members:
-            user_db = User_DB(**self.db.users.find_one({"username": username}))
-            if updated_project.name not in user_db.update_projects:
-                self.db.users.update_one(
-                    {"username": username},
-                    {"$push": {"update_projects": updated_project.name}},
+        done, total = project.progress
+        return {"done": done, "total": total}
+
+    @staticmethod
+    def _progress_delta(old_task: Task | None, new_task: Task | None) -> dict:
+        """$inc update for the progress counters when a task changes
+
+        Args:
+            old_task (Task | None): task before the change (None if added)
+            new_task (Task | None): task after the change (None if deleted)
+
+        Returns:
+            dict: {"done": int, "total": int}
+        """
+
+        old_done, old_total = old_task.progress if old_task is not None else [0, 0]
+        new_done, new_total = new_task.progress if new_task is not None else [0, 0]
+        return {"done": new_done - old_done, "total": new_total - old_total}
+
+    async def repair_progress(self, only_missing: bool = False) -> int:
+        """Recompute the progress counters of the projects from their tasks
+        (in the task collection, see migrate_tasks)
+
+        Args:
+            only_missing (bool, optional): only repair projects without
+            counters (created before they existed). Defaults to False.
+
+        Returns:
+            int: number of projects repaired
+        """
+
+        query = {"done": {"$exists": False}} if only_missing else {}
+
+        repaired = 0
+        batch = []
+        async for document in self.db.projects.find(query, {"name": 1}):
+            tasks = await self.db.tasks.find(
+                {
+                    "project": document["name"],
+                    "project_id": {"$in": [document["_id"], None]},
+                },
+                {"_id": 0, "name": 1, "completed": 1, "milestones": 1},
+            ).to_list(None)
+            project = Project(name=document["name"], tasks=tasks)
+            batch.append(
+                UpdateOne(
+                    {"_id": document["_id"]},
+                    {"$set": self._progress_counters(project)},
                 )
+            )
+            if len(batch) == 500:
+                await self.db.projects.bulk_write(batch, ordered=False)
+                repaired += len(batch)
+                batch = []
 
-        return request.acknowledged
+        if batch:
+            await self.db.projects.bulk_write(batch, ordered=False)
+            repaired += len(batch)
 
-    def delete_project(self, project_name: str) -> bool:
+        return repaired
 
-        request = self.db.projects.delete_one({"name": project_name})
+    # TASK MIGRATION METHODS
+    async def _migrate_project_tasks(self, document: dict) -> bool:
+        """Move the tasks embedded in a project document (written before the
+        task collection existed) to the task collection. The tasks are only
+        removed from the document if it has not changed since it was read
+
+        Args:
+            document (dict): project document, with its tasks
+
+        Returns:
+            bool: True if the tasks were moved
+        """
+
+        tasks = document.get("tasks") or []
+        try:
+            # recomputed here, counters from before the migration may be off
+            counters = self._progress_counters(
+                Project(name=document["name"], tasks=tasks)
+            )
+            if tasks:
+                # tasks already moved by an earlier try are left as they are,
+                # ones a deleted project of the same name left behind fail the
+                # move (see add_project)
+                await self.db.tasks.bulk_write(
+                    [
+                        UpdateOne(
+                            {
+                                "project": document["name"],
+                                "name": task["name"],
+                                "project_id": {"$in": [document["_id"], None]},
+                            },
+                            {
+                                "$setOnInsert": {
+                                    **task,
+                                    "project": document["name"],
+                                    "project_id": document["_id"],
+                                }
+                            },
+                            upsert=True,
+                        )
+                        for task in tasks
+                    ]
+                )
+
+            request = await self.db.projects.update_one(
+                {"_id": document["_id"], "tasks": document["tasks"]},
+                {"$unset": {"tasks": ""}, "$set": counters},
+            )
+        except (PyMongoError, ValidationError) as e:
+            logger.error(f"Could not move the tasks of {document['name']}: {e}")
+            return False
+
+        return request.modified_count == 1
+
+    async def _migrated_project(self, document: dict) -> dict | None:
+        """Project document once its tasks are moved to the task collection
+        (see _migrate_project_tasks), moved again while the document keeps
+        changing
+
+        Args:
+            document (dict): project document, with its tasks
+
+        Raises:
+            RevisionConflict: still not moved after WRITE_RETRIES tries
+
+        Returns:
+            dict | None: project document, None if the project was deleted
+        """
+
+        for _ in range(WRITE_RETRIES):
+            await self._migrate_project_tasks(document)
+            document = await self.db.projects.find_one({"_id": document["_id"]})
+            if document is None or "tasks" not in document:
+                return document
+
+        raise RevisionConflict(document.get("revision", 0), self.etag(document))
+
+    async def migrate_tasks(self) -> int:
+        """Move the tasks of every project still holding them in its document
+        to the task collection. Projects are also migrated when they are
+        loaded to be written to, this takes care of the ones nobody changes
+
+        Returns:
+            int: number of projects migrated
+        """
+
+        migrated = 0
+        async for document in self.db.projects.find({"tasks": {"$exists": True}}):
+            # the document changed while its tasks were being copied
+            for _ in range(WRITE_RETRIES):
+                if await self._migrate_project_tasks(document):
+                    migrated += 1
+                    break
+
+                document = await self.db.projects.find_one(
+                    {"_id": document["_id"], "tasks": {"$exists": True}}
+                )
+                if document is None:
+                    break
+
+        return migrated
+
+    async def notify_members(self, project_name: str, members: list[str]) -> bool:
+        """Mark the project as updated for its members, so their clients know
+        to fetch it again. Done with a single update for all the members
+
+        Args:
+            project_name (str): name of the updated project
+            members (list[str]): usernames of the members to notify
+
+        Returns:
+            bool: return code
+        """
+
+        request = await self.db.users.update_many(
+            {"username": {"$in": members}},
+            {"$addToSet": {"update_projects": project_name}},
+        )
 
         return request.acknowledged
+
+    async def pop_project_updates(
+        self, username: str, projects: list[str] | None = None
+    ) -> list[str] | None:
+        """Take projects out of the user's pending updates, in a single
+        round trip
+
+        Args:
+            username (str): username of the user
+            projects (list[str] | None, optional): projects to take out (already
+            delivered by an update stream). Defaults to all of them.
+
+        Returns:
+            list[str] | None: projects taken out, None if the user does not exist
+        """
+
+        if projects is not None:
+            request = await self.db.users.update_one(
+                {"username": username},
+                {"$pullAll": {"update_projects": projects}},
+            )
+            return projects if request.matched_count > 0 else None
+
+        request = await self.db.users.find_one_and_update(
+            {"username": username},
+            {"$set": {"update_projects": []}},
+            projection={"_id": 0, "update_projects": 1},
+        )
+        if request is None:
+            return request
+
+        return request.get("update_projects", [])
+
+    async def _write_notifications(self, event: Event) -> None:
+        """Event handler storing the change on the notified members' documents"""
+
+        if event.members:
+            await self._notify(event.project, event.members)
+
+    async def _notify(self, project_name: str, members: list[str]) -> None:
+        """Notify the members of a project, in the background if
+        notify_in_background is set (the request does not wait for it then)"""
+
+        if not self.notify_in_background:
+            await self.notify_members(project_name, members)
+            return
+
+        task = asyncio.create_task(self.notify_members(project_name, members))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._notify_done)
+
+    def _notify_done(self, task: asyncio.Task) -> None:
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Could not notify project members: {task.exception()}")
+
+    async def flush_notifications(self) -> None:
+        """Wait for the notifications running in the background to finish"""
+
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    @staticmethod
+    def _revision_filter(project: Project) -> dict:
+        """Filter matching the project only at the revision it was loaded at
+        (compare-and-set)"""
+
+        query = {"name": project.name, "revision": project.revision}
+        if project.revision == 0:
+            # projects created before revisions existed have none yet
+            query["revision"] = {"$in": [0, None]}
+        if project._document_id is not None:
+            query["_id"] = project._document_id
+        return query
+
+    async def _check_revision(self, project: Project) -> None:
+        """After a write to the project matched nothing, tell a revision
+        conflict apart from the write's own conditions not matching
+
+        Raises:
+            RevisionConflict: the project was modified since it was loaded
+        """
+
+        current = await self.db.projects.find_one(
+            {"name": project.name}, {"_id": 1, "revision": 1}
+        )
+        if current is None:
+            return  # deleted
+
+        if current.get("revision", 0) != project.revision or (
+            project._document_id is not None and current["_id"] != project._document_id
+        ):
+            raise RevisionConflict(current.get("revision", 0), self.etag(current))
+
+    async def _revision_conflict(self, project: Project) -> RevisionConflict | None:
+        """Conflict for a write another write got in the way of, with the
+        current revision of the project (task writes conflict on the task,
+        the revision may not have moved on yet)
+
+        Args:
+            project (Project): project, as loaded before the write
+
+        Returns:
+            RevisionConflict | None: conflict, None if the project was deleted
+        """
+
+        current = await self.db.projects.find_one(
+            {"_id": project._document_id}, {"_id": 1, "revision": 1}
+        )
+        if current is None:
+            return current
+
+        return RevisionConflict(current.get("revision", 0), self.etag(current))
+
+    async def retry_on_conflict(
+        self,
+        write,
+        project: Project,
+        *args,
+        check=None,
+        task_name: str | None = None,
+    ) -> bool | None:
+        """Run a commutative project write (one whose outcome does not depend
+        on what else changed in the project, e.g. adding a member), reloading
+        the project and trying again when another write got in first
+
+        Args:
+            write: Database method taking the project then args
+            project (Project): project, as loaded from the database
+            *args: the write's other arguments
+            check (optional): checks the write was allowed by, run again on
+            the reloaded project (raising if it is not allowed anymore)
+            task_name (str | None, optional): only reload this task (see
+            get_project). Defaults to all of them.
+
+        Raises:
+            RevisionConflict: still conflicting after WRITE_RETRIES tries
+
+        Returns:
+            bool | None: return code of the write, None if the project was
+            deleted
+        """
+
+        for attempt in range(WRITE_RETRIES):
+            try:
+                return await write(project, *args)
+            except RevisionConflict:
+                if attempt == WRITE_RETRIES - 1:
+                    raise
+
+            project = await self.get_project(project.name, task_name)
+            if project is None:
+                return project
+            if check is not None:
+                check(project)
+
+    async def _update_project(
+        self,
+        project: Project,
+        query: dict,
+        update: dict,
+        event_type: str,
+        data: dict = None,
+        notify: list[str] = None,
+        changes: list[dict] = None,
+    ) -> bool:
+        """Apply a targeted update to a single project document, then publish
+        the change. Only the fields in the update are sent to the database,
+        so concurrent edits to other parts of the project are not overwritten
+
+        Args:
+            project (Project): project to update
+            query (dict): extra filters, the update only happens if they match
+            update (dict): mongo update document
+            event_type (str): type of the published event
+            data (dict, optional): details of the published event
+            notify (list[str], optional): members to notify. Defaults to the
+            project's members
+            changes (list[dict], optional): patch operations of the update,
+            for the change log (see _log_changes)
+
+        Raises:
+            RevisionConflict: the project was modified since it was loaded
+
+        Returns:
+            bool: True if the project matched the filters and was updated
+        """
+
+        # every change to the project moves its revision (its ETag) on, and
+        # only applies to the revision the update was computed from
+        update = {**update, "$inc": {**update.get("$inc", {}), "revision": 1}}
+
+        request = await self.db.projects.update_one(
+            {**self._revision_filter(project), **query}, update
+        )
+        if request.matched_count == 0:
+            await self._check_revision(project)
+            return False
+
+        await self._log_changes(project, project.revision + 1, changes or [])
+
+        await self.events.publish(
+            Event(
+                type=event_type,
+                project=project.name,
+                members=project.members if notify is None else notify,
+                data=data or {},
+            )
+        )
+
+        return True
+
+    # PROJECT MEMBER METHODS
+    async def add_project_member(self, project: Project, username: str) -> bool:
+        """Add a member to the project
+
+        Args:
+            project (Project): project to add the member to
+            username (str): username of the new member
+
+        Returns:
+            bool: return code
+        """
+
+        return await self._update_project(
+            project,
+            {},
+            {"$addToSet": {"members": username}},
+            "member.added",
+            {"username": username},
+            notify=[*project.members, username],
+            changes=[{"op": "add", "path": ["members"], "value": username}],
+        )
+
+    async def remove_project_member(self, project: Project, username: str) -> bool:
+        """Remove a member from the project
+
+        Args:
+            project (Project): project to remove the member from
+            username (str): username of the member
+
+        Returns:
+            bool: return code
+        """
+
+        return await self._update_project(
+            project,
+            {},
+            {"$pull": {"members": username}},
+            "member.removed",
+            {"username": username},
+            notify=[member for member in project.members if member != username],
+            changes=[{"op": "remove", "path": ["members"], "value": username}],
+        )
+
+    async def add_project_moderator(self, project: Project, username: str) -> bool:
+        """Make a project member a moderator
+
+        Args:
+            project (Project): project
+            username (str): username of the member to promote
+
+        Returns:
+            bool: return code
+        """
+
+        return await self._update_project(
+            project,
+            {},
+            {"$addToSet": {"moderators": username}},
+            "moderator.added",
+            {"username": username},
+            changes=[{"op": "add", "path": ["moderators"], "value": username}],
+        )
+
+    async def remove_project_moderator(self, project: Project, username: str) -> bool:
+        """Demote a project moderator
+
+        Args:
+            project (Project): project
+            username (str): username of the moderator to demote
+
+        Returns:
+            bool: return code
+        """
+
+        return await self._update_project(
+            project,
+            {},
+            {"$pull": {"moderators": username}},
+            "moderator.removed",
+            {"username": username},
+            changes=[{"op": "remove", "path": ["moderators"], "value": username}],
+        )
+
+    # TASK WRITE METHODS
+    @staticmethod
+    def _task_document(project: Project, task: Task, version: int) -> dict:
+        """Document of a task in the task collection, as left by its
+        version-th write. Its revision is the one the write expects to move
+        the project to (see _stamp_task_writes)"""
+
+        return {
+            **task.model_dump(),
+            "project": project.name,
+            "project_id": project._document_id,
+            "version": version,
+            "revision": project.revision + 1,
+        }
+
+    async def _write_task(
+        self, project: Project, task_name: str, task: Task | None
+    ) -> dict | None:
+        """Write a single task, if it is still the version it was loaded at
+        (compare-and-set on the task alone, writes to the other tasks do not
+        get in the way). The task document is where the write is committed:
+        it is made first and never undone, the project is moved on to its
+        next revision after it (see _commit_task_writes). Readers get the
+        project document before the tasks, so they never see a task older
+        than the revision they are sent
+
+        Args:
+            project (Project): project, as loaded with the task
+            task_name (str): name of the task
+            task (Task | None): the task after the write, None to delete it
+
+        Raises:
+            RevisionConflict: the task was changed (or added) since it was
+            loaded
+
+        Returns:
+            dict | None: task write ("name", "version" it leaves the task at,
+            "previous" and "task"), None if the project was deleted
+        """
+
+        previous = project.get_task(task_name)
+        version = project._task_versions.get(task_name, 0)
+
+        query = {"project": project.name, "name": task_name, "version": version}
+        if version == 0:
+            # tasks written before versions existed have none yet
+            query["version"] = {"$in": [0, None]}
+
+        try:
+            if previous is None:
+                await self.db.tasks.insert_one(
+                    self._task_document(project, task, version + 1)
+                )
+                written = True
+            elif task is None:
+                request = await self.db.tasks.delete_one(query)
+                written = request.deleted_count == 1
+            else:
+                request = await self.db.tasks.replace_one(
+                    query, self._task_document(project, task, version + 1)
+                )
+                written = request.matched_count == 1
+        except DuplicateKeyError:
+            written = False  # added by another write in the meantime
+
+        if not written:
+            conflict = await self._revision_conflict(project)
+            if conflict is None:
+                return None
+            raise conflict
+
+        return {
+            "name": task_name,
+            "version": version + 1,
+            "previous": previous,
+            "task": task,
+        }
+
+    async def _write_tasks(
+        self, project: Project, tasks: list[Task]
+    ) -> tuple[list[dict], RevisionConflict | None] | None:
+        """Write the tasks of a project that differ from the ones it was loaded
+        with (a whole new task list): removed tasks are deleted, the others
+        written over, new ones go after the existing tasks. Their versions are
+        all checked before the first one is written. A write to one of them
+        getting in between the task writes still stops them half way, the
+        ones made are left for the caller to commit (see _commit_task_writes)
+
+        Args:
+            project (Project): project, as loaded from the database
+            tasks (list[Task]): new tasks of the project
+
+        Returns:
+            tuple[list[dict], RevisionConflict | None] | None: task writes
+            made (see _write_task), and the conflict that stopped them if one
+            did. None if the project was deleted
+        """
+
+        tasks = {task.name: task for task in tasks}
+        loaded = {task.name: task.model_dump() for task in project.tasks}
+        writes = [(task_name, None) for task_name in loaded if task_name not in tasks]
+        writes += [
+            (task_name, task)
+            for task_name, task in tasks.items()
+            if loaded.get(task_name) != task.model_dump()
+        ]
+        if not writes:
+            return [], None
+
+        current = await self.db.tasks.find(
+            {
+                "project": project.name,
+                "project_id": {"$in": [project._document_id, None]},
+                "name": {"$in": [task_name for task_name, _ in writes]},
+            },
+            {"_id": 0, "name": 1, "version": 1},
+        ).to_list(None)
+        versions = {task["name"]: task.get("version") or 0 for task in current}
+        for task_name, _ in writes:
+            expected = project._task_versions.get(task_name, 0)
+            if versions.get(task_name) != (expected if task_name in loaded else None):
+                conflict = await self._revision_conflict(project)
+                return None if conflict is None else ([], conflict)
+
+        task_writes = []
+        for task_name, task in writes:
+            try:
+                task_write = await self._write_task(project, task_name, task)
+            except RevisionConflict as conflict:
+                return task_writes, conflict
+            if task_write is None:
+                return None
+
+            task_writes.append(task_write)
+
+        return task_writes, None
+
+    @staticmethod
+    def _task_changes(task_writes: list[dict]) -> list[dict]:
+        """Patch operations of task writes, setting the tasks as they left
+        them (see _log_changes)"""
+
+        changes = []
+        for task_write in task_writes:
+            task_name, task = task_write["name"], task_write["task"]
+            if task is None:
+                changes.append({"op": "remove", "path": ["tasks", task_name]})
+            elif task_write["previous"] is None:
+                changes.append(
+                    {"op": "add", "path": ["tasks"], "value": task.model_dump()}
+                )
+            else:
+                changes.append(
+                    {
+                        "op": "set",
+                        "path": ["tasks", task_name],
+                        "value": task.model_dump(),
+                    }
+                )
+        return changes
+
+    async def _stamp_task_writes(
+        self, project: Project, task_writes: list[dict], revision: int
+    ) -> bool:
+        """Set the revision of written tasks to the one their project update
+        moved the project to, when other writes moved it on in between (the
+        tasks were written with the revision following the one loaded)
+
+        Args:
+            project (Project): project, as loaded before the writes
+            task_writes (list[dict]): task writes (see _write_task)
+            revision (int): revision the project update moved the project to
+
+        Returns:
+            bool: False if one of the tasks was written again since. That
+            write may have moved the project on before this one did, so the
+            change log could have the two the wrong way around
+        """
+
+        ordered = True
+        for task_write in task_writes:
+            query = {"project": project.name, "name": task_write["name"]}
+            if task_write["task"] is None:
+                if await self.db.tasks.count_documents(query, limit=1) > 0:
+                    ordered = False
+                continue
+
+            request = await self.db.tasks.update_one(
+                {**query, "version": task_write["version"]},
+                {"$set": {"revision": revision}},
+            )
+            if request.matched_count == 0:
+                ordered = False
+
+        return ordered
+
+    async def _commit_task_writes(
+        self,
+        project: Project,
+        task_writes: list[dict],
+        event_type: str,
+        data: dict = None,
+        notify: list[str] = None,
+        changes: list[dict] = None,
+        fields: dict = None,
+        conflict: RevisionConflict = None,
+    ) -> bool:
+        """Move the project on to its next revision after writes to its tasks
+        (see _write_task), with their progress counters and the project
+        fields changed along with them, then log and publish the change. The
+        revision is moved on whatever else was written to the project in the
+        meantime: the task writes are made (checked against the tasks
+        themselves) and never undone. The project fields are only written if
+        they are still as they were loaded
+
+        Args:
+            project (Project): project, as loaded before the writes
+            task_writes (list[dict]): task writes made (see _write_task)
+            event_type (str): type of the published event
+            data (dict, optional): details of the published event
+            notify (list[str], optional): members to notify. Defaults to the
+            project's members
+            changes (list[dict], optional): patch operations of the writes,
+            for the change log (see _log_changes)
+            fields (dict, optional): project fields to set, and their values
+            conflict (RevisionConflict, optional): conflict that stopped the
+            task writes half way, only the ones made are committed
+
+        Raises:
+            RevisionConflict: the conflict, or the project fields were changed
+            since the project was loaded. The task writes made are committed
+            all the same, on their own
+
+        Returns:
+            bool: False if the project was deleted
+        """
+
+        if conflict is not None and not task_writes:
+            raise conflict
+
+        update = {"$inc": {"revision": 1, "done": 0, "total": 0}}
+        for task_write in task_writes:
+            delta = self._progress_delta(task_write["previous"], task_write["task"])
+            for counter, value in delta.items():
+                update["$inc"][counter] += value
+
+        query = {"_id": project._document_id}
+        if fields and conflict is None:
+            # only from the values they were loaded with (missing if empty)
+            query["$and"] = [
+                {field: value} if value else {"$or": [{field: value}, {field: None}]}
+                for field, value in project.model_dump(include=set(fields)).items()
+            ]
+            update["$set"] = fields
+
+        document = await self.db.projects.find_one_and_update(
+            query, update, {"revision": 1}, return_document=ReturnDocument.AFTER
+        )
+        if document is None and "$set" in update:
+            conflict = await self._revision_conflict(project)
+            if conflict is not None and not task_writes:
+                raise conflict
+
+            del update["$set"]
+            document = await self.db.projects.find_one_and_update(
+                {"_id": project._document_id},
+                update,
+                {"revision": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        if document is None:
+            # deleted, the tasks written are cleared with the ones it left
+            # behind (see add_project)
+            return False
+
+        if conflict is not None:
+            changes = self._task_changes(task_writes)
+
+        revision = document["revision"]
+        if revision != project.revision + 1 and not await self._stamp_task_writes(
+            project, task_writes, revision
+        ):
+            # left out of the change log, clients catching up over this
+            # revision get a snapshot (see get_project_changes)
+            changes = None
+
+        if changes is not None:
+            await self._log_changes(project, revision, changes)
+
+        await self.events.publish(
+            Event(
+                type=event_type,
+                project=project.name,
+                members=project.members if notify is None else notify,
+                data=data or {},
+            )
+        )
+
+        if conflict is not None:
+            raise conflict
+        return True
+
+    # TASK METHODS
+    async def add_task(self, project: Project, task: Task) -> bool:
+        """Add a task to the project, unless one with the same name exists
+
+        Args:
+            project (Project): project to add the task to
+            task (Task): new task
+
+        Raises:
+            RevisionConflict: a task with the same name was added since the
+            project was loaded
+
+        Returns:
+            bool: False if the task already exists
+        """
+
+        if project.has_task(task.name):
+            return False
+
+        task_write = await self._write_task(project, task.name, task)
+        if task_write is None:
+            return False
+
+        return await self._commit_task_writes(
+            project,
+            [task_write],
+            "task.added",
+            {"task": task.name},
+            changes=[{"op": "add", "path": ["tasks"], "value": task.model_dump()}],
+        )
+
+    async def update_task(self, project: Project, task_name: str, task: Task) -> bool:
+        """Replace a single task of the project
+
+        Args:
+            project (Project): project containing the task
+            task_name (str): name of the task to replace
+            task (Task): updated task
+
+        Raises:
+            RevisionConflict: the task was changed since it was loaded
+
+        Returns:
+            bool: False if the task does not exist
+        """
+
+        if not project.has_task(task_name):
+            return False
+
+        task_write = await self._write_task(project, task_name, task)
+        if task_write is None:
+            return False
+
+        return await self._commit_task_writes(
+            project,
+            [task_write],
+            "task.updated",
+            {"task": task_name},
+            changes=[
+                {"op": "set", "path": ["tasks", task_name], "value": task.model_dump()}
+            ],
+        )
+
+    async def delete_task(self, project: Project, task_name: str) -> bool:
+        """Remove a single task from the project
+
+        Args:
+            project (Project): project containing the task
+            task_name (str): name of the task to remove
+
+        Raises:
+            RevisionConflict: the task was changed since it was loaded
+
+        Returns:
+            bool: False if the task does not exist
+        """
+
+        if not project.has_task(task_name):
+            return False
+
+        task_write = await self._write_task(project, task_name, None)
+        if task_write is None:
+            return False
+
+        return await self._commit_task_writes(
+            project,
+            [task_write],
+            "task.deleted",
+            {"task": task_name},
+            changes=[{"op": "remove", "path": ["tasks", task_name]}],
+        )
+
+    async def update_task_completion(
+        self, project: Project, task_name: str, completion: bool | int
+    ) -> bool:
+        """Set the completion of a single task
+
+        Args:
+            project (Project): project containing the task
+            task_name (str): name of the task
+            completion (bool | int): completed flag (discrete tasks) or number
+            of completed milestones (milestone tasks)
+
+        Raises:
+            RevisionConflict: the task was changed since it was loaded
+
+        Returns:
+            bool: False if the task does not exist
+        """
+
+        previous = project.get_task(task_name)
+        if previous is None:
+            return False
+
+        task = previous.model_copy(update={"completed": completion})
+        task_write = await self._write_task(project, task_name, task)
+        if task_write is None:
+            return False
+
+        return await self._commit_task_writes(
+            project,
+            [task_write],
+            "task.completed",
+            {"task": task_name, "completed": completion},
+            changes=[
+                {
+                    "op": "set",
+                    "path": ["tasks", task_name, "completed"],
+                    "value": completion,
+                }
+            ],
+        )
+
+    async def add_task_member(
+        self, project: Project, task_name: str, username: str
+    ) -> bool:
+        """Add a member to a single task
+
+        Args:
+            project (Project): project containing the task
+            task_name (str): name of the task
+            username (str): username of the member to add
+
+        Raises:
+            RevisionConflict: the task was changed since it was loaded
+
+        Returns:
+            bool: False if the task does not exist or the user is already a
+            member of it
+        """
+
+        previous = project.get_task(task_name)
+        if previous is None or username in previous.members:
+            return False
+
+        task = previous.model_copy(
+            update={"members": Username_Set([*previous.members, username])}
+        )
+        task_write = await self._write_task(project, task_name, task)
+        if task_write is None:
+            return False
+
+        return await self._commit_task_writes(
+            project,
+            [task_write],
+            "task.member_added",
+            {"task": task_name, "username": username},
+            changes=[
+                {
+                    "op": "add",
+                    "path": ["tasks", task_name, "members"],
+                    "value": username,
+                }
+            ],
+        )
+
+    async def remove_task_member(
+        self, project: Project, task_name: str, username: str
+    ) -> bool:
+        """Remove a member from a single task
+
+        Args:
+            project (Project): project containing the task
+            task_name (str): name of the task
+            username (str): username of the member to remove
+
+        Raises:
+            RevisionConflict: the task was changed since it was loaded
+
+        Returns:
+            bool: False if the task does not exist or the user is not a member
+            of it
+        """
+
+        previous = project.get_task(task_name)
+        if previous is None or username not in previous.members:
+            return False
+
+        task = previous.model_copy(
+            update={
+                "members": Username_Set(
+                    member for member in previous.members if member != username
+                )
+            }
+        )
+        task_write = await self._write_task(project, task_name, task)
+        if task_write is None:
+            return False
+
+        return await self._commit_task_writes(
+            project,
+            [task_write],
+            "task.member_removed",
+            {"task": task_name, "username": username},
+            changes=[
+                {
+                    "op": "remove",
+                    "path": ["tasks", task_name, "members"],
+                    "value": username,
+                }
+            ],
+        )
+
+    # BATCH METHODS
+    async def apply_batch(
+        self, project: Project, batched: Project, changes: list[dict]
+    ) -> bool:
+        """Write the result of a batch of operations on the project (members,
+        moderators and tasks), logged and published as one change. The tasks
+        and fields it changes are written as in update_project
+
+        Args:
+            project (Project): project, as loaded before the batch
+            batched (Project): project with the operations applied
+            changes (list[dict]): patch operations of the batch, in order
+
+        Raises:
+            RevisionConflict: the project was modified since it was loaded
+
+        Returns:
+            bool: False if the project was deleted
+        """
+
+        written = await self._write_tasks(project, batched.tasks)
+        if written is None:
+            return False
+
+        task_writes, conflict = written
+        return await self._commit_task_writes(
+            project,
+            task_writes,
+            "project.batch",
+            {"operations": len(changes)},
+            # removed members are told too
+            notify=list(dict.fromkeys([*project.members, *batched.members])),
+            changes=changes,
+            fields={
+                field: list(value)
+                for field, value in [
+                    ("members", batched.members),
+                    ("moderators", batched.moderators),
+                ]
+                if list(value) != list(getattr(project, field))
+            },
+            conflict=conflict,
+        )
@@ -0,0 +1,129 @@
+from collections import Counter
+from contextvars import ContextVar
+from pymongo import monitoring
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# add X-DB-Calls and X-DB-Time-ms headers to the responses
+try:
+    DEBUG = os.environ["DEBUG"].lower() == "true"
+except KeyError:
+    DEBUG = False
+
+# log requests making more database calls than this
+try:
+    DB_CALL_BUDGET = int(os.environ["DB_CALL_BUDGET"])
+except KeyError:
+    DB_CALL_BUDGET = 10
+
+
+class DBCalls:
+    """Database commands made while handling one request. Commands are
+    monitored on motor's worker threads, possibly several at once for the same
+    request, so they are only appended (atomic) and added up when read"""
+
+    def __init__(self) -> None:
+        self.commands: list[tuple[str, str]] = []  # (collection, command)
+        self.durations: list[float] = []  # milliseconds
+
+    @property
+    def calls(self) -> int:
+        return len(self.commands)
+
+    @property
+    def time_ms(self) -> float:
+        return round(sum(self.durations), 2)
+
+    def summary(self) -> str:
+        """Commands by collection, most made first (e.g. "projects.find x3")"""
+
+        return ", ".join(
+            f"{collection}.{command} x{count}" if collection else f"{command} x{count}"
+            for (collection, command), count in Counter(self.commands).most_common()
+        )
+
+
+# database calls of the request being handled, set by DBCallsMiddleware. Motor
+# copies the context to its worker threads, so the listener below sees it too
+current_db_calls: ContextVar[DBCalls | None] = ContextVar(
+    "current_db_calls", default=None
+)
+
+
+class DBCallListener(monitoring.CommandListener):
+    """pymongo command monitor adding the commands to the database calls of
+    the request that made them"""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        db_calls = current_db_calls.get()
+        if db_calls is None:
+            return  # not made by a request (e.g. a background job)
+
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""  # e.g. ping, or aggregates on the database
+        db_calls.commands.append((collection, event.command_name))
+
+    def _finished(self, event) -> None:
+        db_calls = current_db_calls.get()
+        if db_calls is not None:
+            db_calls.durations.append(event.duration_micros / 1000)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+
+# listener registered on the database client
+db_call_listener = DBCallListener()
+
+
+class DBCallsMiddleware:
+    """ASGI middleware counting the database calls made by each request.
+    Requests going over the budget are logged with their commands, to catch
+    N+1 query patterns, and in debug mode the count and time are sent back in
+    the X-DB-Calls and X-DB-Time-ms headers (calls made while a streamed body
+    is being sent come after the headers, so are only in the log)"""
+
+    def __init__(self, app, headers: bool = False, budget: int = 10) -> None:
+        self.app = app
+        self.headers = headers
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        db_calls = DBCalls()
+        token = current_db_calls.set(db_calls)
+
+        async def send_wrapper(message) -> None:
+            if self.headers and message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"x-db-calls", str(db_calls.calls).encode()),
+                        (b"x-db-time-ms", str(db_calls.time_ms).encode()),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_db_calls.reset(token)
+
+            if db_calls.calls > self.budget:
+                route = scope.get("route")
+                path = route.path if route is not None else scope["path"]
+                logger.warning(
+                    f"{scope['method']} {path} made {db_calls.calls} database calls"
+                    f" (budget {self.budget}) in {db_calls.time_ms} ms:"
+                    f" {db_calls.summary()}"
+                )
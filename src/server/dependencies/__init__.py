@@ -1,3 +1,3 @@
-from .token_auth import token_auth, admin_auth
+from .token_auth import token_auth, admin_auth, auth_context
 from .db_depend import db_depend
 from .project_depend import project_depend, task_depend
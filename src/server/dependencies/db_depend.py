@@ -1,19 +1,18 @@
 from fastapi import HTTPException
-from pymongo import MongoClient
 from ..database import Database
 
 # database configuration
 db = Database()
 
 
-def db_depend() -> Database:
+async def db_depend() -> Database:
     """Database dependency. Checks if the database is online, then returns it
 
     Args:
-        database (MongoClient, optional): Database client. Defaults to db.
+        database (Database, optional): Database interface. Defaults to db.
 
     Returns:
-        MongoClient: Database client
+        Database: Database interface
     """
 
     if not isinstance(db, Database):
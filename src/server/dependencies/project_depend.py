@@ -2,20 +2,19 @@
 
 from fastapi import Depends, HTTPException
 from .db_depend import db_depend
-from .token_auth import token_auth, admin_auth
-from ..models import Project, User
+from .token_auth import auth_context
+from ..models import Project, Auth_Context
 from ..database import Database
 
 
-def project_depend(
+async def project_depend(
     project_name: str,
-    user: User = Depends(token_auth),
+    auth: Auth_Context = Depends(auth_context),
     db: Database = Depends(db_depend),
-    admin: bool = Depends(admin_auth),
 ) -> Project:
 
     # check if project exists
-    project = db.get_project(project_name)
+    project = await db.get_project(project_name)
 
     if project is None:
         raise HTTPException(404, "Project not found")
@@ -23,17 +22,37 @@ def project_depend(
     # check if user has sufficient permissions to view project
     # user_id = db.get_user_id(user.username)
 
-    if user.username not in project.members and admin is False:
+    if auth.user.username not in project.members and auth.admin is False:
         raise HTTPException(403, "You are not a member of this project")
 
     return project
 
 
-def task_depend(
+async def task_depend(
+    project_name: str,
     task_name: str,
-    project: Project = Depends(project_depend),
-    user: User = Depends(token_auth),
+    auth: Auth_Context = Depends(auth_context),
     db: Database = Depends(db_depend),
-    admin: bool = Depends(admin_auth),
-) -> None:
-    raise NotImplementedError
+) -> Project:
+    """Project of a task endpoint, loaded with that task only (the endpoints
+    check whether it exists)
+
+    Args:
+        project_name (str): name of the project
+        task_name (str): name of the task
+
+    Returns:
+        Project: project, with the task if there is one
+    """
+
+    # check if project exists
+    project = await db.get_project(project_name, task_name)
+
+    if project is None:
+        raise HTTPException(404, "Project not found")
+
+    # check if user has sufficient permissions to view project
+    if auth.user.username not in project.members and auth.admin is False:
+        raise HTTPException(403, "You are not a member of this project")
+
+    return project
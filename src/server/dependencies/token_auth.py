@@ -1,54 +1,65 @@
 from uuid import UUID
-from fastapi import HTTPException, Header, Depends
+from fastapi import HTTPException, Header, Depends, Request
 
-from ..models import User
+from ..models import User, Auth_Context
 from ..database import Database
 from .db_depend import db_depend
 
 
-def token_auth(token_uuid: UUID = Header(), db: Database = Depends(db_depend)) -> User:
-    """Token Authentification dependency, returns user data to be used by functions
+async def auth_context(
+    request: Request, token_uuid: UUID = Header(), db: Database = Depends(db_depend)
+) -> Auth_Context:
+    """Authentication context dependency. Resolves the session token to its user
+    with a single query. FastAPI caches it for the rest of the request, so
+    token_auth, admin_auth, project_depend and the logger all share the result
 
     Args:
-        token (UUID): User token in request header
+        token_uuid (UUID): User token in request header
 
     Returns:
-        user (User): User data from the database
+        Auth_Context: user, admin flag and session expiration
     """
 
-    # get token from database
-    token = db.get_token(token_uuid)
-    if token is None:
+    # get token and user from database
+    auth = await db.get_auth_context(token_uuid)
+    if auth is None:
         raise HTTPException(401, "Token not found")
 
-    # check if it's expired
-    if not token.check_alive():
-        db.delete_token(token_uuid)  # delete the expired token
+    # check if it's expired (mongo's TTL monitor deletes expired tokens, but
+    # it only runs every minute or so)
+    if not auth.token.check_alive():
         raise HTTPException(401, "Token is expired")
 
-    user = db.get_user(token.user_id)
-
-    if user is None:
+    if auth.user is None:
         raise HTTPException(500, "User not in database")
 
-    return user
+    # keep it on the request for the logger middleware
+    request.state.auth = auth
 
+    return auth
 
-def admin_auth(token_uuid: UUID = Header(), db: Database = Depends(db_depend)) -> bool:
-    """Dependency that checks if the user is an administrator or not
+
+async def token_auth(auth: Auth_Context = Depends(auth_context)) -> User:
+    """Token Authentification dependency, returns user data to be used by functions
 
     Args:
-        token_uuid (UUID, optional): _description_. Defaults to Header().
-        db (Database, optional): _description_. Defaults to Depends(db_depend).
+        auth (Auth_Context): authentication context of the request
 
-    Raises:
-        HTTPException: _description_
+    Returns:
+        user (User): User data from the database
     """
 
-    # no longer doing checks since it's already handled by token_auth
+    return auth.user
 
-    user_db = db.get_user_db(db.get_token(token_uuid).user_id)
 
-    if user_db.power != "admin":
-        return False
-    return True
+async def admin_auth(auth: Auth_Context = Depends(auth_context)) -> bool:
+    """Dependency that checks if the user is an administrator or not
+
+    Args:
+        auth (Auth_Context): authentication context of the request
+
+    Returns:
+        bool: True if the user is an admin
+    """
+
+    return auth.admin
@@ -0,0 +1,279 @@
+from abc import ABC, abstractmethod
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from typing import Awaitable, Callable
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Event(BaseModel):
+    """Change notification published on the event bus"""
+
+    type: str  # e.g. "project.updated", "task.completed", "member.added"
+    project: str  # name of the project that changed
+    members: list[str] = []  # usernames to notify of the change
+    data: dict = {}  # details, depending on the type
+
+
+Handler = Callable[[Event], Awaitable[None]]
+
+
+def type_matches(types: tuple[str], event_type: str) -> bool:
+    """Check an event type against a subscription's types. No types matches
+    everything, and a type ending with a dot matches a whole family (e.g.
+    "task." matches "task.added" and "task.completed")"""
+
+    if not types:
+        return True
+
+    for subscribed in types:
+        if subscribed == event_type:
+            return True
+        if subscribed.endswith(".") and event_type.startswith(subscribed):
+            return True
+    return False
+
+
+class Subscription:
+    """Bounded queue of events for a subscriber (e.g. an update stream). When
+    the subscriber falls behind, new events are dropped and counted, so it can
+    tell it missed some and resync"""
+
+    def __init__(self, types: tuple[str], member: str | None, maxsize: int) -> None:
+        self.types = types
+        self.member = member  # only events notifying this user, if set
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, event: Event) -> bool:
+        if self.member is not None and self.member not in event.members:
+            return False
+        return type_matches(self.types, event.type)
+
+    def deliver(self, event: Event) -> bool:
+        """Queue the event, False if the queue is full and it was dropped"""
+
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+
+# abstract EventBus class
+class EventBus(ABC):
+    """Publish/subscribe bus for change notifications. Should not be used in
+    itself, the backends below decide how events travel.
+
+    There are two kinds of subscribers:
+        - handlers are awaited by the process that publishes the event, once
+          per event (e.g. the notification writer)
+        - subscriptions get their own bounded queue and receive the events
+          published by every process the backend reaches (e.g. update streams)
+    """
+
+    backend: str = None
+
+    def __init__(self, maxsize: int = 100) -> None:
+        self.maxsize = maxsize  # events buffered per subscription
+
+        self._handlers: list[tuple[tuple[str], Handler]] = []
+        self._subscriptions: set[Subscription] = set()
+
+        # counters
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0  # handlers that raised
+        self.failed = 0  # events the backend could not send to other processes
+
+    def add_handler(self, handler: Handler, *types: str) -> None:
+        """Register a coroutine to await for every published event of the types
+
+        Args:
+            handler (Handler): coroutine function taking the event
+            *types (str): event types, all of them if none are given
+        """
+
+        self._handlers.append((types, handler))
+
+    def subscribe(self, *types: str, member: str | None = None) -> Subscription:
+        """Open a queue receiving the events of the types
+
+        Args:
+            *types (str): event types, all of them if none are given
+            member (str | None, optional): only events notifying this user
+
+        Returns:
+            Subscription: subscription, read events from its queue
+        """
+
+        subscription = Subscription(types, member, self.maxsize)
+        self._subscriptions.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    @abstractmethod
+    async def publish(self, event: Event) -> None:
+        """Run the handlers, then send the event to the subscriptions
+
+        Args:
+            event (Event): event to publish
+        """
+
+    async def start(self) -> None:
+        """Start receiving events from other processes (if the backend can)"""
+
+    async def stop(self) -> None:
+        """Stop receiving events from other processes"""
+
+    async def _run_handlers(self, event: Event) -> None:
+        # a failing handler must not stop the others, or the publisher
+        for types, handler in self._handlers:
+            if not type_matches(types, event.type):
+                continue
+            try:
+                await handler(event)
+            except Exception as error:
+                self.errors += 1
+                logger.error(f"Event handler failed on {event.type}: {error}")
+
+    def _deliver(self, event: Event) -> None:
+        for subscription in self._subscriptions:
+            if not subscription.matches(event):
+                continue
+            if subscription.deliver(event):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "subscriptions": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "failed": self.failed,
+        }
+
+
+# concrete EventBus classes
+class MemoryEventBus(EventBus):
+    """Event bus within a single server process, on asyncio queues"""
+
+    backend = "memory"
+
+    async def publish(self, event: Event) -> None:
+        self.published += 1
+        await self._run_handlers(event)
+        self._deliver(event)
+
+
+class RedisEventBus(EventBus):
+    """Event bus across several server processes, on a Redis pub/sub channel.
+    Handlers still only run in the publishing process, while every process
+    delivers the events to its own subscriptions"""
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        redis: Redis,
+        channel: str = "termsync:events",
+        maxsize: int = 100,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 30,
+    ) -> None:
+        super().__init__(maxsize)
+        self.redis = redis
+        self.channel = channel
+        self.retry_delay = retry_delay  # first wait before reconnecting, doubled
+        self.max_retry_delay = max_retry_delay  # on every failure up to this
+        self._listener: asyncio.Task | None = None
+
+    async def publish(self, event: Event) -> None:
+        self.published += 1
+        await self._run_handlers(event)
+
+        # delivered to the subscriptions by the listeners, this process included.
+        # the change is already written, so an unreachable redis must not fail
+        # the request: the event still reaches this process' subscriptions, and
+        # the notification handlers already ran for the other processes
+        try:
+            await self.redis.publish(self.channel, event.model_dump_json())
+        except RedisError as error:
+            self.failed += 1
+            logger.error(f"Could not publish {event.type} on {self.channel}: {error}")
+            self._deliver(event)
+
+    async def start(self) -> None:
+        if self._listener is not None:
+            return
+
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def stop(self) -> None:
+        if self._listener is None:
+            return
+
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
+
+    async def _listen(self, pubsub) -> None:
+        # reconnect until stopped, waiting longer after each failure in a row
+        delay = self.retry_delay
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    self._receive(message)
+            except RedisError as error:
+                logger.error(f"Lost {self.channel}: {error}")
+            finally:
+                await pubsub.aclose()
+
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                pubsub = self.redis.pubsub()
+                try:
+                    await pubsub.subscribe(self.channel)
+                    break
+                except RedisError as error:
+                    logger.error(f"Could not resubscribe to {self.channel}: {error}")
+                    await pubsub.aclose()
+
+            # events published while disconnected were lost, make the
+            # subscriptions resync as if they had dropped some
+            self._missed()
+            delay = self.retry_delay
+
+    def _receive(self, message: dict) -> None:
+        if message["type"] != "message":
+            return
+        try:
+            event = Event.model_validate_json(message["data"])
+        except ValueError as error:
+            self.errors += 1
+            logger.error(f"Invalid event on {self.channel}: {error}")
+            return
+        self._deliver(event)
+
+    def _missed(self) -> None:
+        for subscription in self._subscriptions:
+            subscription.dropped += 1
+            self.dropped += 1
@@ -1,14 +1,67 @@
 from fastapi import FastAPI, Request
-from uuid import UUID
-import logging
-import datetime
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+import time
+import os
 
 
-from .routers import helloworld, login, projects, users
-from .dependencies import token_auth, db_depend
+from .routers import admin, helloworld, login, metrics, projects, users
+from .dependencies import db_depend
+from .database import Database, RevisionConflict
+from .access_log import setup_access_log
+from .metrics import MetricsMiddleware, metrics as server_metrics
+from .db_calls import DBCallsMiddleware, DEBUG, DB_CALL_BUDGET
+from .compression import CompressionMiddleware
+
+# how often (seconds) to check the database indexes are still in place
+try:
+    INDEX_CHECK_INTERVAL = int(os.environ["INDEX_CHECK_INTERVAL"])
+except KeyError:
+    INDEX_CHECK_INTERVAL = 3600
+
+
+async def index_watchdog(db: Database, interval: int) -> None:
+    """Create the database indexes, then check on them every interval seconds"""
+
+    while True:
+        await db.ensure_indexes()
+        await asyncio.sleep(interval)
+
+
+async def upgrade_projects(db: Database) -> None:
+    """Bring projects written by older versions of the server up to date"""
+
+    await db.migrate_tasks()
+    await db.repair_progress(only_missing=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the background jobs with the app, and stop them on shutdown"""
+
+    db = await db_depend()
+    await db.events.start()
+    watchdog = asyncio.create_task(index_watchdog(db, INDEX_CHECK_INTERVAL))
+
+    # move the tasks of projects created before the task collection existed
+    # there, then add progress counters to projects created before they did
+    repair = asyncio.create_task(upgrade_projects(db))
+
+    # add users created before the search collection existed to it
+    search = asyncio.create_task(db.index_user_search(only_missing=True))
+    yield
+    watchdog.cancel()
+    repair.cancel()
+    search.cancel()
+
+    # let member notifications running in the background finish
+    await db.flush_notifications()
+    await db.events.stop()
+
 
 # initiate app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.title = "TermSync"
 app.description = "Server for novelty CLI project organizational tool"
 
@@ -17,51 +70,68 @@ app.include_router(users.router)
 app.include_router(helloworld.router)
 app.include_router(login.router)
 app.include_router(projects.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
 
-# setup logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-# logger formatter
-formatter = logging.Formatter(fmt="[%(asctime)s]: %(message)s")
+@app.exception_handler(RevisionConflict)
+async def revision_conflict(request: Request, error: RevisionConflict):
+    """A project write lost a race, or the client's If-Match copy is out of
+    date: 412 with the current revision, to reload from"""
+
+    return JSONResponse(
+        status_code=412,
+        content={"detail": "Project has been modified", "revision": error.revision},
+        headers={"ETag": error.etag},
+    )
+
+
+# brotli or gzip, as the client accepts. Added first, so it is the innermost
+# middleware and the others see the response as it is sent
+app.add_middleware(CompressionMiddleware)
+
+# request counts and latencies for /metrics
+app.add_middleware(MetricsMiddleware, metrics=server_metrics)
+
+# database calls per request, logged over the budget (and in headers in debug)
+app.add_middleware(DBCallsMiddleware, headers=DEBUG, budget=DB_CALL_BUDGET)
+
+# access log, written by a background thread
+try:
+    ACCESS_LOG_DIR = os.environ["ACCESS_LOG_DIR"]
+except KeyError:
+    ACCESS_LOG_DIR = "src/server/logs"
+
+access_logger, access_log_listener = setup_access_log(ACCESS_LOG_DIR)
 
 
 # add middleware
 @app.middleware("http")
 async def api_logger(request: Request, call_next):
 
-    # refresh date for file handler
-    file_handler = logging.FileHandler(
-        f"src/server/logs/{datetime.datetime.now().date()}.log"
-    )
-    file_handler.setFormatter(formatter)
-    logger.handlers = [file_handler]
-
     # get basic data from request
     log = {
         "url": request.url.path,
         "method": request.method,
     }
 
-    # try to get token if there is any
+    start = time.perf_counter()
     try:
-        log["token-uuid"] = request.headers["token-uuid"]
-
-        # convert token to username
-        username = token_auth(
-            token_uuid=UUID(log["token-uuid"]), db=db_depend()
-        ).username
-        log["username"] = username
-
-    except KeyError:
-        pass
-
-    # await response
-    response = await call_next(request)
-
-    # insert response status code into log
-    log["response-code"] = response.status_code
-
-    logger.info(log)
+        response = await call_next(request)
+        log["response-code"] = response.status_code
+    except Exception:
+        log["response-code"] = 500
+        raise
+    finally:
+        # time until the response starts (streamed bodies keep going after it)
+        log["latency-ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+        # get username from the request's authentication context (resolved by
+        # the endpoint's dependencies, so no extra database call is needed)
+        auth = getattr(request.state, "auth", None)
+        if auth is not None:
+            log["username"] = auth.user.username
+
+        access_logger.info(request.url.path, extra={"access": log})
 
     return response
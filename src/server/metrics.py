@@ -0,0 +1,279 @@
+from pymongo import monitoring
+from typing import Iterable
+import bisect
+import threading
+import time
+
+# latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """Counters and histograms for the /metrics endpoint.
+
+    Requests count on the event loop thread, but mongo commands are monitored
+    on motor's worker threads. To keep that lock-free, every thread counts
+    into its own shard, and the shards are only added up when the metrics are
+    collected (a lock is taken once per thread, to register its shard)
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._register_lock = threading.Lock()
+
+        self._help: dict[str, tuple[str, str]] = {}  # name -> (type, help)
+        self._buckets: dict[str, tuple[float]] = {}
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._register_lock:
+                self._shards.append(shard)
+        return shard
+
+    def counter(self, name: str, help: str) -> None:
+        self._help[name] = ("counter", help)
+
+    def gauge(self, name: str, help: str) -> None:
+        self._help[name] = ("gauge", help)
+
+    def histogram(
+        self, name: str, help: str, buckets: tuple[float] = LATENCY_BUCKETS
+    ) -> None:
+        self._help[name] = ("histogram", help)
+        self._buckets[name] = buckets
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1) -> None:
+        """Add to a counter (or a gauge, with a negative value to decrease it)
+
+        Args:
+            name (str): metric name
+            labels (tuple, optional): (label, value) pairs. Defaults to ().
+            value (float, optional): amount to add. Defaults to 1.
+        """
+
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        """Record a value in a histogram
+
+        Args:
+            name (str): metric name
+            labels (tuple): (label, value) pairs
+            value (float): observed value
+        """
+
+        shard = self._shard()
+        key = (name, labels)
+        buckets = self._buckets[name]
+        histogram = shard.get(key)
+        if histogram is None:
+            # a count per bucket (+Inf last), then the sum
+            histogram = shard[key] = [0] * (len(buckets) + 2)
+
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    def collect(self) -> dict:
+        """Add up the shards of every thread
+
+        Returns:
+            dict: (name, labels) -> value, or histogram list for histograms
+        """
+
+        totals = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                if isinstance(value, list):
+                    total = totals.setdefault(key, [0] * len(value))
+                    for i, count in enumerate(value):
+                        total[i] += count
+                else:
+                    totals[key] = totals.get(key, 0) + value
+
+        return totals
+
+    def render(self, extra: Iterable[tuple[str, tuple, float]] = ()) -> str:
+        """Prometheus text exposition of the metrics
+
+        Args:
+            extra (Iterable[tuple[str, tuple, float]], optional): values read
+            at collection time, as (name, labels, value). Defaults to ().
+
+        Returns:
+            str: metrics in the prometheus text format
+        """
+
+        samples: dict[str, list[tuple[tuple, float | list]]] = {}
+        for (name, labels), value in self.collect().items():
+            samples.setdefault(name, []).append((labels, value))
+        for name, labels, value in extra:
+            samples.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, help) in self._help.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(samples.get(name, [])):
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(
+                    (*self._buckets[name], "+Inf"), value[:-1], strict=True
+                ):
+                    cumulative += count
+                    bucket_labels = format_labels((*labels, ("le", str(bound))))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {value[-1]}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+
+    def escape(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests by route template and status, timing
+    them until the last byte of the response, and tracking requests in flight.
+    Routes are labelled by their template (e.g. /projects/{project_name}), so
+    the number of series stays bounded"""
+
+    def __init__(self, app, metrics: Metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        self.metrics.inc("http_requests_in_flight")
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.inc("http_requests_in_flight", value=-1)
+
+            # the router sets the matched route on the scope
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            labels = (("method", scope["method"]), ("route", path))
+
+            self.metrics.inc("http_requests_total", (*labels, ("status", str(status))))
+            self.metrics.observe(
+                "http_request_duration_seconds", labels, time.perf_counter() - start
+            )
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """pymongo command monitor counting and timing the database commands by
+    collection and command name (runs on motor's worker threads)"""
+
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+
+        # (connection, request id) -> collection, until the command finishes
+        self._collections: dict[tuple, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""  # e.g. ping, or aggregates on the database
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finished(self, event, outcome: str) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        labels = (("collection", collection), ("command", event.command_name))
+
+        self.metrics.inc("mongo_commands_total", (*labels, ("outcome", outcome)))
+        self.metrics.observe(
+            "mongo_command_duration_seconds", labels, event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event, "failure")
+
+
+def instrument_executor(framework, metrics: Metrics) -> None:
+    """Count the queued and busy database calls of motor's thread pool, by
+    wrapping the callables motor submits to it (through its framework's
+    run_on_executor), rather than reading the executor's internals
+
+    Args:
+        framework: motor framework module (e.g. motor.frameworks.asyncio)
+        metrics (Metrics): metrics to count into
+    """
+
+    run_on_executor = framework.run_on_executor
+    if getattr(run_on_executor, "instrumented", False):
+        return
+
+    pool = (("pool", "database"),)
+    metrics.inc("threadpool_queued", pool, 0)
+    metrics.inc("threadpool_busy", pool, 0)
+
+    def counted_run_on_executor(loop, fn, *args, **kwargs):
+        def job():
+            metrics.inc("threadpool_queued", pool, -1)
+            metrics.inc("threadpool_busy", pool)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.inc("threadpool_busy", pool, -1)
+
+        metrics.inc("threadpool_queued", pool)
+        return run_on_executor(loop, job)
+
+    counted_run_on_executor.instrumented = True
+    framework.run_on_executor = counted_run_on_executor
+
+
+# metrics of this server process
+metrics = Metrics()
+metrics.counter("http_requests_total", "HTTP requests by method, route and status")
+metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route"
+)
+metrics.gauge("http_requests_in_flight", "HTTP requests being handled")
+metrics.gauge("threadpool_busy", "Busy threads, by thread pool")
+metrics.gauge("threadpool_size", "Maximum threads, by thread pool")
+metrics.gauge("threadpool_queued", "Jobs waiting for a thread, by thread pool")
+metrics.counter(
+    "mongo_commands_total", "Mongo commands by collection, command and outcome"
+)
+metrics.histogram(
+    "mongo_command_duration_seconds", "Mongo command latency by collection and command"
+)
+metrics.counter("session_cache_hits_total", "Session cache hits")
+metrics.counter("session_cache_misses_total", "Session cache misses")
+metrics.gauge("session_cache_size", "Sessions in the session cache")
+metrics.counter("events_published_total", "Events published on the event bus")
+metrics.counter("events_dropped_total", "Events dropped by full subscriptions")
+metrics.counter(
+    "events_failed_total", "Events the bus could not send to other processes"
+)
@@ -1,4 +1,7 @@
 from .user import User, User_DB
 from .session_token import Token, Token_DB
+from .username_set import Username_Set
 from .task import Task, Discrete_Task, Milestone_Task
 from .project import Project
+from .auth_context import Auth_Context
+from .batch import Batch_Operation
@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+from .user import User
+from .session_token import Token_DB
+
+
+class Auth_Context(BaseModel):
+    """Authentication data of a request, resolved once from the session token:
+    the session, the user it belongs to and whether they are an admin"""
+
+    token: Token_DB
+    user: User | None = None  # None if the session's user no longer exists
+    admin: bool = False
+
+    @property
+    def expiration(self) -> datetime:
+        """Time when the session expires"""
+
+        return self.token.expiration
@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from typing import Literal
+
+from .task import Discrete_Task, Milestone_Task
+
+
+class Batch_Operation(BaseModel):
+    """One operation of a batch of project changes (POST /projects/{name}/batch).
+    The fields it needs depend on the operation"""
+
+    op: Literal[
+        "add_member",
+        "remove_member",
+        "add_moderator",
+        "remove_moderator",
+        "add_task",
+        "update_task",
+        "delete_task",
+        "set_completion",
+        "add_task_member",
+        "remove_task_member",
+    ]
+    username: str | None = None  # member, moderator and task member operations
+    task_name: str | None = None  # task operations, except add_task
+    task: Discrete_Task | Milestone_Task | None = None  # add_task and update_task
+    completion: bool | int | None = None  # set_completion
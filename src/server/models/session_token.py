@@ -1,7 +1,7 @@
 from __future__ import annotations
 from pydantic import BaseModel
 from uuid import uuid4, uuid5, UUID
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 
 
@@ -41,9 +41,10 @@ class Token(BaseModel):
         data = self.model_dump()
         data["token"] = str(self.token)
 
-        # calculate time when token expires
+        # calculate time when token expires (in UTC, which is what mongo's TTL
+        # monitor compares against)
         lifetime = timedelta(hours=72)
-        expiration = datetime.now() + lifetime
+        expiration = datetime.now(timezone.utc) + lifetime
 
         # return token
         return Token_DB(user_id=user_id, expiration=expiration, **data)
@@ -55,14 +56,15 @@ class Token_DB(Token):
     user_id: ObjectId
     token: str  # this is a string for proper storage in DB (pymongo didn't like UUIDs much)
 
-    # time when token expires (72 hours from creation)
+    # time when token expires (72 hours from creation, UTC). The sessions
+    # collection has a TTL index on it, so expired tokens get deleted by mongo
     expiration: datetime
 
     def check_alive(self) -> bool:
         """Method which checks if the token is still valid"""
 
-        # current time
-        now = datetime.now()
+        # current time (UTC, same as the expiration)
+        now = datetime.now(timezone.utc)
 
         # removing timezone info
         now = now.replace(tzinfo=None)
@@ -1,9 +1,10 @@
 from __future__ import annotations
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Annotated
 from bson import ObjectId
 
 from .user import User
+from .username_set import Username_Set
 
 
 # "abstract" Task class
@@ -12,11 +13,21 @@ class Task(BaseModel):
 
     name: str  # unique within project
     description: str | None = None
-    members: List[str] | None = []  # username
+    members: Username_Set | None = Field(default_factory=Username_Set)  # username
 
     def __eq__(self, other: Task) -> bool:
         return self.name == other.name
 
+    @property
+    def progress(self) -> list[int, int]:
+        """Task progress, as counted towards the project's progress
+
+        Returns:
+            list[int]: chores completed so far and overall chores
+        """
+
+        return [0, 0]
+
     def add_member(self, *members: str) -> bool:
         """Add members to the task
 
@@ -32,7 +43,7 @@ class Task(BaseModel):
             if member in self.members:
                 duplicates = True
                 continue
-            self.members.append(member)
+            self.members.add(member)
 
         # if everything went well, return true. if some users could not be added, return false
         if duplicates:
@@ -67,6 +78,10 @@ class Discrete_Task(Task):
 
     completed: bool = False
 
+    @property
+    def progress(self) -> list[int, int]:
+        return [int(self.completed), 1]
+
 
 class Milestone_Task(Task):
     """Task class based around milestone goals. Has completion percentage"""
@@ -74,6 +89,10 @@ class Milestone_Task(Task):
     milestones: int = 0
     completed: int = 0
 
+    @property
+    def progress(self) -> list[int, int]:
+        return [self.completed, self.milestones]
+
     @property
     def percentage_completed(self) -> int:
         """Calculate percentage of completion
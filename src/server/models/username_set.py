@@ -0,0 +1,61 @@
+from __future__ import annotations
+from collections.abc import MutableSet, Iterable, Iterator
+from pydantic import GetCoreSchemaHandler, GetJsonSchemaHandler
+from pydantic_core import core_schema
+
+
+class Username_Set(MutableSet):
+    """Set of usernames that keeps the order they were added in (members and
+    moderators of projects and tasks). Lookups, adds and removes are O(1),
+    backed by a dict, and it is validated from and serialized to a list, so
+    documents and responses look the same as with the lists it replaces"""
+
+    def __init__(self, usernames: Iterable[str] = ()) -> None:
+        self._usernames = dict.fromkeys(usernames)
+
+    def __contains__(self, username: object) -> bool:
+        return username in self._usernames
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._usernames)
+
+    def __len__(self) -> int:
+        return len(self._usernames)
+
+    def __eq__(self, other: object) -> bool:
+        # a list is equal if it has the same usernames in the same order
+        if isinstance(other, (list, tuple)):
+            return list(self._usernames) == list(other)
+        return super().__eq__(other)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self._usernames)!r})"
+
+    def add(self, username: str) -> None:
+        """Add a username at the end, if it is not in the set already"""
+
+        self._usernames[username] = None
+
+    def discard(self, username: str) -> None:
+        """Remove a username, if it is in the set"""
+
+        self._usernames.pop(username, None)
+
+    @classmethod
+    def __get_pydantic_core_schema__(
+        cls, source: type, handler: GetCoreSchemaHandler
+    ) -> core_schema.CoreSchema:
+        usernames = core_schema.list_schema(core_schema.str_schema())
+        return core_schema.no_info_after_validator_function(
+            cls,
+            usernames,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                list, return_schema=usernames
+            ),
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(
+        cls, schema: core_schema.CoreSchema, handler: GetJsonSchemaHandler
+    ) -> dict:
+        return {**handler(schema), "uniqueItems": True}
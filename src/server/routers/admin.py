@@ -0,0 +1,88 @@
+# global imports
+from fastapi import APIRouter, HTTPException, Depends
+
+# relative imports
+from ..models import User
+from ..database import Database
+from ..dependencies import db_depend, token_auth, admin_auth
+
+router = APIRouter()
+
+
+@router.get("/admin/indexes")
+async def get_indexes(
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
+    admin: bool = Depends(admin_auth),
+) -> dict:
+    """Report the state of the database indexes and how often each one is used
+    (must be an admin)
+
+    Returns:
+        dict: index report per collection
+    """
+
+    if admin is False:
+        raise HTTPException(401, "You must be an admin to use this command")
+
+    return await db.get_index_report()
+
+
+@router.get("/admin/cache")
+async def get_session_cache(
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
+    admin: bool = Depends(admin_auth),
+) -> dict:
+    """Report the session cache counters (must be an admin)
+
+    Returns:
+        dict: cache size, hits, misses, evictions and expirations
+    """
+
+    if admin is False:
+        raise HTTPException(401, "You must be an admin to use this command")
+
+    return db.session_cache.stats()
+
+
+@router.post("/admin/progress/repair")
+async def repair_progress(
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
+    admin: bool = Depends(admin_auth),
+) -> dict:
+    """Recompute the progress counters of every project from its tasks (must
+    be an admin). Tasks still embedded in project documents are moved to the
+    task collection first
+
+    Returns:
+        dict: API response
+    """
+
+    if admin is False:
+        raise HTTPException(401, "You must be an admin to use this command")
+
+    await db.migrate_tasks()
+    repaired = await db.repair_progress()
+
+    return {"detail": f"Repaired progress of {repaired} projects"}
+
+
+@router.get("/admin/events")
+async def get_event_bus(
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
+    admin: bool = Depends(admin_auth),
+) -> dict:
+    """Report the event bus counters of this server process (must be an admin)
+
+    Returns:
+        dict: backend, open subscriptions, events published, delivered and
+        dropped, failed handlers and events the backend could not send
+    """
+
+    if admin is False:
+        raise HTTPException(401, "You must be an admin to use this command")
+
+    return db.events.stats()
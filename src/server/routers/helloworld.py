@@ -10,7 +10,9 @@ router = APIRouter()
 
 
 @router.get("/")
-def hello(user: User = Depends(token_auth), admin: bool = Depends(admin_auth)) -> dict:
+async def hello(
+    user: User = Depends(token_auth), admin: bool = Depends(admin_auth)
+) -> dict:
     """Simple Hello World API call
 
     Returns:
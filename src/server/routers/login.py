@@ -10,7 +10,7 @@ router = APIRouter()
 
 
 @router.post("/login/")
-def login(
+async def login(
     username: str = Body(), password: str = Body(), db: Database = Depends(db_depend)
 ) -> Token:
     """Login endpoint
@@ -24,20 +24,20 @@ def login(
     """
 
     # find user data in database, then compare username and password provided
-    user_db = db.get_user_db(username)
+    user_db = await db.get_user_db(username)
 
     if user_db is None or password != user_db.password:
         raise HTTPException(401, "Incorrect username or password")
 
     # if the user already has a session token in the database, delete it
-    user_id = db.get_user_id(username)
-    token_query = db.get_token_by_user(user_id)
+    user_id = await db.get_user_id(username)
+    token_query = await db.get_token_by_user(user_id)
     if token_query is not None:
-        db.delete_token(token_query.token)
+        await db.delete_token(token_query.token)
 
     # generate token, then add it to database
     token = Token.generate(username)
-    rc = db.post_token(token, user_id)
+    rc = await db.post_token(token, user_id)
 
     if rc is False:
         raise HTTPException(500, "Could not log in")
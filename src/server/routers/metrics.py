@@ -0,0 +1,74 @@
+# global imports
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import PlainTextResponse
+from anyio.to_thread import current_default_thread_limiter
+import motor.frameworks.asyncio as motor_asyncio
+import os
+
+# relative imports
+from ..database import Database
+from ..dependencies import db_depend
+from ..metrics import metrics
+
+# if set, /metrics requires 'Authorization: Bearer <METRICS_TOKEN>' (prometheus'
+# bearer_token scrape option), otherwise it is open like most exporters
+try:
+    METRICS_TOKEN = os.environ["METRICS_TOKEN"]
+except KeyError:
+    METRICS_TOKEN = None
+
+router = APIRouter()
+
+
+def threadpool_metrics() -> list[tuple[str, tuple, float]]:
+    """Saturation of the thread pools read at collection time: the one running
+    sync endpoints and dependencies, and the size of the one motor runs the
+    database calls on"""
+
+    limiter = current_default_thread_limiter()
+    pool = (("pool", "endpoints"),)
+    samples = [
+        ("threadpool_busy", pool, limiter.borrowed_tokens),
+        ("threadpool_size", pool, limiter.total_tokens),
+        ("threadpool_queued", pool, limiter.statistics().tasks_waiting),
+    ]
+
+    # busy and queued database threads are counted around the calls motor runs
+    size = getattr(motor_asyncio, "max_workers", None)
+    if size is not None:
+        samples.append(("threadpool_size", (("pool", "database"),), size))
+
+    return samples
+
+
+@router.get("/metrics")
+async def get_metrics(
+    authorization: str | None = Header(None), db: Database = Depends(db_depend)
+) -> PlainTextResponse:
+    """Metrics of this server process, in the prometheus text format
+
+    Returns:
+        PlainTextResponse: request counts and latencies per route, requests in
+        flight, thread pool saturation, mongo command counts and latencies,
+        session cache and event bus counters
+    """
+
+    if METRICS_TOKEN is not None and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(401, "Invalid metrics token")
+
+    cache = db.session_cache.stats()
+    events = db.events.stats()
+
+    body = metrics.render(
+        [
+            *threadpool_metrics(),
+            ("session_cache_hits_total", (), cache["hits"]),
+            ("session_cache_misses_total", (), cache["misses"]),
+            ("session_cache_size", (), cache["size"]),
+            ("events_published_total", (), events["published"]),
+            ("events_dropped_total", (), events["dropped"]),
+            ("events_failed_total", (), events["failed"]),
+        ]
+    )
+
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -1,19 +1,132 @@
 # global imports
-from fastapi import APIRouter, HTTPException, Request, Depends, Body
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Request,
+    Response,
+    Depends,
+    Body,
+    Query,
+    Header,
+)
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from pydantic import ValidationError
+from bson import ObjectId
+from typing import AsyncIterator
+from uuid import UUID
+import asyncio
+import json
+import os
 
 
 # relative imports
-from ..models import Project, User, Discrete_Task, Milestone_Task
-from ..dependencies import token_auth, admin_auth, db_depend, project_depend
-from ..database import Database
+from ..models import (
+    Project,
+    User,
+    Discrete_Task,
+    Milestone_Task,
+    Auth_Context,
+    Batch_Operation,
+)
+from ..dependencies import (
+    token_auth,
+    admin_auth,
+    auth_context,
+    db_depend,
+    project_depend,
+    task_depend,
+)
+from ..database import Database, RevisionConflict
+from ..utils import encode_cursor, decode_cursor, ndjson_line, etag_matches
+
+
+# how often (seconds) an idle update stream sends a heartbeat, so clients can
+# tell a quiet connection from a dead one
+try:
+    UPDATE_HEARTBEAT_INTERVAL = float(os.environ["UPDATE_HEARTBEAT_INTERVAL"])
+except KeyError:
+    UPDATE_HEARTBEAT_INTERVAL = 15
+
+# most operations in one batch
+try:
+    BATCH_MAX_OPERATIONS = int(os.environ["BATCH_MAX_OPERATIONS"])
+except KeyError:
+    BATCH_MAX_OPERATIONS = 100
+
+
+# orjson renders large projects (thousands of tasks) several times faster
+router = APIRouter(default_response_class=ORJSONResponse)
+
+
+async def write_project(
+    db: Database,
+    write,
+    project: Project,
+    *args,
+    if_match: str | None = None,
+    commutative: bool = False,
+    task_name: str | None = None,
+    check=None,
+) -> any:
+    """Apply a write to a project, with optimistic concurrency. Writes only
+    apply to the revision of the project they were checked against: the one
+    in If-Match if the client sent it, otherwise the one just loaded. When
+    another write gets in first, commutative writes (e.g. adding a member) are
+    retried on the new revision, the others fail with 412. Writes to a single
+    task only need the client's copy of that task to be current
+
+    Args:
+        db (Database): database
+        write: Database method taking the project then args
+        project (Project): project, as loaded by the endpoint
+        *args: the write's other arguments
+        if_match (str | None, optional): If-Match header of the request
+        commutative (bool, optional): retry on conflicts. Defaults to False.
+        task_name (str | None, optional): task the write is limited to (the
+        project was loaded with only that task). Defaults to None.
+        check (optional): checks of the endpoint, run again on the reloaded
+        project before a retry (raising HTTPException if the write is not
+        allowed anymore)
+
+    Raises:
+        RevisionConflict: the project is not at the expected revision (412)
+        HTTPException: the project was deleted before a retry (404)
+
+    Returns:
+        any: return value of the write
+    """
+
+    if if_match is not None:
+        etag = db.project_etag(project)
+        if task_name is not None:
+            matches = db.task_etag_matches(if_match, project, task_name)
+        else:
+            matches = etag_matches(if_match, etag, weak=False)
+        if not matches:
+            raise RevisionConflict(project.revision, etag)
+        return await write(project, *args)
 
+    if not commutative:
+        return await write(project, *args)
 
-router = APIRouter()
+    result = await db.retry_on_conflict(
+        write, project, *args, check=check, task_name=task_name
+    )
+    if result is None:
+        raise HTTPException(404, "Project not found")  # deleted in the meantime
+
+    return result
+
+
+def check_member(project: Project, user: User, admin: bool) -> None:
+    """Membership check of project_depend, for projects reloaded by a retry"""
+
+    if user.username not in project.members and admin is False:
+        raise HTTPException(403, "You are not a member of this project")
 
 
 @router.post("/projects/")
-def add_project(
+async def add_project(
     project: Project,
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
@@ -28,73 +141,220 @@ def add_project(
     """
 
     # check if project already exists
-    if db.get_project(project.name) is not None:
+    if await db.get_project(project.name) is not None:
         raise HTTPException(403, "Project already exists")
 
     # add owner
     project.owner = user.username
-    project.members.append(user.username)
+    project.members.add(user.username)
 
     # ! DEPRECATED
     # convert usernames to ids
     # project.convert(db)
 
     # add project
-    response = db.add_project(project)
+    # the name is only claimed by the insert, it may have been taken since
+    response = await db.add_project(project)
     if response is False:
-        raise HTTPException(503, "Could not add project to database")
+        raise HTTPException(403, "Project already exists")
 
     # return project to client
     return {"detail": "Project created successfully"}
 
 
-@router.get("/projects/{project_name}")
-def get_project(
-    project: Project = Depends(project_depend), db: Database = Depends(db_depend)
-) -> Project:
-    """Get project from the database (projects can be viewed only by members or admins)
+@router.get("/projects/{project_name}", response_model=Project)
+async def get_project(
+    project_name: str,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    member: str | None = None,
+    if_none_match: str | None = Header(None),
+    auth: Auth_Context = Depends(auth_context),
+    db: Database = Depends(db_depend),
+) -> Response:
+    """Get project from the database (projects can be viewed only by members or admins).
+    The response carries an ETag, send it back in If-None-Match to get a 304
+    instead of the project if it has not changed since.
+
+    The tasks can be paged through, in the order they were added: with a
+    limit, the X-Next-Cursor response header holds the cursor of the next
+    page if there are more
 
     Args:
-        project_name(str): Taken by project_depend from URL. It returns the project if the user
-        can view it (is a member or admin)
-        project (Project): Project data returned by project_depend
+        project_name (str): name of the project
+        limit (int | None, optional): tasks per page. Defaults to all.
+        cursor (str | None, optional): cursor of the page to get. Defaults to
+        the first page.
+        member (str | None, optional): only the tasks of this member
+        if_none_match (str | None): ETag of the client's copy of the project
 
     Returns:
         Project: Project data
     """
 
-    # ! DEPRECATED
-    # convert ids to usernames
-    # project.render(db)
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor).get("task")
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        if not isinstance(after, str) or not ObjectId.is_valid(after):
+            raise HTTPException(400, "Invalid cursor")
+        after = ObjectId(after)
+
+    # a client with a copy only needs the ETag and members (for permissions),
+    # the project itself is loaded and validated only if it changed
+    if if_none_match is not None:
+        current = await db.get_project_etag(project_name)
+        if current is None:
+            raise HTTPException(404, "Project not found")
+
+        etag, members = current
+        if auth.user.username not in members and auth.admin is False:
+            raise HTTPException(403, "You are not a member of this project")
+
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+    # a page of the tasks, or all of them
+    if limit is None and after is None and member is None:
+        current = await db.get_project_with_etag(project_name)
+        if current is not None:
+            current = (*current, None)
+    else:
+        current = await db.get_project_page(project_name, after, limit, member)
+    if current is None:
+        raise HTTPException(404, "Project not found")
+
+    project, etag, following = current
+    if auth.user.username not in project.members and auth.admin is False:
+        raise HTTPException(403, "You are not a member of this project")
+
+    headers = {"ETag": etag}
+    if following is not None:
+        headers["X-Next-Cursor"] = encode_cursor({"task": str(following)})
+
+    # the project was just loaded into the model, so it is sent as it is
+    # instead of being validated again against the response model
+    return ORJSONResponse(project.model_dump(mode="json"), headers=headers)
+
+
+@router.get("/projects/{project_name}/changes")
+async def get_project_changes(
+    project_name: str,
+    response: Response,
+    since: int = Query(ge=0),
+    auth: Auth_Context = Depends(auth_context),
+    db: Database = Depends(db_depend),
+) -> dict:
+    """Changes made to a project since a revision, for clients keeping a copy.
+    Changes are patch operations ({"op": "set" | "add" | "remove", "path",
+    "value"}) to apply in order. If the change log does not go back far
+    enough, the whole project is sent as a snapshot instead
 
-    return project
+    Args:
+        project_name (str): name of the project
+        since (int): revision of the client's copy
+
+    Returns:
+        dict: {"revision", "changes"} or {"revision", "snapshot"}
+    """
+
+    current = await db.get_project_changes(project_name, since)
+    if current is None:
+        raise HTTPException(404, "Project not found")
+
+    members, etag, changes = current
+    if auth.user.username not in members and auth.admin is False:
+        raise HTTPException(403, "You are not a member of this project")
+
+    response.headers["ETag"] = etag
+    return changes
+
+
+async def project_list_ndjson(query, limit: int | None) -> AsyncIterator[str]:
+    """Project list as ndjson lines, written as they come out of the database
+    cursor. If the limit cuts the list short, the last line holds the cursor
+    of the next page"""
+
+    count = 0
+    name = None
+    async for project in query:
+        name = project["name"]
+        yield ndjson_line(
+            {
+                "name": name,
+                "progress": [project.get("done", 0), project.get("total", 0)],
+            }
+        )
+        count += 1
+
+    if count == limit:
+        yield ndjson_line({"next_cursor": encode_cursor({"name": name})})
 
 
 @router.get("/projects/all/")
-def get_all_projects(
-    user: User = Depends(token_auth), db: Database = Depends(db_depend)
+async def get_all_projects(
+    request: Request,
+    response: Response,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
 ) -> dict:
+    """Get the progress of the projects the user is a member of, ordered by
+    name. With a limit, the X-Next-Cursor response header holds the cursor of
+    the next page if there are more.
+
+    With 'Accept: application/x-ndjson' the projects are streamed instead, one
+    {"name", "progress"} object per line (the last line is {"next_cursor"} if
+    a limit cut the list short)
+
+    Args:
+        limit (int | None, optional): projects per page. Defaults to all.
+        cursor (str | None, optional): cursor of the page to get. Defaults to
+        the first page.
 
-    # get all projects user is a member of
-    query = db.get_all_project(user.username)
-    if query is None:
-        raise HTTPException(404, "Could not find any projects")
+    Returns:
+        dict: {project name: [done, total]}
+    """
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor).get("name")
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        if not isinstance(after, str):
+            raise HTTPException(400, "Invalid cursor")
+
+    # get the projects user is a member of
+    query = db.get_all_project(user.username, after=after, limit=limit)
+
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            project_list_ndjson(query, limit), media_type="application/x-ndjson"
+        )
+
+    # progress comes from the stored counters or the aggregation pipeline
+    projects = {}
+    async for project in query:
+        projects[project["name"]] = [project.get("done", 0), project.get("total", 0)]
 
-    response = {}
-    for project in query:
-        project = Project(**project)
-        response[project.name] = project.progress
+    if limit is not None and len(projects) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"name": list(projects)[-1]})
 
-    return response
+    return projects
 
 
 @router.put("/projects/{project_name}")
-def update_project(
+async def update_project(
     updated_project: Project,
     project: Project = Depends(project_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
     """Update project data (except name). Only the owner of the project or an admin can use this
 
@@ -115,7 +375,9 @@ def update_project(
         raise HTTPException(400, "Cannot modify project name")
 
     # modify project
-    request = db.update_project(project.name, updated_project)
+    request = await write_project(
+        db, db.update_project, project, updated_project, if_match=if_match
+    )
 
     if request is False:
         raise HTTPException(500, "Could not modify project")
@@ -124,7 +386,7 @@ def update_project(
 
 
 @router.delete("/projects/{project_name}")
-def delete_project(
+async def delete_project(
     project: Project = Depends(project_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
@@ -144,186 +406,257 @@ def delete_project(
         raise HTTPException(403, "Cannot delete a project you are not a owner of")
 
     # delete project
-    if db.delete_project(project.name) is False:
+    if await db.delete_project(project.name) is False:
         raise HTTPException(500, "could not delete project")
 
     return {"detail": "project deleted successfully"}
 
 
 @router.post("/projects/{project_name}/members/{member_username}")
-def add_project_member(
+async def add_project_member(
     member_username: str,
     project: Project = Depends(project_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
-    # check if user can add members to project
-    if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and admin is False
-    ):
-        raise HTTPException(403, "You cannot add members to this project")
+    def check(project: Project) -> None:
+        check_member(project, user, admin)
+
+        # check if user can add members to project
+        if (
+            project.role_of(user.username) not in ["owner", "moderator"]
+            and admin is False
+        ):
+            raise HTTPException(403, "You cannot add members to this project")
+
+        # check if member to add is already in project
+        if member_username in project.members:
+            raise HTTPException(400, "User already part of project")
 
-    # check if member to add is already in project
-    if member_username in project.members:
-        raise HTTPException(400, "User already part of project")
+    check(project)
 
     # check if member exists
-    if db.get_user(member_username) is None:
+    if await db.get_user(member_username) is None:
         raise HTTPException(404, "User does not exist")
 
     # add member to project
-    project.add_member(member_username)
-
-    if db.update_project(project.name, project) is False:
+    if (
+        await write_project(
+            db,
+            db.add_project_member,
+            project,
+            member_username,
+            if_match=if_match,
+            commutative=True,
+            check=check,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not add user to project")
 
     return {"detail": "User added to project successfully"}
 
 
 @router.delete("/projects/{project_name}/members/{member_username}")
-def remove_project_member(
+async def remove_project_member(
     member_username: str,
     project: Project = Depends(project_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
-    # check if user can remove members from project
-    if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and admin is False
-    ):
-        raise HTTPException(403, "You cannot remove members from this project")
+    def check(project: Project) -> None:
+        check_member(project, user, admin)
 
-    # check if member to remove is  in project
-    if member_username not in project.members:
-        raise HTTPException(404, "User is not part of the project")
+        # check if user can remove members from project
+        if (
+            project.role_of(user.username) not in ["owner", "moderator"]
+            and admin is False
+        ):
+            raise HTTPException(403, "You cannot remove members from this project")
 
-    # delete member
-    project.remove_member(member_username)
+        # check if member to remove is  in project
+        if member_username not in project.members:
+            raise HTTPException(404, "User is not part of the project")
+
+    check(project)
 
-    if db.update_project(project.name, project) is False:
+    # delete member
+    if (
+        await write_project(
+            db,
+            db.remove_project_member,
+            project,
+            member_username,
+            if_match=if_match,
+            commutative=True,
+            check=check,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not remove user from project")
 
     return {"detail": "User removed from project successfully"}
 
 
 @router.post("/projects/{project_name}/moderators/{member_username}")
-def add_project_moderator(
+async def add_project_moderator(
     member_username: str,
     project: Project = Depends(project_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
-    # check if user can add moderators to the project
-    if user.username != project.owner and admin is False:
-        raise HTTPException(403, "You cannot add moderators to this project")
+    def check(project: Project) -> None:
+        check_member(project, user, admin)
 
-    # check if user to be made moderator is part of project
-    if member_username not in project.members:
-        raise HTTPException(
-            404,
-            "User is not a member of the project. Add them before making them a moderator",
-        )
+        # check if user can add moderators to the project
+        if user.username != project.owner and admin is False:
+            raise HTTPException(403, "You cannot add moderators to this project")
 
-    # make user moderator
-    project.add_moderator(member_username)
+        # check if user to be made moderator is part of project
+        if member_username not in project.members:
+            raise HTTPException(
+                404,
+                "User is not a member of the project. Add them before making them a moderator",
+            )
+
+    check(project)
 
-    if db.update_project(project.name, project) is False:
+    # make user moderator
+    if (
+        await write_project(
+            db,
+            db.add_project_moderator,
+            project,
+            member_username,
+            if_match=if_match,
+            commutative=True,
+            check=check,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not make user a moderator")
 
     return {"detail": "Moderator added successfully"}
 
 
 @router.delete("/projects/{project_name}/moderators/{member_username}")
-def remove_project_moderator(
+async def remove_project_moderator(
     member_username: str,
     project: Project = Depends(project_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
-    # check if user can remove moderators from the project
-    if user.username != project.owner and admin is False:
-        raise HTTPException(403, "You cannot remove moderators from this project")
+    def check(project: Project) -> None:
+        check_member(project, user, admin)
 
-    # check if user to be demoted is a moderator
-    if member_username not in project.moderators:
-        raise HTTPException(
-            404,
-            "User is not a moderator in this project",
-        )
+        # check if user can remove moderators from the project
+        if user.username != project.owner and admin is False:
+            raise HTTPException(403, "You cannot remove moderators from this project")
 
-    # demote user
+        # check if user to be demoted is a moderator
+        if member_username not in project.moderators:
+            raise HTTPException(
+                404,
+                "User is not a moderator in this project",
+            )
 
-    project.remove_moderator(member_username)
+    check(project)
 
-    if db.update_project(project.name, project) is False:
+    # demote user
+    if (
+        await write_project(
+            db,
+            db.remove_project_moderator,
+            project,
+            member_username,
+            if_match=if_match,
+            commutative=True,
+            check=check,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not demote moderator")
 
     return {"detail": "User demoted successfully"}
 
 
 @router.post("/projects/{project_name}/tasks/")
-def add_task(
+async def add_task(
     project_name: str,
     task: Discrete_Task | Milestone_Task,
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
-    # check if project exists
-    project = db.get_project(project_name)
+    # check if project exists (only the task of the same name is loaded)
+    project = await db.get_project(project_name, task.name)
     if project is None:
         raise HTTPException(404, "Project not found")
 
-    # check if user can add task
+    def check(project: Project) -> None:
+        check_member(project, user, admin)
+
+        # check if user can add task
+        if (
+            project.role_of(user.username) not in ["owner", "moderator"]
+            and admin is False
+        ):
+            raise HTTPException(
+                403, "You are not authorized to add tasks to this project"
+            )
+
+    check(project)
+
+    # the task is only added if there is no task with the same name
     if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and admin is False
+        await write_project(
+            db,
+            db.add_task,
+            project,
+            task,
+            if_match=if_match,
+            commutative=True,
+            task_name=task.name,
+            check=check,
+        )
+        is False
     ):
-        raise HTTPException(403, "You are not authorized to add tasks to this project")
-
-    if project.add_task(task) is False:
         raise HTTPException(401, "Could not add task to project. Task already exists.")
 
-    if db.update_project(project_name, project) is False:
-        raise HTTPException(500, "Could not add task to project")
-
     return {"detail": "Task added successfully"}
 
 
 @router.put("/projects/{project_name}/tasks/{task_name}")
-def update_task(
+async def update_task(
     task_name: str,
     updated_task: Discrete_Task | Milestone_Task,
-    project: Project = Depends(project_depend),
+    project: Project = Depends(task_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
     # check if user has sufficient permissions to modify task
-    if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and admin is False
-    ):
+    if project.role_of(user.username) not in ["owner", "moderator"] and admin is False:
         raise HTTPException(403, "You cannot modify tasks within this project")
 
     # check if task exists
-    if task_name not in [task.name for task in project.tasks]:
+    if not project.has_task(task_name):
         raise HTTPException(404, "Task not found")
 
     # check if the user is trying to modify the name of the task
@@ -331,23 +664,31 @@ def update_task(
         raise HTTPException(406, "You cannot change the name of the task")
 
     # modify task
-    task_index = [task.name for task in project.tasks].index(task_name)
-
-    project.tasks[task_index] = updated_task
-
-    if db.update_project(project.name, project) is False:
+    if (
+        await write_project(
+            db,
+            db.update_task,
+            project,
+            task_name,
+            updated_task,
+            if_match=if_match,
+            task_name=task_name,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not modify task")
 
     return {"detail": "Task updated successfully"}
 
 
 @router.delete("/projects/{project_name}/tasks/{task_name}")
-def delete_task(
+async def delete_task(
     task_name: str,
-    project: Project = Depends(project_depend),
+    project: Project = Depends(task_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
     """Delete task from project
 
@@ -360,48 +701,51 @@ def delete_task(
     """
 
     # check if user has sufficient permissions to modify task
-    if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and admin is False
-    ):
+    if project.role_of(user.username) not in ["owner", "moderator"] and admin is False:
         raise HTTPException(403, "You cannot modify tasks within this project")
 
     # check if task exists
-    if task_name not in [task.name for task in project.tasks]:
+    if not project.has_task(task_name):
         raise HTTPException(404, "Task not found")
 
-    # delete task and update project
-    task_index = [task.name for task in project.tasks].index(task_name)
-    project.tasks.pop(task_index)
-
-    if db.update_project(project.name, project) is False:
+    # delete task, only as it was loaded (not retried, it may have been
+    # changed in between)
+    if (
+        await write_project(
+            db,
+            db.delete_task,
+            project,
+            task_name,
+            if_match=if_match,
+            task_name=task_name,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not delete task")
 
     return {"detail": "Task deleted successfully"}
 
 
 @router.put("/projects/{project_name}/tasks/{task_name}/completion")
-def update_task_completion(
+async def update_task_completion(
     task_name: str,
     completion: bool | int,
-    project: Project = Depends(project_depend),
+    project: Project = Depends(task_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
     # check if task exists
-    if task_name not in [task.name for task in project.tasks]:
+    task = project.get_task(task_name)
+    if task is None:
         raise HTTPException(404, "Task does not exist")
 
-    task_index = [task.name for task in project.tasks].index(task_name)
-
     # check if user can modify the task completion
     if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and user.username not in project.tasks[task_index].members
+        project.role_of(user.username, task_name)
+        not in ["owner", "moderator", "task member"]
         and admin is False
     ):
         raise HTTPException(
@@ -409,116 +753,508 @@ def update_task_completion(
         )
 
     # modify task completion
-    if type(project.tasks[task_index].completed) is not type(completion):
+    if type(task.completed) is not type(completion):
         raise HTTPException(400, "Wrong type of completion for task type")
 
-    project.tasks[task_index].completed = completion
-
-    if db.update_project(project.name, project) is False:
+    if (
+        await write_project(
+            db,
+            db.update_task_completion,
+            project,
+            task_name,
+            completion,
+            if_match=if_match,
+            task_name=task_name,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not update task completion")
 
     return {"detail": "Task completion updated successfully"}
 
 
 @router.post("/projects/{project_name}/tasks/{task_name}/members/{member_username}")
-def add_task_member(
+async def add_task_member(
     task_name: str,
     member_username: str,
-    project: Project = Depends(project_depend),
+    project: Project = Depends(task_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
-    # check if user can add a member
-    if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and admin is False
-    ):
-        raise HTTPException(
-            403, "You are not allowed to add members to tasks in this project"
-        )
-
-    # check if task exists
-    if task_name not in [task.name for task in project.tasks]:
-        raise HTTPException(404, "Task does not exist")
-
-    task_index = [task.name for task in project.tasks].index(task_name)
-
-    # check if member is part of the project
-    if member_username not in project.members:
-        raise HTTPException(
-            400,
-            "User is not part of the project. Add them as a member of the project first!",
-        )
+    def check(project: Project) -> None:
+        check_member(project, user, admin)
+
+        # check if user can add a member
+        if (
+            project.role_of(user.username) not in ["owner", "moderator"]
+            and admin is False
+        ):
+            raise HTTPException(
+                403, "You are not allowed to add members to tasks in this project"
+            )
+
+        # check if task exists
+        if not project.has_task(task_name):
+            raise HTTPException(404, "Task does not exist")
+
+        # check if member is part of the project
+        if member_username not in project.members:
+            raise HTTPException(
+                400,
+                "User is not part of the project. Add them as a member of the project first!",
+            )
+
+    async def add_task_member(project: Project) -> bool:
+        # nothing to do if they already are a member
+        if member_username in project.get_task(task_name).members:
+            return True
+        return await db.add_task_member(project, task_name, member_username)
+
+    check(project)
 
     # add member to task
-    project.tasks[task_index].add_member(member_username)
-
-    if db.update_project(project.name, project) is False:
+    if (
+        await write_project(
+            db,
+            add_task_member,
+            project,
+            if_match=if_match,
+            commutative=True,
+            task_name=task_name,
+            check=check,
+        )
+        is False
+    ):
         raise HTTPException(500, "Could not add user to task")
 
     return {"detail": "Member added to the task successfully"}
 
 
 @router.delete("/projects/{project_name}/tasks/{task_name}/members/{member_username}")
-def remove_task_member(
+async def remove_task_member(
     task_name: str,
     member_username: str,
-    project: Project = Depends(project_depend),
+    project: Project = Depends(task_depend),
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
     admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
 ) -> dict:
 
-    # check if user can remove a member
+    def check(project: Project) -> None:
+        check_member(project, user, admin)
+
+        # check if user can remove a member
+        if (
+            project.role_of(user.username) not in ["owner", "moderator"]
+            and admin is False
+        ):
+            raise HTTPException(
+                403, "You are not allowed to add members to tasks in this project"
+            )
+
+        # check if task exists
+        task = project.get_task(task_name)
+        if task is None:
+            raise HTTPException(404, "Task does not exist")
+
+        # check if member is part of the task
+        if member_username not in task.members:
+            raise HTTPException(
+                400,
+                "User is not part of the task",
+            )
+
+    check(project)
+
+    # remove user from task
     if (
-        user.username != project.owner
-        and user.username not in project.moderators
-        and admin is False
-    ):
-        raise HTTPException(
-            403, "You are not allowed to add members to tasks in this project"
+        await write_project(
+            db,
+            db.remove_task_member,
+            project,
+            task_name,
+            member_username,
+            if_match=if_match,
+            commutative=True,
+            task_name=task_name,
+            check=check,
         )
+        is False
+    ):
+        raise HTTPException(500, "Could not remove user from task")
 
-    # check if task exists
-    if task_name not in [task.name for task in project.tasks]:
-        raise HTTPException(404, "Task does not exist")
+    return {"detail": "User removed from task successfully"}
 
-    task_index = [task.name for task in project.tasks].index(task_name)
 
-    # check if member is part of the task
-    if member_username not in project.tasks[task_index].members:
-        raise HTTPException(
-            400,
-            "User is not part of the task",
+def apply_operation(
+    project: Project,
+    operation: Batch_Operation,
+    username: str,
+    owner: bool,
+    moderator: bool,
+    users: set[str],
+) -> tuple[str, list[dict]]:
+    """Apply one operation of a batch to the project, with the same checks as
+    the endpoint making that change on its own
+
+    Args:
+        project (Project): project, changed in place
+        operation (Batch_Operation): operation to apply
+        username (str): user making the batch
+        owner (bool): the user is the owner of the project or an admin
+        moderator (bool): the user can moderate the project (or is an admin)
+        users (set[str]): usernames of the batch that belong to a user
+
+    Raises:
+        HTTPException: the operation cannot be applied, the project is left
+        as it was
+
+    Returns:
+        tuple[str, list[dict]]: result message and the patch operations of
+        the change (for the change log)
+    """
+
+    op, member = operation.op, operation.username
+
+    # check the operation is complete
+    project_ops = ["add_member", "remove_member", "add_moderator", "remove_moderator"]
+    task_ops = ["add_task", "update_task", "delete_task", "set_completion"]
+    if member is None and op not in task_ops:
+        raise HTTPException(422, "Missing username")
+    if operation.task is None and op in ["add_task", "update_task"]:
+        raise HTTPException(422, "Missing task")
+    if operation.task_name is None and op not in [*project_ops, "add_task"]:
+        raise HTTPException(422, "Missing task name")
+    if operation.completion is None and op == "set_completion":
+        raise HTTPException(422, "Missing completion")
+
+    # project members and moderators
+    if op in ["add_moderator", "remove_moderator"] and owner is False:
+        raise HTTPException(403, "You cannot change the moderators of this project")
+
+    if op == "add_member":
+        if moderator is False:
+            raise HTTPException(403, "You cannot add members to this project")
+        if member in project.members:
+            raise HTTPException(400, "User already part of project")
+        if member not in users:
+            raise HTTPException(404, "User does not exist")
+
+        project.members.add(member)
+        return "User added to project successfully", [
+            {"op": "add", "path": ["members"], "value": member}
+        ]
+
+    if op == "remove_member":
+        if moderator is False:
+            raise HTTPException(403, "You cannot remove members from this project")
+        if member not in project.members:
+            raise HTTPException(404, "User is not part of the project")
+
+        project.members.remove(member)
+        return "User removed from project successfully", [
+            {"op": "remove", "path": ["members"], "value": member}
+        ]
+
+    if op == "add_moderator":
+        if member not in project.members:
+            raise HTTPException(
+                404,
+                "User is not a member of the project. Add them before making them a moderator",
+            )
+
+        if member in project.moderators:
+            return "Moderator added successfully", []
+        project.moderators.add(member)
+        return "Moderator added successfully", [
+            {"op": "add", "path": ["moderators"], "value": member}
+        ]
+
+    if op == "remove_moderator":
+        if member not in project.moderators:
+            raise HTTPException(404, "User is not a moderator in this project")
+
+        project.moderators.remove(member)
+        return "User demoted successfully", [
+            {"op": "remove", "path": ["moderators"], "value": member}
+        ]
+
+    # tasks
+    if op == "add_task":
+        if moderator is False:
+            raise HTTPException(
+                403, "You are not authorized to add tasks to this project"
+            )
+        if project.add_task(operation.task) is False:
+            raise HTTPException(400, "Task already exists")
+
+        return "Task added successfully", [
+            {"op": "add", "path": ["tasks"], "value": operation.task.model_dump()}
+        ]
+
+    task_name = operation.task_name
+    task = project.get_task(task_name)
+    if task is None:
+        raise HTTPException(404, "Task not found")
+
+    if op == "set_completion":
+        if moderator is False and username not in task.members:
+            raise HTTPException(
+                403, "You are not allowed to change the completion of this task"
+            )
+        if type(task.completed) is not type(operation.completion):
+            raise HTTPException(400, "Wrong type of completion for task type")
+
+        project.replace_task(
+            task_name, task.model_copy(update={"completed": operation.completion})
         )
+        return "Task completion updated successfully", [
+            {
+                "op": "set",
+                "path": ["tasks", task_name, "completed"],
+                "value": operation.completion,
+            }
+        ]
+
+    if moderator is False:
+        raise HTTPException(403, "You cannot modify tasks within this project")
 
-    # remove user from task
-    project.tasks[task_index].remove_member(member_username)
+    if op == "update_task":
+        if operation.task.name != task_name:
+            raise HTTPException(406, "You cannot change the name of the task")
+
+        project.replace_task(task_name, operation.task)
+        return "Task updated successfully", [
+            {
+                "op": "set",
+                "path": ["tasks", task_name],
+                "value": operation.task.model_dump(),
+            }
+        ]
+
+    if op == "delete_task":
+        project.pop_task(task_name)
+        return "Task deleted successfully", [
+            {"op": "remove", "path": ["tasks", task_name]}
+        ]
+
+    if op == "add_task_member":
+        if member not in project.members:
+            raise HTTPException(
+                400,
+                "User is not part of the project. Add them as a member of the project first!",
+            )
+
+        if member in task.members:
+            return "Member added to the task successfully", []
+        project.replace_task(
+            task_name, task.model_copy(update={"members": task.members | {member}})
+        )
+        return "Member added to the task successfully", [
+            {"op": "add", "path": ["tasks", task_name, "members"], "value": member}
+        ]
 
-    if db.update_project(project.name, project) is False:
-        raise HTTPException(500, "Could not remove user from task")
+    # remove_task_member
+    if member not in task.members:
+        raise HTTPException(400, "User is not part of the task")
 
-    return {"detail": "User removed from task successfully"}
+    project.replace_task(
+        task_name, task.model_copy(update={"members": task.members - {member}})
+    )
+    return "User removed from task successfully", [
+        {"op": "remove", "path": ["tasks", task_name, "members"], "value": member}
+    ]
+
+
+@router.post("/projects/{project_name}/batch")
+async def batch_project(
+    operations: list[Batch_Operation] = Body(max_length=BATCH_MAX_OPERATIONS),
+    project: Project = Depends(project_depend),
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
+    admin: bool = Depends(admin_auth),
+    if_match: str | None = Header(None),
+) -> list[dict]:
+    """Apply a list of operations to a project in one request: add/remove
+    member, add/remove moderator, add/update/delete task, set completion and
+    add/remove task member. Operations are applied in order, each with the
+    checks of its own endpoint, and written in a single update if they all
+    succeed. If one of them fails nothing is written, the answer is a 400
+    with the result of each operation
+
+    Args:
+        operations (list[Batch_Operation]): operations to apply, in order
+        project (Project): Project data returned by project_depend if user is a member of the project (or admin)
+
+    Raises:
+        HTTPException: one of the operations failed (400)
+
+    Returns:
+        list[dict]: result of each operation, {"status": http status code,
+        "detail": message}
+    """
+
+    # users the batch adds, looked up together
+    usernames = {
+        operation.username
+        for operation in operations
+        if operation.op == "add_member" and operation.username is not None
+    }
+    users = await db.get_existing_usernames(usernames)
+
+    async def batch(project: Project) -> list[dict]:
+        # permissions are checked once, against the project as loaded (or
+        # reloaded, when the batch is tried again)
+        check_member(project, user, admin)
+        role = project.role_of(user.username)
+        owner = role == "owner" or admin
+        moderator = owner or role == "moderator"
+
+        batched = project.model_copy(deep=True)
+        results = []
+        changes = []
+        for operation in operations:
+            # an operation that fails leaves the project as it was, the ones
+            # after it are still checked so their results can be sent
+            try:
+                detail, operation_changes = apply_operation(
+                    batched, operation, user.username, owner, moderator, users
+                )
+            except HTTPException as error:
+                results.append({"status": error.status_code, "detail": error.detail})
+                continue
+
+            results.append({"status": 200, "detail": detail})
+            changes += operation_changes
+
+        if any(result["status"] != 200 for result in results):
+            raise HTTPException(400, results)
+
+        if changes and await db.apply_batch(project, batched, changes) is False:
+            raise HTTPException(404, "Project not found")  # deleted in the meantime
+
+        return results
+
+    # a batch is checked again on the new revision when another write gets in
+    # first, like the changes it is made of
+    return await write_project(db, batch, project, if_match=if_match, commutative=True)
 
 
 @router.get("/update/projects")
-def update_projects(
+async def update_projects(
     user: User = Depends(token_auth), db: Database = Depends(db_depend)
 ) -> list:
 
-    user_data = db.get_user_db(user.username)
+    updated_projects = await db.pop_project_updates(user.username)
 
-    if user_data is None:
+    if updated_projects is None:
         raise HTTPException(404, "Could not find user")
 
-    updated_projects = user_data.update_projects
+    return updated_projects
 
-    user_data.update_projects = []
 
-    if db.update_user(user_data, user.username) is False:
-        raise HTTPException(500)
+def server_sent_event(event: str, data: any) -> str:
+    """Format a server-sent event"""
 
-    return updated_projects
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def session_alive(db: Database, auth: Auth_Context) -> bool:
+    """Check that the session of a long lived request still exists and belongs
+    to the same user (it is gone after logout, logging in again or deleting
+    the user). Served from the session cache most of the time
+
+    Args:
+        db (Database): database
+        auth (Auth_Context): authentication context of the request
+
+    Returns:
+        bool: True if the session is still valid
+    """
+
+    current = await db.get_auth_context(UUID(auth.token.token))
+    return (
+        current is not None
+        and current.user is not None
+        and current.user.username == auth.user.username
+        and current.token.check_alive()
+    )
+
+
+async def project_update_events(
+    db: Database, auth: Auth_Context, heartbeat: float = UPDATE_HEARTBEAT_INTERVAL
+) -> AsyncIterator[str]:
+    """Server-sent events for the user's project updates: first the updates
+    that piled up while they were away, then every update as it happens, with
+    a heartbeat when idle. The stream ends when the session expires or is
+    removed
+
+    Args:
+        db (Database): database
+        auth (Auth_Context): authentication context of the stream's request
+        heartbeat (float, optional): seconds between heartbeats when idle
+
+    Yields:
+        str: "update" events (list of project names) and "heartbeat" events
+    """
+
+    username = auth.user.username
+
+    # subscribe before reading the pending updates, so none fall in between
+    subscription = db.events.subscribe(member=username)
+    dropped = 0
+    try:
+        pending = await db.pop_project_updates(username)
+        yield server_sent_event("update", pending or [])
+
+        while await session_alive(db, auth):
+            try:
+                events = [await asyncio.wait_for(subscription.queue.get(), heartbeat)]
+            except asyncio.TimeoutError:
+                # events can also be missed without any arriving (e.g. the bus
+                # lost its connection), which is found out at the heartbeat
+                if subscription.dropped == dropped:
+                    yield server_sent_event("heartbeat", None)
+                    continue
+                events = []
+
+            if not await session_alive(db, auth):
+                break
+
+            # send everything that is already queued as one event
+            while not subscription.queue.empty():
+                events.append(subscription.queue.get_nowait())
+
+            if subscription.dropped > dropped:
+                # the stream fell behind and missed events, resync from the database
+                dropped = subscription.dropped
+                projects = await db.pop_project_updates(username) or []
+            else:
+                projects = list(dict.fromkeys(event.project for event in events))
+                await db.pop_project_updates(username, projects)
+
+            yield server_sent_event("update", projects)
+    finally:
+        db.events.unsubscribe(subscription)
+
+
+@router.get("/update/projects/stream")
+async def stream_project_updates(
+    auth: Auth_Context = Depends(auth_context), db: Database = Depends(db_depend)
+) -> StreamingResponse:
+    """Stream the user's project updates as server-sent events. Authenticates
+    once, replacing GET /update/projects polling
+
+    Returns:
+        StreamingResponse: text/event-stream of project updates
+    """
+
+    return StreamingResponse(
+        project_update_events(db, auth),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
@@ -1,18 +1,32 @@
 # global imports
-from fastapi import HTTPException, APIRouter, Body, Depends
+from fastapi import (
+    HTTPException,
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from typing import AsyncIterator
 
 # relative imports
 from ..models import User, User_DB, Token
 from ..database import Database
+from ..utils import encode_cursor, decode_cursor, ndjson_line, etag_matches
 
 from ..dependencies import db_depend, token_auth, admin_auth
 
 
-router = APIRouter()
+# orjson, the same response class as the projects router (user search pages
+# can be long lists)
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 @router.post("/users/")
-def create_user(
+async def create_user(
     user: User, password: str = Body(), db: Database = Depends(db_depend)
 ) -> Token:
     """Create user in the database and return a session token for that user
@@ -29,12 +43,12 @@ def create_user(
     # check if there already is a user with that username
     user_data = user.model_dump()
 
-    if db.get_user(user_data["username"]) is not None:
+    if await db.get_user(user_data["username"]) is not None:
         raise HTTPException(406, "Username already taken")
 
     # create appropriate class for the db then insert it
     user_db = User_DB(password=password, **user_data)
-    rc, user_id = db.post_user(user_db)
+    rc, user_id = await db.post_user(user_db)
 
     if rc is False:
         raise HTTPException(500, "Could not create user")
@@ -42,14 +56,14 @@ def create_user(
     # create session token and return it
     token = Token.generate(user_data["username"])
 
-    if db.post_token(token, user_id) is False:
+    if await db.post_token(token, user_id) is False:
         raise HTTPException(500, "Could not create session token")
 
     return token
 
 
 @router.delete("/users/{username}")
-def delete_user(
+async def delete_user(
     username: str,
     user: User = Depends(token_auth),
     password: str = Body(),
@@ -68,7 +82,7 @@ def delete_user(
     """
 
     # query = db.get_user_by_username(username)
-    user_db = db.get_user_db(username)
+    user_db = await db.get_user_db(username)
     if user_db is None:
         raise HTTPException(404, "Could not find user")
 
@@ -78,7 +92,7 @@ def delete_user(
     if password != user_db.password and admin is False:
         raise HTTPException(401, "Incorrect password")
 
-    rc = db.delete_user(username)
+    rc = await db.delete_user(username)
 
     if rc is False:
         raise HTTPException(500, "Could not delete user from database")
@@ -87,46 +101,119 @@ def delete_user(
 
 
 @router.get("/users/{username}")
-def get_user(
-    username: str, user: User = Depends(token_auth), db: Database = Depends(db_depend)
+async def get_user(
+    username: str,
+    response: Response,
+    if_none_match: str | None = Header(None),
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
 ) -> User:
-    """Call that returns user data by username
+    """Call that returns user data by username. The response carries an ETag,
+    send it back in If-None-Match to get a 304 if the user has not changed
 
     Args:
         username (str): exact username
+        if_none_match (str | None): ETag of the client's copy of the user
 
     Returns:
         User: User data
     """
 
-    # query = db.get_user_by_username(username)
-    query = db.get_user(username)
+    if if_none_match is not None:
+        etag = await db.get_user_etag(username)
+        if etag is None:
+            raise HTTPException(404, "User not found")
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+    query = await db.get_user_with_etag(username)
 
     if query is None:
         raise HTTPException(404, "User not found")
 
-    return query
+    user_data, etag = query
+    response.headers["ETag"] = etag
+    return user_data
+
+
+async def search_results_ndjson(
+    db: Database, search: str, limit: int | None, after: dict | None
+) -> AsyncIterator[str]:
+    """Search results as ndjson lines, written as they come out of the
+    database cursors. If the limit cuts the results short, the last line holds
+    the cursor of the next page"""
+
+    count = 0
+    position = None
+    async for username, position in db.iter_search_users(search, limit, after):
+        yield ndjson_line({"username": username})
+        count += 1
+
+    if count == limit:
+        yield ndjson_line({"next_cursor": encode_cursor(position)})
 
 
 @router.get("/users/")
-def search_users(
-    search: str, user: User = Depends(token_auth), db: Database = Depends(db_depend)
+async def search_users(
+    search: str,
+    request: Request,
+    response: Response,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    user: User = Depends(token_auth),
+    db: Database = Depends(db_depend),
 ) -> list[str]:
+    """Search users by username. Results are ranked (usernames starting with
+    the search first, then the ones containing it) and paginated: if there are
+    more, the X-Next-Cursor response header holds the cursor of the next page.
 
-    query = db.search_users(search)
+    With 'Accept: application/x-ndjson' the results are streamed instead, one
+    {"username"} object per line, all of them unless a limit is given (the
+    last line is then {"next_cursor"} if there are more)
 
-    if query is None:
-        raise HTTPException(404, "Could not find any users with that search")
+    Args:
+        search (str): text to search for, case insensitive
+        limit (int | None, optional): results per page, at most 100. Defaults
+        to 20 (everything when streaming).
+        cursor (str | None, optional): cursor of the page to get. Defaults to
+        the first page.
+
+    Returns:
+        list[str]: usernames
+    """
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        if after.get("phase") not in ("prefix", "substring") or not isinstance(
+            after.get("username"), str | None
+        ):
+            raise HTTPException(400, "Invalid cursor")
+
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            search_results_ndjson(db, search, limit, after),
+            media_type="application/x-ndjson",
+        )
+
+    if limit is None:
+        limit = 20
+    if limit > 100:
+        raise HTTPException(400, "Limit can be at most 100")
+
+    usernames, next_page = await db.search_users(search, limit, after)
 
-    response = []
-    for user in query:
-        response.append(user["username"])
+    if next_page is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_page)
 
-    return response
+    return usernames
 
 
 @router.put("/users/{username}")
-def update_user(
+async def update_user(
     username: str,
     user_data: User,
     user: User = Depends(token_auth),
@@ -151,17 +238,17 @@ def update_user(
         raise HTTPException(400, "You cannot change the username")
 
     # check if the user is in the database (useful for when an admin tries to change someone's data)
-    if db.get_user(username) is None:
+    if await db.get_user(username) is None:
         raise HTTPException(404, "User not found")
 
-    if db.update_user(user_data, username) is False:
+    if await db.update_user(user_data, username) is False:
         raise HTTPException(500, "Could not update user")
 
     return {"detail": "User updated successfully"}
 
 
 @router.post("/admin/{username}")
-def make_admin(
+async def make_admin(
     username: str,
     user: User = Depends(token_auth),
     db: Database = Depends(db_depend),
@@ -180,10 +267,10 @@ def make_admin(
         raise HTTPException(401, "You must be an admin to use this command")
 
     # check if user exists
-    if db.get_user(username) is None:
+    if await db.get_user(username) is None:
         raise HTTPException(404, "User does not exist")
 
-    if db.make_admin(username) is False:
+    if await db.make_admin(username) is False:
         raise HTTPException(500, "Could not make user an admin")
 
     return {"detail": "User promoted to admin successfully"}
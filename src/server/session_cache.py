@@ -0,0 +1,167 @@
+from collections import OrderedDict
+import time
+
+from .models import Auth_Context
+
+
+class SessionCache:
+    """Bounded LRU cache with a TTL, mapping session tokens to their
+    authentication context (user and power level), so that authenticating a
+    request does not need to query the database every time.
+
+    The cache lives inside a single server process. Invalidation only reaches
+    the process that made the change, so the TTL bounds how stale other
+    processes can be.
+
+    A lookup that missed reads the database before storing its result, and an
+    invalidation can happen in between. Every invalidation bumps the cache's
+    generation, so the lookup passes the generation it started at to set(),
+    which does not store the result if its user or token was invalidated since
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60, enabled: bool = True):
+        self.maxsize = maxsize  # maximum number of sessions kept
+        self.ttl = ttl  # seconds an entry is trusted for
+        self.enabled = enabled
+
+        # token -> (time of expiry, auth context), least recently used first
+        self._entries: OrderedDict[str, tuple[float, Auth_Context]] = OrderedDict()
+
+        # username -> tokens, to invalidate every session of a user
+        self._tokens_by_user: dict[str, set[str]] = {}
+
+        # ("user", username) or ("token", token) -> generation it was last
+        # invalidated at, oldest first and bounded like the entries. lookups
+        # older than the last record dropped can't be checked and aren't stored
+        self.generation = 0
+        self._invalidated: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self._forgotten = 0
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # entries dropped to make room
+        self.expirations = 0  # entries dropped because their TTL ran out
+
+    def get(self, token: str) -> Auth_Context | None:
+        """Get the cached authentication context of a token
+
+        Args:
+            token (str): session token
+
+        Returns:
+            Auth_Context | None: cached context, None if not cached or stale
+        """
+
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, auth = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return auth
+
+    def set(
+        self, token: str, auth: Auth_Context, generation: int | None = None
+    ) -> None:
+        """Cache the authentication context of a token
+
+        Args:
+            token (str): session token
+            auth (Auth_Context): context to cache
+            generation (int | None, optional): generation of the cache when the
+            context was read from the database, it is not stored if the token
+            or its user were invalidated since
+        """
+
+        if not self.enabled:
+            return
+
+        if generation is not None and self._stale(
+            generation, ("token", token), ("user", auth.user.username)
+        ):
+            return
+
+        if token in self._entries:
+            self._remove(token)
+
+        self._entries[token] = (time.monotonic() + self.ttl, auth)
+        self._tokens_by_user.setdefault(auth.user.username, set()).add(token)
+
+        # evict least recently used sessions
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, token: str) -> None:
+        """Drop a single session from the cache"""
+
+        self._invalidate(("token", token))
+        if token in self._entries:
+            self._remove(token)
+
+    def invalidate_user(self, username: str) -> None:
+        """Drop every session of a user from the cache"""
+
+        self._invalidate(("user", username))
+        for token in list(self._tokens_by_user.get(username, ())):
+            self._remove(token)
+
+    def clear(self) -> None:
+        """Drop every session from the cache"""
+
+        self.generation += 1
+        self._forgotten = self.generation
+        self._invalidated.clear()
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        """Cache counters
+
+        Returns:
+            dict: size, hits, misses, evictions and expirations
+        """
+
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _invalidate(self, key: tuple[str, str]) -> None:
+        self.generation += 1
+        self._invalidated.pop(key, None)
+        self._invalidated[key] = self.generation
+
+        while len(self._invalidated) > self.maxsize:
+            _, self._forgotten = self._invalidated.popitem(last=False)
+
+    def _stale(self, generation: int, *keys: tuple[str, str]) -> bool:
+        if generation < self._forgotten:
+            return True
+        return any(self._invalidated.get(key, 0) > generation for key in keys)
+
+    def _remove(self, token: str) -> None:
+        _, auth = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(auth.user.username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[auth.user.username]
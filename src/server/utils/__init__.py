@@ -1,3 +1,11 @@
 """Module containing all server utils"""
 
-from .utils import bson2dict, result_get_id, replace
+from .utils import (
+    bson2dict,
+    result_get_id,
+    replace,
+    encode_cursor,
+    decode_cursor,
+    ndjson_line,
+    etag_matches,
+)
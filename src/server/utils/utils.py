@@ -1,4 +1,6 @@
 from bson import json_util, BSON
+import base64
+import binascii
 import json
 import sys
 from uuid import UUID
@@ -41,3 +43,72 @@ def replace(list: list, value: any, replacement: any) -> None:
 
     index = list.index(value)
     list[index] = replacement
+
+
+def encode_cursor(position: dict) -> str:
+    """Encode a pagination position as an opaque, url safe cursor
+
+    Args:
+        position (dict): json serializable position (e.g. the last key sent)
+
+    Returns:
+        str: cursor
+    """
+
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor made by encode_cursor
+
+    Args:
+        cursor (str): cursor
+
+    Raises:
+        ValueError: the cursor is not one of ours
+
+    Returns:
+        dict: pagination position
+    """
+
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+
+    return position
+
+
+def ndjson_line(data: any) -> str:
+    """Format a newline delimited json (application/x-ndjson) line"""
+
+    return json.dumps(data) + "\n"
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    """Check an If-None-Match or If-Match header against the current ETag of
+    a resource
+
+    Args:
+        header (str | None): header sent by the client
+        etag (str): current ETag
+        weak (bool, optional): weak comparison, as RFC 9110 asks for
+        If-None-Match. If-Match needs a strong one, where weak tags never
+        match. Defaults to True.
+
+    Returns:
+        bool: True if the client's copy is current
+    """
+
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+
+    tags = [tag.strip() for tag in header.split(",")]
+    if weak:
+        return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+    return not etag.startswith("W/") and etag in tags
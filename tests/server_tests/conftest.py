@@ -0,0 +1,18 @@
+# global imports
+import os
+import pytest
+
+# send the X-DB-Calls headers, read by assert_max_db_calls (set before the app
+# is imported by the tests)
+os.environ.setdefault("DEBUG", "true")
+
+# relative imports
+from .db_calls import monitor_mock_commands
+
+
+@pytest.fixture(autouse=True, scope="session")
+def mock_db_calls():
+    """Count the calls to the mock databases as database commands"""
+
+    with monitor_mock_commands():
+        yield
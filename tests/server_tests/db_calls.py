@@ -0,0 +1,102 @@
+# global imports
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Iterator
+import functools
+import threading
+import time
+import httpx
+import mongomock.collection
+
+# relative imports
+from src.server.db_calls import db_call_listener
+
+# mongomock collection methods, and the command pymongo would send for them
+MOCK_COMMANDS = {
+    "find": "find",
+    "find_one": "find",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "distinct": "distinct",
+    "bulk_write": "bulkWrite",
+    "create_index": "createIndexes",
+    "create_indexes": "createIndexes",
+    "list_indexes": "listIndexes",
+}
+
+_nested = threading.local()
+
+
+def _monitored(method, command_name: str):
+    """Send the call of a mongomock method to the database call listener, like
+    pymongo does for real commands (mongomock methods calling each other
+    count once)"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(_nested, "depth", 0):
+            return method(self, *args, **kwargs)
+
+        event = SimpleNamespace(
+            command_name=command_name, command={command_name: self.name}
+        )
+        db_call_listener.started(event)
+        start = time.perf_counter()
+
+        _nested.depth = 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _nested.depth = 0
+            event.duration_micros = (time.perf_counter() - start) * 1e6
+            db_call_listener.succeeded(event)
+
+    return wrapper
+
+
+@contextmanager
+def monitor_mock_commands() -> Iterator[None]:
+    """mongomock does not go through pymongo's command monitoring, so count
+    its collection calls as the commands they stand for while in this block"""
+
+    originals = {
+        name: getattr(mongomock.collection.Collection, name) for name in MOCK_COMMANDS
+    }
+    for name, command_name in MOCK_COMMANDS.items():
+        setattr(
+            mongomock.collection.Collection,
+            name,
+            _monitored(originals[name], command_name),
+        )
+    try:
+        yield
+    finally:
+        for name, method in originals.items():
+            setattr(mongomock.collection.Collection, name, method)
+
+
+def assert_max_db_calls(response: httpx.Response, max_calls: int) -> None:
+    """Fail if the request of the response made more database calls than
+    max_calls (needs the X-DB-Calls header, sent in debug mode)
+
+    Args:
+        response (httpx.Response): response of the endpoint
+        max_calls (int): most database calls the endpoint should make
+    """
+
+    calls = int(response.headers["X-DB-Calls"])
+    request = response.request
+    assert calls <= max_calls, (
+        f"{request.method} {request.url.path} made {calls} database calls,"
+        f" expected at most {max_calls}"
+    )
@@ -0,0 +1,112 @@
+# global imports
+import datetime
+import json
+import logging
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+# relative imports
+from src.server.main import app
+from src.server.dependencies import db_depend
+from src.server.database import Database
+from src.server.access_log import setup_access_log, stop_access_log
+
+
+# mock database class
+class MockDatabase(Database):
+    def __init__(self) -> None:
+        super().__init__()
+        self.client = AsyncMongoMockClient()
+        self.db = self.client.tests
+
+
+# mock database instance
+db = MockDatabase()
+
+
+# mock dependency
+def db_depend_override() -> MockDatabase:
+    """Returns mock database instance"""
+
+    return db
+
+
+client = TestClient(app)
+
+
+class CaptureHandler(logging.Handler):
+    """Keeps the access records logged by the middleware"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record.access)
+
+
+def test_setup() -> None:
+    """Reset fastapi dependencies then override the ones used in this test"""
+
+    app.dependency_overrides = {}
+    app.dependency_overrides[db_depend] = db_depend_override
+
+
+def test_access_log_file(tmp_path) -> None:
+    """Records are written as json lines by the listener thread"""
+
+    logger, listener = setup_access_log(str(tmp_path), "test.access")
+    logger.info("/", extra={"access": {"url": "/", "response-code": 200}})
+    stop_access_log(listener)  # waits for the queue to be written
+
+    lines = (tmp_path / f"{datetime.date.today()}.log").read_text().splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert entry["url"] == "/"
+    assert entry["response-code"] == 200
+    assert "time" in entry
+
+
+def test_access_log_rotation(tmp_path) -> None:
+    """The log switches to a new file when the date changes"""
+
+    logger, listener = setup_access_log(str(tmp_path), "test.access")
+    file_handler = listener.handlers[0]
+    file_handler.date = datetime.date.today() - datetime.timedelta(days=1)
+    logger.info("/", extra={"access": {"url": "/"}})
+    stop_access_log(listener)
+
+    assert file_handler.date == datetime.date.today()
+    assert (tmp_path / f"{datetime.date.today()}.log").exists()
+
+
+def test_access_log_middleware() -> None:
+    """Requests are logged with their status, latency and username"""
+
+    token = client.post(
+        "/users/",
+        json={
+            "user": {"username": "loggeduser", "full_name": "logged user"},
+            "password": "password",
+        },
+    ).json()["token"]
+
+    capture = CaptureHandler()
+    logger = logging.getLogger("termsync.access")
+    logger.addHandler(capture)
+    try:
+        client.get("/", headers={"token-uuid": token})
+        client.get("/", headers={"token-uuid": "00000000-0000-0000-0000-000000000000"})
+    finally:
+        logger.removeHandler(capture)
+
+    authenticated, anonymous = capture.records
+    assert authenticated["url"] == "/"
+    assert authenticated["method"] == "GET"
+    assert authenticated["response-code"] == 200
+    assert authenticated["username"] == "loggeduser"
+    assert authenticated["latency-ms"] >= 0
+    assert "token-uuid" not in authenticated
+
+    assert anonymous["response-code"] == 401
+    assert "username" not in anonymous
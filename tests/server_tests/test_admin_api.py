@@ -0,0 +1,197 @@
+import asyncio
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from src.server.main import app
+from src.server.models import User
+from src.server.dependencies import db_depend
+from src.server.database import Database, INDEXES
+
+
+# mock database class
+class MockDatabase(Database):
+    def __init__(self) -> None:
+        super().__init__()
+        self.client = AsyncMongoMockClient()
+        self.db = self.client.tests
+
+
+# mock database instance
+db = MockDatabase()
+
+
+# mock dependency
+def db_depend_override() -> MockDatabase:
+    """Returns mock database instance"""
+
+    return db
+
+
+client = TestClient(app)
+
+# mock users
+user = User(username="mockuser", full_name="fullname")
+admin_user = User(username="adminuser", full_name="admin user")
+
+
+def test_setup() -> None:
+    """Reset fastapi dependencies then override the ones used in this test and create mock users"""
+
+    app.dependency_overrides = {}
+    app.dependency_overrides[db_depend] = db_depend_override
+
+    global token
+    token = client.post(
+        "/users/", json={"user": user.model_dump(), "password": "password"}
+    ).json()["token"]
+
+    global admin_token
+    admin_token = client.post(
+        "/users/", json={"user": admin_user.model_dump(), "password": "password"}
+    ).json()["token"]
+
+    # make admin_user an admin
+    db.db.delegate.users.update_one(
+        {"username": admin_user.username}, {"$set": {"power": "admin"}}
+    )
+
+
+def test_missing_indexes() -> None:
+    """The report lists every expected index as missing before they are created"""
+
+    response = client.get(
+        "/admin/indexes",
+        headers={"content-type": "application/json", "token-uuid": admin_token},
+    )
+
+    assert response.status_code == 200
+    for collection, indexes in INDEXES.items():
+        assert response.json()[collection]["missing"] == [
+            index.document["name"] for index in indexes
+        ]
+
+
+def test_ensure_indexes() -> None:
+    """Create the indexes, then check the report (calling it twice must be harmless)"""
+
+    assert asyncio.run(db.ensure_indexes())
+    assert asyncio.run(db.ensure_indexes())
+
+    response = client.get(
+        "/admin/indexes",
+        headers={"content-type": "application/json", "token-uuid": admin_token},
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    for collection in INDEXES:
+        assert report[collection]["missing"] == []
+
+    assert report["users"]["indexes"]["username_1"]["unique"] is True
+    assert report["projects"]["indexes"]["name_1"]["unique"] is True
+    assert report["sessions"]["indexes"]["token_1"]["unique"] is True
+    assert report["sessions"]["indexes"]["expiration_1"]["expireAfterSeconds"] == 0
+
+
+def test_indexes_not_admin() -> None:
+    """Try to get the index report as a regular user"""
+
+    response = client.get(
+        "/admin/indexes",
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "You must be an admin to use this command"
+
+
+def test_session_cache_stats() -> None:
+    """Get the session cache counters as an admin"""
+
+    response = client.get(
+        "/admin/cache",
+        headers={"content-type": "application/json", "token-uuid": admin_token},
+    )
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["enabled"] is True
+    assert stats["hits"] > 0  # the admin token was used by the previous tests
+    assert stats["size"] == 2  # both mock users' sessions
+
+
+def test_session_cache_stats_not_admin() -> None:
+    """Try to get the session cache counters as a regular user"""
+
+    response = client.get(
+        "/admin/cache",
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "You must be an admin to use this command"
+
+
+def test_repair_progress() -> None:
+    """Recompute project progress counters as an admin"""
+
+    # project created before the counters existed
+    db.db.delegate.projects.insert_one(
+        {
+            "name": "old project",
+            "members": [admin_user.username],
+            "tasks": [{"name": "task", "milestones": 4, "completed": 3}],
+        }
+    )
+
+    response = client.post(
+        "/admin/progress/repair",
+        headers={"content-type": "application/json", "token-uuid": admin_token},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["detail"] == "Repaired progress of 1 projects"
+
+    response = client.get(
+        "/projects/all/",
+        headers={"content-type": "application/json", "token-uuid": admin_token},
+    )
+
+    assert response.json() == {"old project": [3, 4]}
+
+
+def test_repair_progress_not_admin() -> None:
+    """Try to recompute project progress counters as a regular user"""
+
+    response = client.post(
+        "/admin/progress/repair",
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "You must be an admin to use this command"
+
+
+def test_event_bus_stats() -> None:
+    """Get the event bus counters as an admin"""
+
+    response = client.get(
+        "/admin/events",
+        headers={"content-type": "application/json", "token-uuid": admin_token},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["backend"] == "memory"
+    assert response.json()["errors"] == 0
+
+
+def test_event_bus_stats_not_admin() -> None:
+    """Try to get the event bus counters as a regular user"""
+
+    response = client.get(
+        "/admin/events",
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "You must be an admin to use this command"
@@ -0,0 +1,210 @@
+# global imports
+import asyncio
+import brotli
+import gzip
+import json
+import zlib
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+# relative imports
+from src.server.main import app
+from src.server.models import Project, Discrete_Task
+from src.server.dependencies import db_depend
+from src.server.database import Database
+from src.server.compression import CompressionMiddleware, choose_encoding
+
+
+# mock database class
+class MockDatabase(Database):
+    def __init__(self) -> None:
+        super().__init__()
+        self.client = AsyncMongoMockClient()
+        self.db = self.client.tests
+
+
+# mock database instance
+db = MockDatabase()
+
+
+# mock dependency
+def db_depend_override() -> MockDatabase:
+    """Returns mock database instance"""
+
+    return db
+
+
+client = TestClient(app)
+
+# project large enough to be compressed
+mockproject = Project(
+    name="compressed project",
+    tasks=[
+        Discrete_Task(name=f"task {i}", description="a task to compress")
+        for i in range(100)
+    ],
+)
+
+
+def test_setup() -> None:
+    """Reset fastapi dependencies then override the ones used in this test"""
+
+    app.dependency_overrides = {}
+    app.dependency_overrides[db_depend] = db_depend_override
+
+    global token
+    token = client.post(
+        "/users/",
+        json={
+            "user": {"username": "compressionuser", "full_name": "compression user"},
+            "password": "password",
+        },
+    ).json()["token"]
+
+    response = client.post(
+        "/projects/", json=mockproject.model_dump(), headers={"token-uuid": token}
+    )
+    assert response.status_code == 200
+
+
+def test_choose_encoding() -> None:
+    """The encoding is negotiated from Accept-Encoding"""
+
+    assert choose_encoding("gzip, deflate, br") == "br"
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    assert choose_encoding("br;q=0, gzip;q=0") is None
+    assert choose_encoding("*") == "br"
+    assert choose_encoding("*, br;q=0") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+
+
+def test_compressed_project() -> None:
+    """Large responses are compressed with the encoding the client prefers"""
+
+    url = f"/projects/{mockproject.name}"
+    expected = client.get(url, headers={"token-uuid": token}).json()
+
+    for encoding, decompress in [("br", brotli.decompress), ("gzip", gzip.decompress)]:
+        # stream, so the client does not decode the body
+        with client.stream(
+            "GET", url, headers={"token-uuid": token, "accept-encoding": encoding}
+        ) as response:
+            body = b"".join(response.iter_raw())
+
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) == len(body)
+        assert json.loads(decompress(body)) == expected
+
+    response = client.get(
+        url, headers={"token-uuid": token, "accept-encoding": "identity"}
+    )
+    assert "content-encoding" not in response.headers
+    assert response.json() == expected
+
+
+def test_compressed_etag() -> None:
+    """Compressed bodies get their own ETag, which the conditional requests of
+    the project still accept"""
+
+    url = f"/projects/{mockproject.name}"
+    response = client.get(
+        url, headers={"token-uuid": token, "accept-encoding": "identity"}
+    )
+    etag = response.headers["etag"]
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    for encoding in ["br", "gzip"]:
+        headers = {"token-uuid": token, "accept-encoding": encoding}
+        response = client.get(url, headers=headers)
+        encoded_etag = response.headers["etag"]
+        assert encoded_etag == f'{etag[:-1]}-{encoding}"'
+
+        # the 304 confirms the copy in the encoding the client has
+        response = client.get(url, headers={**headers, "if-none-match": encoded_etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == encoded_etag
+
+        response = client.get(url, headers={**headers, "if-none-match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+
+    # writes accept the ETag of a compressed copy as well
+    response = client.get(url, headers={"token-uuid": token, "accept-encoding": "br"})
+    project = response.json()
+    project["description"] = "described from a compressed copy"
+    response = client.put(
+        url,
+        json=project,
+        headers={"token-uuid": token, "if-match": response.headers["etag"]},
+    )
+    assert response.status_code == 200
+
+
+def test_small_response() -> None:
+    """Responses under the threshold are sent as they are"""
+
+    response = client.get(
+        "/", headers={"token-uuid": token, "accept-encoding": "gzip, br"}
+    )
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_streamed_response() -> None:
+    """Streamed bodies are compressed chunk by chunk, event streams are not"""
+
+    chunks = [f"line {i}\n".encode() * 50 for i in range(3)]
+
+    def stream_app(media_type: str):
+        async def asgi(scope, receive, send) -> None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", media_type.encode())],
+                }
+            )
+            for i, chunk in enumerate(chunks):
+                more_body = i < len(chunks) - 1
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": more_body,
+                    }
+                )
+
+        return asgi
+
+    async def get(media_type: str) -> list[dict]:
+        sent = []
+
+        async def send(message) -> None:
+            sent.append(message)
+
+        middleware = CompressionMiddleware(stream_app(media_type), minimum_size=1024)
+        scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+        await middleware(scope, None, send)
+        return sent
+
+    start, *body = asyncio.run(get("application/x-ndjson"))
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+
+    # every chunk is flushed, so it can be decoded as soon as it arrives
+    decompressor = zlib.decompressobj(31)
+    for chunk, message in zip(chunks, body):
+        assert decompressor.decompress(message["body"]) == chunk
+    assert gzip.decompress(b"".join(message["body"] for message in body)) == b"".join(
+        chunks
+    )
+
+    start, *body = asyncio.run(get("text/event-stream"))
+    assert b"content-encoding" not in dict(start["headers"])
+    assert [message["body"] for message in body] == chunks
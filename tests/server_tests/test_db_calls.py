@@ -0,0 +1,181 @@
+# global imports
+import logging
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+# relative imports
+from src.server.main import app
+from src.server.models import User, Project, Discrete_Task
+from src.server.dependencies import db_depend
+from src.server.database import Database
+from src.server.db_calls import DBCallsMiddleware
+from .db_calls import assert_max_db_calls
+
+
+# mock database class
+class MockDatabase(Database):
+    def __init__(self) -> None:
+        super().__init__()
+        self.client = AsyncMongoMockClient()
+        self.db = self.client.tests
+
+
+# mock database instance
+db = MockDatabase()
+
+
+# mock dependency
+def db_depend_override() -> MockDatabase:
+    """Returns mock database instance"""
+
+    return db
+
+
+# init client
+client = TestClient(app)
+
+# mock users
+user1 = User(username="dbcallsuser1", full_name="fullname1")  # project owner
+user2 = User(username="dbcallsuser2", full_name="fullname2")  # project member
+user3 = User(username="dbcallsuser3", full_name="fullname3")  # not a member
+
+# mock project
+mockproject = Project(
+    name="db calls project",
+    description="this is a mock project",
+    members=[user2.username],
+)
+
+mock_task = Discrete_Task(name="Mock Task", description="This is a mock task")
+
+
+def test_setup() -> None:
+    """Reset fastapi dependencies then override the ones used in this test and create mock users"""
+
+    app.dependency_overrides = {}
+    app.dependency_overrides[db_depend] = db_depend_override
+
+    global token1
+    token1 = client.post(
+        "/users/", json={"user": user1.model_dump(), "password": "password"}
+    ).json()["token"]
+
+    global token2
+    token2 = client.post(
+        "/users/", json={"user": user2.model_dump(), "password": "password"}
+    ).json()["token"]
+
+    client.post("/users/", json={"user": user3.model_dump(), "password": "password"})
+
+    response = client.post(
+        "/projects/", json=mockproject.model_dump(), headers={"token-uuid": token1}
+    )
+    assert response.status_code == 200
+
+
+def test_headers() -> None:
+    """Responses carry the number of database calls and their time"""
+
+    response = client.get("/", headers={"token-uuid": token1})
+
+    assert response.status_code == 200
+    assert int(response.headers["X-DB-Calls"]) >= 0
+    assert float(response.headers["X-DB-Time-ms"]) >= 0
+
+
+def test_project_endpoints() -> None:
+    """Project endpoints stay within their database call budgets"""
+
+    headers = {"token-uuid": token1}
+    project = f"/projects/{mockproject.name}"
+    task = f"{project}/tasks/{mock_task.name}"
+
+    for method, url, json, max_calls in [
+        ("get", project, None, 2),
+        ("get", "/projects/all/", None, 1),
+        ("post", f"{project}/members/{user3.username}", None, 6),
+        ("delete", f"{project}/members/{user3.username}", None, 5),
+        ("post", f"{project}/moderators/{user2.username}", None, 5),
+        ("post", f"{project}/tasks/", mock_task.model_dump(), 6),
+        ("put", f"{task}/completion?completion=true", None, 6),
+        ("post", f"{task}/members/{user2.username}", None, 6),
+        ("delete", task, None, 6),
+        (
+            "post",
+            f"{project}/batch",
+            [
+                {"op": "add_member", "username": user3.username},
+                {"op": "add_task", "task": mock_task.model_dump()},
+                {
+                    "op": "add_task_member",
+                    "task_name": mock_task.name,
+                    "username": user3.username,
+                },
+                {"op": "delete_task", "task_name": mock_task.name},
+                {"op": "remove_member", "username": user3.username},
+            ],
+            6,
+        ),
+        ("get", "/update/projects", None, 1),
+    ]:
+        response = client.request(method, url, json=json, headers=headers)
+
+        assert response.status_code == 200
+        assert_max_db_calls(response, max_calls)
+
+
+def test_user_endpoints() -> None:
+    """User endpoints stay within their database call budgets"""
+
+    headers = {"token-uuid": token2}
+
+    for method, url, json, max_calls in [
+        ("get", "/", None, 1),
+        ("get", f"/users/{user1.username}", None, 1),
+        ("get", "/users/?search=dbcalls", None, 3),
+        ("post", "/login/", {"username": user2.username, "password": "password"}, 5),
+    ]:
+        response = client.request(method, url, json=json, headers=headers)
+
+        assert response.status_code == 200
+        assert_max_db_calls(response, max_calls)
+
+
+def test_budget_log(caplog) -> None:
+    """Requests going over the budget are logged with their commands"""
+
+    budget_app = FastAPI()
+    budget_app.add_middleware(DBCallsMiddleware, budget=4)
+    budget_app.dependency_overrides[db_depend] = db_depend_override
+
+    @budget_app.get("/members/{project_name}")
+    async def get_members(project_name: str, db: Database = Depends(db_depend)):
+        # one query per member, the pattern the budget is there to catch
+        project = await db.get_project(project_name)
+        return [await db.get_user(member) for member in project.members]
+
+    budget_client = TestClient(budget_app)
+    with caplog.at_level(logging.WARNING, logger="src.server.db_calls"):
+        response = budget_client.get(f"/members/{mockproject.name}")
+
+    assert response.status_code == 200
+    assert "X-DB-Calls" not in response.headers
+    assert caplog.messages == []
+
+    # one more member makes the member queries go over the budget
+    client.post(
+        f"/projects/{mockproject.name}/members/{user3.username}",
+        headers={"token-uuid": token1},
+    )
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="src.server.db_calls"):
+        response = budget_client.get(f"/members/{mockproject.name}")
+
+    assert response.status_code == 200
+    assert len(caplog.messages) == 1
+    assert caplog.messages[0].startswith(
+        "GET /members/{project_name} made 5 database calls (budget 4)"
+    )
+    assert "users.find x3" in caplog.messages[0]
@@ -0,0 +1,208 @@
+# global imports
+import asyncio
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import ConnectionError
+
+# relative imports
+from src.server.events import Event, MemoryEventBus, RedisEventBus
+
+
+def mock_event(event_type: str = "project.updated", *members: str) -> Event:
+    return Event(type=event_type, project="mock project", members=list(members))
+
+
+def test_handlers() -> None:
+    """Handlers are awaited for the event types they registered for"""
+
+    async def run() -> None:
+        bus = MemoryEventBus()
+        handled = []
+
+        async def handler(event: Event) -> None:
+            handled.append(event.type)
+
+        bus.add_handler(handler, "task.", "member.added")
+        for event_type in [
+            "task.added",
+            "task.completed",
+            "member.added",
+            "project.updated",
+        ]:
+            await bus.publish(mock_event(event_type))
+
+        assert handled == ["task.added", "task.completed", "member.added"]
+
+    asyncio.run(run())
+
+
+def test_failing_handler() -> None:
+    """A failing handler does not stop the others"""
+
+    async def run() -> None:
+        bus = MemoryEventBus()
+        handled = []
+
+        async def failing(event: Event) -> None:
+            raise RuntimeError("handler failed")
+
+        async def handler(event: Event) -> None:
+            handled.append(event.type)
+
+        bus.add_handler(failing)
+        bus.add_handler(handler)
+        await bus.publish(mock_event())
+
+        assert handled == ["project.updated"]
+        assert bus.errors == 1
+
+    asyncio.run(run())
+
+
+def test_subscriptions() -> None:
+    """Subscriptions only receive the events of their types and member"""
+
+    async def run() -> None:
+        bus = MemoryEventBus()
+        everything = bus.subscribe()
+        tasks = bus.subscribe("task.")
+        user1 = bus.subscribe(member="user1")
+
+        await bus.publish(mock_event("task.added", "user1"))
+        await bus.publish(mock_event("project.updated", "user2"))
+
+        assert everything.queue.qsize() == 2
+        assert tasks.queue.get_nowait().type == "task.added"
+        assert tasks.queue.empty()
+        assert user1.queue.get_nowait().type == "task.added"
+        assert user1.queue.empty()
+
+        bus.unsubscribe(everything)
+        await bus.publish(mock_event())
+        assert everything.queue.qsize() == 2
+        assert bus.stats()["subscriptions"] == 2
+
+    asyncio.run(run())
+
+
+def test_bounded_subscription() -> None:
+    """Events are dropped and counted once a subscription's queue is full"""
+
+    async def run() -> None:
+        bus = MemoryEventBus(maxsize=2)
+        subscription = bus.subscribe()
+
+        for _ in range(5):
+            await bus.publish(mock_event())
+
+        assert subscription.queue.qsize() == 2
+        assert subscription.dropped == 3
+        assert bus.stats()["delivered"] == 2
+        assert bus.stats()["dropped"] == 3
+
+    asyncio.run(run())
+
+
+def test_redis_across_processes() -> None:
+    """Two buses on the same redis server stand in for two API processes:
+    handlers run once, in the publishing process, and the subscriptions of
+    both processes get the event"""
+
+    async def run() -> None:
+        server = FakeServer()
+        bus1 = RedisEventBus(FakeRedis(server=server))
+        bus2 = RedisEventBus(FakeRedis(server=server))
+        await bus1.start()
+        await bus2.start()
+
+        handled = []
+
+        async def handler(event: Event) -> None:
+            handled.append(event)
+
+        bus1.add_handler(handler)
+        bus2.add_handler(handler)
+        subscription1 = bus1.subscribe(member="user1")
+        subscription2 = bus2.subscribe(member="user1")
+
+        await bus1.publish(mock_event("member.added", "user1"))
+
+        for subscription in [subscription1, subscription2]:
+            event = await asyncio.wait_for(subscription.queue.get(), 1)
+            assert event == mock_event("member.added", "user1")
+        assert len(handled) == 1
+
+        await bus1.stop()
+        await bus2.stop()
+
+    asyncio.run(run())
+
+
+def test_redis_unreachable() -> None:
+    """Publishing does not fail while redis is down, the event still reaches
+    the subscriptions of the publishing process"""
+
+    async def run() -> None:
+        server = FakeServer()
+        bus = RedisEventBus(FakeRedis(server=server))
+        subscription = bus.subscribe()
+
+        server.connected = False
+        await bus.publish(mock_event())
+
+        assert subscription.queue.get_nowait() == mock_event()
+        assert bus.stats()["failed"] == 1
+
+    asyncio.run(run())
+
+
+class DroppedPubSub:
+    """Pub/sub connection lost as soon as it is listened to"""
+
+    def __init__(self, pubsub) -> None:
+        self.pubsub = pubsub
+
+    async def subscribe(self, *channels: str) -> None:
+        await self.pubsub.subscribe(*channels)
+
+    async def listen(self):
+        raise ConnectionError("Connection lost")
+        yield
+
+    async def aclose(self) -> None:
+        await self.pubsub.aclose()
+
+
+def test_redis_reconnect() -> None:
+    """The listener reconnects after losing redis, and makes the subscriptions
+    resync since they may have missed events in between"""
+
+    async def run() -> None:
+        server = FakeServer()
+        redis = FakeRedis(server=server)
+        pubsub = redis.pubsub
+        redis.pubsub = lambda: DroppedPubSub(pubsub())
+
+        bus1 = RedisEventBus(redis, retry_delay=0.01)
+        bus2 = RedisEventBus(FakeRedis(server=server))
+        subscription = bus1.subscribe()
+
+        # redis stays down for a few attempts to subscribe again
+        await bus1.start()
+        server.connected = False
+        redis.pubsub = pubsub
+        await asyncio.sleep(0.05)
+        server.connected = True
+
+        # published until the listener is back
+        for _ in range(100):
+            await bus2.publish(mock_event())
+            if not subscription.queue.empty():
+                break
+            await asyncio.sleep(0.01)
+
+        assert subscription.queue.get_nowait() == mock_event()
+        assert subscription.dropped == 1
+        await bus1.stop()
+
+    asyncio.run(run())
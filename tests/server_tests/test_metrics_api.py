@@ -0,0 +1,190 @@
+# global imports
+import asyncio
+import threading
+import time
+import motor.frameworks.asyncio as motor_asyncio
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+# relative imports
+from src.server.main import app
+from src.server.dependencies import db_depend
+from src.server.database import Database
+from src.server.metrics import Metrics, MongoCommandListener
+
+
+# mock database class
+class MockDatabase(Database):
+    def __init__(self) -> None:
+        super().__init__()
+        self.client = AsyncMongoMockClient()
+        self.db = self.client.tests
+
+
+# mock database instance
+db = MockDatabase()
+
+
+# mock dependency
+def db_depend_override() -> MockDatabase:
+    """Returns mock database instance"""
+
+    return db
+
+
+client = TestClient(app)
+
+
+def test_setup() -> None:
+    """Reset fastapi dependencies then override the ones used in this test"""
+
+    app.dependency_overrides = {}
+    app.dependency_overrides[db_depend] = db_depend_override
+
+    global token
+    token = client.post(
+        "/users/",
+        json={
+            "user": {"username": "metricsuser", "full_name": "metrics user"},
+            "password": "password",
+        },
+    ).json()["token"]
+
+
+def test_metrics() -> None:
+    """Requests are counted by route template and status"""
+
+    client.get("/", headers={"token-uuid": token})
+    client.get("/users/nobody", headers={"token-uuid": token})
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    samples = {}
+    for line in response.text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+
+    assert samples['http_requests_total{method="GET",route="/",status="200"}'] >= 1
+    assert (
+        samples[
+            'http_requests_total{method="GET",route="/users/{username}",status="404"}'
+        ]
+        >= 1
+    )
+    assert (
+        samples['http_request_duration_seconds_count{method="GET",route="/"}']
+        == samples[
+            'http_request_duration_seconds_bucket{method="GET",route="/",le="+Inf"}'
+        ]
+    )
+    assert samples["http_requests_in_flight"] == 1  # this request
+    assert samples['threadpool_size{pool="endpoints"}'] > 0
+    assert samples["session_cache_hits_total"] >= 1
+
+
+def test_database_pool_saturation() -> None:
+    """Database calls count as queued until a thread runs them, then as busy
+    until they are done"""
+
+    def sample(name: str) -> float:
+        for line in client.get("/metrics").text.splitlines():
+            if line.startswith(f'{name}{{pool="database"}}'):
+                return float(line.rsplit(" ", 1)[1])
+
+    async def run(calls: int, release: threading.Event) -> None:
+        loop = asyncio.get_running_loop()
+        jobs = [motor_asyncio.run_on_executor(loop, release.wait) for _ in range(calls)]
+        await asyncio.gather(*jobs)
+
+    assert sample("threadpool_busy") == 0
+    assert sample("threadpool_size") == motor_asyncio.max_workers
+
+    release = threading.Event()
+    runner = threading.Thread(target=asyncio.run, args=(run(3, release),))
+    runner.start()
+    try:
+        for _ in range(100):
+            if sample("threadpool_busy") == 3:
+                break
+            time.sleep(0.01)
+        assert sample("threadpool_busy") == 3
+        assert sample("threadpool_queued") == 0
+    finally:
+        release.set()
+    runner.join()
+
+    assert sample("threadpool_busy") == 0
+    assert sample("threadpool_queued") == 0
+
+
+def test_metrics_shards() -> None:
+    """Counts from several threads are added up"""
+
+    metrics = Metrics()
+    metrics.counter("things_total", "Things")
+    metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+
+    def count() -> None:
+        for _ in range(1000):
+            metrics.inc("things_total", (("kind", "a"),))
+        metrics.observe("latency_seconds", (), 0.5)
+
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = metrics.render().splitlines()
+    assert 'things_total{kind="a"} 4000' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{le="1"} 4' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 2.0" in lines
+    assert "latency_seconds_count 4" in lines
+
+
+def test_mongo_command_listener() -> None:
+    """Mongo commands are counted by collection, command and outcome"""
+
+    metrics = Metrics()
+    metrics.counter("mongo_commands_total", "Commands")
+    metrics.histogram("mongo_command_duration_seconds", "Latency")
+    listener = MongoCommandListener(metrics)
+
+    for request_id, outcome in [(1, listener.succeeded), (2, listener.failed)]:
+        listener.started(
+            SimpleNamespace(
+                command_name="find",
+                command={"find": "projects", "filter": {}},
+                connection_id=("localhost", 27017),
+                request_id=request_id,
+            )
+        )
+        outcome(
+            SimpleNamespace(
+                command_name="find",
+                connection_id=("localhost", 27017),
+                request_id=request_id,
+                duration_micros=2000,
+            )
+        )
+
+    lines = metrics.render().splitlines()
+    assert (
+        'mongo_commands_total{collection="projects",command="find",outcome="success"} 1'
+        in lines
+    )
+    assert (
+        'mongo_commands_total{collection="projects",command="find",outcome="failure"} 1'
+        in lines
+    )
+    assert (
+        'mongo_command_duration_seconds_count{collection="projects",command="find"} 2'
+        in lines
+    )
@@ -12,6 +12,7 @@ from src.server.models import (
     Project,
     Discrete_Task,
     Milestone_Task,
+    Username_Set,
 )
 
 
@@ -49,15 +50,15 @@ def test_task_add_member() -> None:
     """Test adding members to task"""
 
     task = Task(name="Test task")
-    user1 = User(username="ranomdusername1", full_name="randomfullname1")
-    user2 = User(username="ranomdusername2", full_name="randomfullname2")
+    user1 = "ranomdusername1"
+    user2 = "ranomdusername2"
 
     # successful add
     assert task.add_member(user1, user2)
     assert user1, user2 in task.members
 
     # add duplicate
-    user3 = User(username="ranomdusername3", full_name="randomfullname3")
+    user3 = "ranomdusername3"
 
     assert task.add_member(user2, user3) == False
     assert user3 in task.members
@@ -67,8 +68,8 @@ def test_task_remove_member() -> None:
     """Test removing members from task"""
 
     task = Task(name="Test task")
-    user1 = User(username="ranomdusername1", full_name="randomfullname1")
-    user2 = User(username="ranomdusername2", full_name="randomfullname2")
+    user1 = "ranomdusername1"
+    user2 = "ranomdusername2"
 
     task.add_member(user1, user2)
 
@@ -137,13 +138,57 @@ def test_project_task() -> None:
     assert task2 in project.tasks
 
 
+def test_project_task_index() -> None:
+    """Test lookups of project tasks by name stay right as tasks change"""
+
+    project = Project(
+        name="test project",
+        tasks=[Discrete_Task(name=f"task {i}") for i in range(5)],
+    )
+
+    assert project.get_task("task 3").name == "task 3"
+    assert project.has_task("task 0") and not project.has_task("task 5")
+    assert project.get_task("task 5") is None
+
+    # replace, also under a new name
+    updated = Discrete_Task(name="task 1", completed=True)
+    assert project.replace_task("task 1", updated)
+    assert project.get_task("task 1") is updated
+    assert project.replace_task("task 2", Discrete_Task(name="renamed"))
+    assert not project.has_task("task 2") and project.has_task("renamed")
+    assert project.replace_task("task 5", updated) == False
+
+    # tasks after a removed one move up
+    assert project.pop_task("task 0").name == "task 0"
+    assert project.pop_task("task 0") is None
+    assert [task.name for task in project.tasks] == [
+        "task 1",
+        "renamed",
+        "task 3",
+        "task 4",
+    ]
+    for task in project.tasks:
+        assert project.get_task(task.name) is task
+
+    # changes made on the task list directly
+    project.tasks.append(Discrete_Task(name="appended"))
+    assert project.has_task("appended")
+    project.tasks[0] = Discrete_Task(name="task 1", completed=True)
+    assert project.get_task("task 1") is project.tasks[0]
+    project.tasks[1] = Discrete_Task(name="swapped")
+    assert not project.has_task("renamed")
+    project.tasks = [Discrete_Task(name="new list")]
+    assert project.has_task("new list") and not project.has_task("task 3")
+    assert project.model_copy(deep=True).get_task("new list").name == "new list"
+
+
 def test_project_member() -> None:
     """Test functionality of project members"""
 
     project = Project(name="test project")
 
-    user1 = User(username="ranomdusername1", full_name="randomfullname1")
-    user2 = User(username="ranomdusername2", full_name="randomfullname2")
+    user1 = "ranomdusername1"
+    user2 = "ranomdusername2"
 
     # test add members
 
@@ -164,3 +209,49 @@ def test_project_member() -> None:
 
     assert project.remove_member(user1) == False
     assert user2 in project.members
+
+
+def test_project_member_sets() -> None:
+    """Test members and moderators are ordered sets, stored as lists"""
+
+    project = Project(
+        name="test project",
+        members=["user3", "user1", "user2", "user1"],
+        moderators=["user2"],
+        tasks=[Discrete_Task(name="task", members=["user1"])],
+    )
+
+    assert isinstance(project.members, Username_Set)
+    assert isinstance(project.tasks[0].members, Username_Set)
+    assert project.members == ["user3", "user1", "user2"]
+
+    project.members.add("user4")
+    project.members.remove("user3")
+    assert project.model_dump()["members"] == ["user1", "user2", "user4"]
+    assert Project(**project.model_dump()) == project
+    assert Project.from_document(project.model_dump()).members == project.members
+    assert Project.model_json_schema()["properties"]["members"]["anyOf"][0] == {
+        "type": "array",
+        "items": {"type": "string"},
+        "uniqueItems": True,
+    }
+
+
+def test_project_role_of() -> None:
+    """Test resolving the role of a user in a project"""
+
+    project = Project(
+        name="test project",
+        owner="owner",
+        members=["owner", "moderator", "member", "task member"],
+        moderators=["moderator"],
+        tasks=[Discrete_Task(name="task", members=["task member", "moderator"])],
+    )
+
+    assert project.role_of("owner") == "owner"
+    assert project.role_of("moderator", "task") == "moderator"
+    assert project.role_of("task member", "task") == "task member"
+    assert project.role_of("task member") == "member"
+    assert project.role_of("task member", "no task") == "member"
+    assert project.role_of("member", "task") == "member"
+    assert project.role_of("stranger") is None
@@ -1,17 +1,23 @@
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from mongomock import MongoClient
+from mongomock_motor import AsyncMongoMockClient
 
 from src.server.main import app
-from src.server.models import User, Project
+from src.server.models import User, Project, Discrete_Task, Token
 from src.server.dependencies import db_depend
-from src.server.database import Database
+from src.server.database import Database, RevisionConflict
+from src.server.events import Event
+from src.server.routers.projects import project_update_events
 
 
 # mock database class
 class MockDatabase(Database):
     def __init__(self) -> None:
         super().__init__()
-        self.client = MongoClient()
+        self.client = AsyncMongoMockClient()
         self.db = self.client.tests
 
 
@@ -29,9 +35,6 @@ def db_depend_override() -> MockDatabase:
 # init client
 client = TestClient(app)
 
-# remove middleware (breaks the tests)
-app.user_middleware.clear()
-
 # mock users
 user1 = User(username="mockuser1", full_name="fullname1")  # project owner
 user2 = User(username="mockuser2", full_name="fullname2")  # project moderator
@@ -71,7 +74,7 @@ def test_setup() -> None:
     ).json()["token"]
 
     # make admin_user an admin
-    db.db.users.update_one(
+    db.db.delegate.users.update_one(
         {"username": admin_user.username}, {"$set": {"power": "admin"}}
     )
 
@@ -214,6 +217,46 @@ def test_update_name() -> None:
     assert response.json()["detail"] == "Cannot modify project name"
 
 
+def test_get_project_etag() -> None:
+    """A client sending the ETag of its copy gets a 304 until the project changes"""
+
+    headers = {"content-type": "application/json", "token-uuid": token1}
+    response = client.get(f"/projects/{mockproject.name}", headers=headers)
+    etag = response.headers["etag"]
+
+    assert response.status_code == 200
+    assert etag.startswith('"') and etag.endswith('"')
+
+    response = client.get(
+        f"/projects/{mockproject.name}", headers={**headers, "if-none-match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    # not a member, the ETag does not get around the permissions
+    response = client.get(
+        f"/projects/{mockproject.name}",
+        headers={"token-uuid": token2, "if-none-match": etag},
+    )
+    assert response.status_code == 403
+
+    # a targeted update moves the ETag on as well
+    client.post(
+        f"/projects/{mockproject.name}/tasks/",
+        headers=headers,
+        json={"name": "etag task"},
+    )
+    response = client.get(
+        f"/projects/{mockproject.name}", headers={**headers, "if-none-match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert "etag task" in [task["name"] for task in response.json()["tasks"]]
+
+    client.delete(f"/projects/{mockproject.name}/tasks/etag task", headers=headers)
+
+
 # PROJECT MEMBERS TESTS
 def test_add_member() -> None:
     """Add a user to the project"""
@@ -393,3 +436,602 @@ def test_remove_moderator() -> None:
 
     assert response.status_code == 200
     assert response.json()["detail"] == "User demoted successfully"
+
+
+# OPTIMISTIC CONCURRENCY TESTS
+def test_if_match() -> None:
+    """Writes sent with If-Match only apply to the revision the client has"""
+
+    headers = {"content-type": "application/json", "token-uuid": token1}
+    response = client.get(f"/projects/{mockproject.name}", headers=headers)
+    etag = response.headers["etag"]
+    project = response.json()
+    revision = project["revision"]
+
+    project["description"] = "edited with if-match"
+    response = client.put(
+        f"/projects/{mockproject.name}",
+        headers={**headers, "if-match": etag},
+        json=project,
+    )
+    assert response.status_code == 200
+
+    # the same copy again, it is out of date now
+    project["description"] = "edited from an old copy"
+    response = client.put(
+        f"/projects/{mockproject.name}",
+        headers={**headers, "if-match": etag},
+        json=project,
+    )
+    assert response.status_code == 412
+    assert response.json()["revision"] == revision + 1
+    assert response.headers["etag"] != etag
+
+    response = client.get(f"/projects/{mockproject.name}", headers=headers)
+    assert response.json()["description"] == "edited with if-match"
+    assert response.json()["revision"] == revision + 1
+    mockproject.description = "edited with if-match"
+
+    # task writes only need the client's copy of their task to be current
+    task = f"/projects/{mockproject.name}/tasks/if-match task"
+    response = client.post(
+        f"/projects/{mockproject.name}/tasks/",
+        headers={**headers, "if-match": etag},
+        json={"name": "if-match task"},
+    )
+    assert response.status_code == 200
+
+    response = client.put(
+        f"{task}/completion?completion=true", headers={**headers, "if-match": etag}
+    )
+    assert response.status_code == 412
+
+    etag = client.get(f"/projects/{mockproject.name}", headers=headers).headers["etag"]
+    response = client.put(
+        f"{task}/completion?completion=true", headers={**headers, "if-match": etag}
+    )
+    assert response.status_code == 200
+
+    # and they still have to be for the same project
+    etag = client.get(f"/projects/{mockproject.name}", headers=headers).headers["etag"]
+    response = client.delete(
+        task, headers={**headers, "if-match": etag.replace(etag[1:25], "0" * 24)}
+    )
+    assert response.status_code == 412
+
+    response = client.delete(task, headers={**headers, "if-match": etag})
+    assert response.status_code == 200
+
+
+def test_revision_conflict() -> None:
+    """A write computed from an outdated copy of the project fails, unless it
+    is commutative, then it is retried on the current revision"""
+
+    outdated_project = asyncio.run(db.get_project(mockproject.name))
+    asyncio.run(db.add_project_moderator(outdated_project, user3.username))
+
+    # the moderators it sets were changed in the meantime
+    updated_project = outdated_project.model_copy(deep=True)
+    updated_project.moderators.add(user2.username)
+    with pytest.raises(RevisionConflict):
+        asyncio.run(db.update_project(outdated_project, updated_project))
+
+    assert asyncio.run(
+        db.retry_on_conflict(
+            db.remove_project_moderator, outdated_project, user3.username
+        )
+    )
+    project = asyncio.run(db.get_project(mockproject.name))
+    assert user3.username not in project.moderators
+    assert project.revision == outdated_project.revision + 2
+
+    # the endpoint's checks are run again on the reloaded project
+    def check(project: Project) -> None:
+        if user3.username in project.moderators:
+            raise HTTPException(400, "User is already a moderator")
+
+    asyncio.run(db.add_project_moderator(project, user3.username))
+    with pytest.raises(HTTPException):
+        asyncio.run(
+            db.retry_on_conflict(
+                db.add_project_moderator, project, user3.username, check=check
+            )
+        )
+
+    project = asyncio.run(db.get_project(mockproject.name))
+    assert asyncio.run(db.remove_project_moderator(project, user3.username))
+
+
+def test_project_without_revision() -> None:
+    """Projects created before revisions existed can still be written to"""
+
+    db.db.delegate.projects.insert_one(
+        {"name": "old project", "owner": user1.username, "members": [user1.username]}
+    )
+
+    response = client.post(
+        f"/projects/old project/members/{user3.username}",
+        headers={"content-type": "application/json", "token-uuid": token1},
+    )
+    assert response.status_code == 200
+
+    project = asyncio.run(db.get_project("old project"))
+    assert user3.username in project.members
+    assert project.revision == 1
+
+    db.db.delegate.projects.delete_one({"name": "old project"})
+
+
+def test_project_changes() -> None:
+    """Clients catch up with the changes made since their revision"""
+
+    headers = {"content-type": "application/json", "token-uuid": token1}
+    project = "/projects/changes project"
+    task = Discrete_Task(name="changes task", description="task")
+
+    response = client.post(
+        "/projects/", headers=headers, json={"name": "changes project"}
+    )
+    assert response.status_code == 200
+    revision = client.get(project, headers=headers).json()["revision"]
+
+    client.post(f"{project}/members/{user3.username}", headers=headers)
+    client.post(f"{project}/tasks/", headers=headers, json=task.model_dump())
+    client.put(
+        f"{project}/tasks/{task.name}/completion",
+        params={"completion": True},
+        headers=headers,
+    )
+
+    response = client.get(f"{project}/changes?since={revision}", headers=headers)
+    assert response.status_code == 200
+    assert (
+        response.headers["ETag"] == client.get(project, headers=headers).headers["ETag"]
+    )
+    assert response.json() == {
+        "revision": revision + 3,
+        "changes": [
+            {"op": "add", "path": ["members"], "value": user3.username},
+            {"op": "add", "path": ["tasks"], "value": task.model_dump()},
+            {"op": "set", "path": ["tasks", task.name, "completed"], "value": True},
+        ],
+    }
+
+    # only what is newer than the client's revision
+    response = client.get(f"{project}/changes?since={revision + 2}", headers=headers)
+    assert len(response.json()["changes"]) == 1
+
+    # up to date
+    response = client.get(f"{project}/changes?since={revision + 3}", headers=headers)
+    assert response.json() == {"revision": revision + 3, "changes": []}
+
+    # project fields changed by an update
+    updated = client.get(project, headers=headers).json()
+    updated["description"] = "new description"
+    client.put(project, headers=headers, json=updated)
+    response = client.get(f"{project}/changes?since={revision + 3}", headers=headers)
+    assert response.json()["changes"] == [
+        {"op": "set", "path": ["description"], "value": "new description"}
+    ]
+
+
+def test_project_changes_snapshot() -> None:
+    """Clients the change log cannot catch up get the whole project"""
+
+    headers = {"content-type": "application/json", "token-uuid": token1}
+    project = "/projects/changes project"
+    revision = client.get(project, headers=headers).json()["revision"]
+
+    # compacted log
+    db.db.delegate.project_changes.delete_many({"revision": 1})
+    response = client.get(f"{project}/changes?since=0", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["revision"] == revision
+    assert response.json()["snapshot"]["name"] == "changes project"
+    assert response.json()["snapshot"]["description"] == "new description"
+
+    # unknown revision
+    response = client.get(f"{project}/changes?since={revision + 1}", headers=headers)
+    assert response.json()["snapshot"]["revision"] == revision
+
+    response = client.get(
+        f"{project}/changes?since=0",
+        headers={"content-type": "application/json", "token-uuid": token2},
+    )
+    assert response.status_code == 403
+
+    response = client.get("/projects/no such project/changes?since=0", headers=headers)
+    assert response.status_code == 404
+
+    client.delete(project, headers=headers)
+
+
+def test_batch() -> None:
+    """Apply several operations to a project in one request"""
+
+    headers = {"content-type": "application/json", "token-uuid": token1}
+    project = "/projects/batch project"
+    task = Discrete_Task(name="batch task", description="task")
+
+    client.post("/projects/", headers=headers, json={"name": "batch project"})
+    revision = client.get(project, headers=headers).json()["revision"]
+
+    operations = [
+        {"op": "add_member", "username": user2.username},
+        {"op": "add_member", "username": user3.username},
+        {"op": "add_member", "username": "no such user"},
+        {"op": "add_moderator", "username": user2.username},
+        {"op": "add_task", "task": task.model_dump()},
+        {
+            "op": "add_task_member",
+            "task_name": task.name,
+            "username": user3.username,
+        },
+        {"op": "set_completion", "task_name": task.name, "completion": True},
+        {"op": "delete_task", "task_name": "no such task"},
+        {"op": "remove_member"},
+    ]
+
+    # nothing is written if an operation fails
+    response = client.post(f"{project}/batch", headers=headers, json=operations)
+    assert response.status_code == 400
+    results = response.json()["detail"]
+    assert [result["status"] for result in results] == [
+        200,
+        200,
+        404,
+        200,
+        200,
+        200,
+        200,
+        404,
+        422,
+    ]
+    assert results[2]["detail"] == "User does not exist"
+
+    data = client.get(project, headers=headers).json()
+    assert data["revision"] == revision
+    assert data["members"] == [user1.username]
+    assert data["tasks"] == []
+
+    # the ones that succeeded, on their own
+    operations = [
+        operation
+        for operation, result in zip(operations, results)
+        if result["status"] == 200
+    ]
+    response = client.post(f"{project}/batch", headers=headers, json=operations)
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()] == [200] * 6
+
+    # written as one change
+    data = client.get(project, headers=headers).json()
+    assert data["revision"] == revision + 1
+    assert data["members"] == [user1.username, user2.username, user3.username]
+    assert data["moderators"] == [user2.username]
+    assert data["tasks"][0]["members"] == [user3.username]
+    assert data["tasks"][0]["completed"] is True
+
+    changes = client.get(f"{project}/changes?since={revision}", headers=headers)
+    assert len(changes.json()["changes"]) == 6
+
+    # progress counters follow the tasks
+    response = client.get("/projects/all/", headers=headers)
+    assert response.json()["batch project"] == [1, 1]
+
+
+def test_batch_permissions(monkeypatch) -> None:
+    """Each operation of a batch needs the permissions of its own endpoint"""
+
+    project = "/projects/batch project"
+    task = "batch task"
+    revision = client.get(project, headers={"token-uuid": token1}).json()["revision"]
+
+    # task member, not a moderator
+    response = client.post(
+        f"{project}/batch",
+        headers={"content-type": "application/json", "token-uuid": token3},
+        json=[
+            {"op": "set_completion", "task_name": task, "completion": False},
+            {"op": "remove_member", "username": user2.username},
+            {"op": "delete_task", "task_name": task},
+        ],
+    )
+    assert response.status_code == 400
+    assert [result["status"] for result in response.json()["detail"]] == [
+        200,
+        403,
+        403,
+    ]
+
+    # moderator, not the owner
+    response = client.post(
+        f"{project}/batch",
+        headers={"content-type": "application/json", "token-uuid": token2},
+        json=[
+            {"op": "add_moderator", "username": user3.username},
+            {"op": "remove_task_member", "task_name": task, "username": user3.username},
+        ],
+    )
+    assert response.status_code == 400
+    assert [result["status"] for result in response.json()["detail"]] == [403, 200]
+
+    # none of them were written
+    data = client.get(project, headers={"token-uuid": token1}).json()
+    assert data["revision"] == revision
+    assert data["tasks"][0]["completed"] is True
+    assert data["tasks"][0]["members"] == [user3.username]
+
+    response = client.post(
+        f"{project}/batch",
+        headers={"content-type": "application/json", "token-uuid": token2},
+        json=[
+            {"op": "remove_task_member", "task_name": task, "username": user3.username}
+        ],
+    )
+    assert response.status_code == 200
+
+    # outdated copy
+    response = client.post(
+        f"{project}/batch",
+        headers={
+            "content-type": "application/json",
+            "token-uuid": token1,
+            "if-match": '"000000000000000000000000-0"',
+        },
+        json=[{"op": "remove_member", "username": user3.username}],
+    )
+    assert response.status_code == 412
+
+    # deleted once the batch was checked
+    get_existing_usernames = db.get_existing_usernames
+
+    async def deleted(usernames: set[str]) -> set[str]:
+        await db.delete_project("batch project")
+        return await get_existing_usernames(usernames)
+
+    monkeypatch.setattr(db, "get_existing_usernames", deleted)
+    response = client.post(
+        f"{project}/batch",
+        headers={"content-type": "application/json", "token-uuid": token1},
+        json=[{"op": "remove_member", "username": user3.username}],
+    )
+    assert response.status_code == 404
+
+
+def test_update_notifications() -> None:
+    """Members are notified of project changes, once per project"""
+
+    # clear pending notifications
+    for token in [token1, token2]:
+        client.get(
+            "/update/projects",
+            headers={"content-type": "application/json", "token-uuid": token},
+        )
+
+    # change the project twice
+    for username in [user2.username, user2.username]:
+        client.post(
+            f"/projects/{mockproject.name}/moderators/{username}",
+            headers={"content-type": "application/json", "token-uuid": token1},
+        )
+
+    for token in [token1, token2]:
+        response = client.get(
+            "/update/projects",
+            headers={"content-type": "application/json", "token-uuid": token},
+        )
+        assert response.status_code == 200
+        assert response.json() == [mockproject.name]
+
+
+def test_background_notifications() -> None:
+    """Notify members in the background, then wait for it to finish"""
+
+    async def notify() -> None:
+        db.notify_in_background = True
+        try:
+            await db._notify("background project", [user1.username, user3.username])
+            await db.flush_notifications()
+        finally:
+            db.notify_in_background = False
+
+    asyncio.run(notify())
+
+    for username in [user1.username, user3.username]:
+        user_db = asyncio.run(db.get_user_db(username))
+        assert "background project" in user_db.update_projects
+
+
+def test_update_stream() -> None:
+    """Stream project updates: pending ones first, then pushed as they happen"""
+
+    async def stream() -> None:
+        auth = await db.get_auth_context(token3)
+        await db.pop_project_updates(user3.username)
+        await db.events.publish(
+            Event(
+                type="project.updated",
+                project="missed project",
+                members=[user3.username],
+            )
+        )
+        events = project_update_events(db, auth, heartbeat=0.05)
+
+        # updates that piled up before connecting
+        assert await anext(events) == 'event: update\ndata: ["missed project"]\n\n'
+        assert db.events.stats()["subscriptions"] == 1
+
+        # pushed as soon as the members are notified
+        await db.events.publish(
+            Event(
+                type="task.completed",
+                project="pushed project",
+                members=[user1.username, user3.username],
+            )
+        )
+        assert await anext(events) == 'event: update\ndata: ["pushed project"]\n\n'
+
+        # delivered updates are no longer pending, undelivered ones still are
+        assert (await db.get_user_db(user3.username)).update_projects == []
+        assert (
+            "pushed project" in (await db.get_user_db(user1.username)).update_projects
+        )
+
+        # idle
+        assert await anext(events) == "event: heartbeat\ndata: null\n\n"
+
+        await events.aclose()
+        assert db.events.stats()["subscriptions"] == 0
+
+    asyncio.run(stream())
+
+
+def test_update_stream_overflow() -> None:
+    """A stream that falls behind resyncs from the database"""
+
+    async def stream() -> None:
+        auth = await db.get_auth_context(token3)
+        events = project_update_events(db, auth, heartbeat=0.05)
+        await anext(events)
+
+        for i in range(db.events.maxsize + 1):
+            await db.events.publish(
+                Event(
+                    type="project.updated",
+                    project=f"project {i}",
+                    members=[user3.username],
+                )
+            )
+
+        event = await anext(events)
+        assert event.startswith("event: update")
+        assert f"project {db.events.maxsize}" in event
+        assert db.events.stats()["dropped"] == 1
+        assert (await db.get_user_db(user3.username)).update_projects == []
+
+        await events.aclose()
+
+    asyncio.run(stream())
+
+
+def test_update_stream_logout() -> None:
+    """The update stream ends once its session is gone"""
+
+    async def stream() -> None:
+        session = await db.get_auth_context(token3)
+        token = Token.generate(user3.username)
+        await db.post_token(token, session.token.user_id)
+        auth = await db.get_auth_context(token.token)
+
+        events = project_update_events(db, auth, heartbeat=0.05)
+        await anext(events)
+        assert await anext(events) == "event: heartbeat\ndata: null\n\n"
+
+        await db.delete_token(token.token)
+        await db.events.publish(
+            Event(
+                type="project.updated",
+                project="after logout",
+                members=[user3.username],
+            )
+        )
+        assert [event async for event in events] == []
+        assert db.events.stats()["subscriptions"] == 0
+
+    asyncio.run(stream())
+
+
+def test_update_stream_bad_token() -> None:
+    """The update stream authenticates like every other endpoint"""
+
+    response = client.get(
+        "/update/projects/stream",
+        headers={
+            "content-type": "application/json",
+            "token-uuid": "00000000-0000-0000-0000-000000000000",
+        },
+    )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token not found"
+
+
+def test_project_list_pages() -> None:
+    """Page through the project list with the cursor, ordered by name"""
+
+    global list_token
+    list_token = client.post(
+        "/users/",
+        json={
+            "user": {"username": "listuser", "full_name": "list user"},
+            "password": "password",
+        },
+    ).json()["token"]
+    for name in ["list b", "list c", "list a"]:
+        client.post(
+            "/projects/",
+            headers={"content-type": "application/json", "token-uuid": list_token},
+            json={"name": name},
+        )
+
+    pages = []
+    cursor = None
+    for _ in range(3):
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        response = client.get(
+            "/projects/all/",
+            params=params,
+            headers={"content-type": "application/json", "token-uuid": list_token},
+        )
+        assert response.status_code == 200
+        pages.append(list(response.json()))
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert pages == [["list a", "list b"], ["list c"]]
+
+    response = client.get(
+        "/projects/all/",
+        params={"cursor": "notacursor"},
+        headers={"content-type": "application/json", "token-uuid": list_token},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_project_list_ndjson() -> None:
+    """Stream the project list as newline delimited json"""
+
+    response = client.get(
+        "/projects/all/",
+        headers={"accept": "application/x-ndjson", "token-uuid": list_token},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"name": "list a", "progress": [0, 0]},
+        {"name": "list b", "progress": [0, 0]},
+        {"name": "list c", "progress": [0, 0]},
+    ]
+
+    # with a limit, the last line is the cursor of the next page
+    response = client.get(
+        "/projects/all/",
+        params={"limit": 2},
+        headers={"accept": "application/x-ndjson", "token-uuid": list_token},
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line.get("name") for line in lines[:2]] == ["list a", "list b"]
+
+    response = client.get(
+        "/projects/all/",
+        params={"cursor": lines[2]["next_cursor"]},
+        headers={"accept": "application/x-ndjson", "token-uuid": list_token},
+    )
+    assert [json.loads(line)["name"] for line in response.text.splitlines()] == [
+        "list c"
+    ]
@@ -0,0 +1,123 @@
+# global imports
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+# relative imports
+from src.server.models import Auth_Context, Token_DB, User
+from src.server.session_cache import SessionCache
+
+
+def mock_auth(username: str, admin: bool = False) -> Auth_Context:
+    """Build an authentication context for a mock user"""
+
+    return Auth_Context(
+        token=Token_DB(
+            token=f"token-{username}",
+            user_id=ObjectId(),
+            expiration=datetime.now() + timedelta(hours=72),
+        ),
+        user=User(username=username, full_name="full name"),
+        admin=admin,
+    )
+
+
+def test_cache_hit_miss() -> None:
+    """Test getting cached and non cached sessions"""
+
+    cache = SessionCache()
+    cache.set("token1", mock_auth("user1"))
+
+    assert cache.get("token1").user.username == "user1"
+    assert cache.get("token2") is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_lru_eviction() -> None:
+    """Test the least recently used session is evicted when the cache is full"""
+
+    cache = SessionCache(maxsize=2)
+    cache.set("token1", mock_auth("user1"))
+    cache.set("token2", mock_auth("user2"))
+
+    # use token1 so token2 becomes the least recently used
+    assert cache.get("token1")
+    cache.set("token3", mock_auth("user3"))
+
+    assert cache.get("token2") is None
+    assert cache.get("token1") and cache.get("token3")
+    assert cache.evictions == 1
+
+
+def test_cache_ttl() -> None:
+    """Test sessions expire from the cache after the TTL"""
+
+    cache = SessionCache(ttl=0)
+    cache.set("token1", mock_auth("user1"))
+
+    assert cache.get("token1") is None
+    assert cache.expirations == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_invalidation() -> None:
+    """Test invalidating a single session and all sessions of a user"""
+
+    cache = SessionCache()
+    cache.set("token1", mock_auth("user1"))
+    cache.set("token2", mock_auth("user1"))
+    cache.set("token3", mock_auth("user2"))
+
+    cache.invalidate("token3")
+    assert cache.get("token3") is None
+
+    cache.invalidate_user("user1")
+    assert cache.get("token1") is None and cache.get("token2") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_disabled() -> None:
+    """Test a disabled cache never stores anything"""
+
+    cache = SessionCache(enabled=False)
+    cache.set("token1", mock_auth("user1"))
+
+    assert cache.get("token1") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_invalidated_during_lookup() -> None:
+    """A lookup that missed does not store its result if the user or token was
+    invalidated while it was reading the database"""
+
+    cache = SessionCache()
+
+    generation = cache.generation
+    cache.invalidate_user("user1")
+    cache.set("token1", mock_auth("user1"), generation)
+    assert cache.get("token1") is None
+
+    generation = cache.generation
+    cache.invalidate("token2")
+    cache.set("token2", mock_auth("user2"), generation)
+    assert cache.get("token2") is None
+
+    # lookups that started after the invalidation are stored
+    generation = cache.generation
+    cache.set("token1", mock_auth("user1"), generation)
+    assert cache.get("token1").user.username == "user1"
+
+
+def test_cache_forgets_old_invalidations() -> None:
+    """Invalidations are remembered up to the size of the cache, lookups older
+    than the ones forgotten are not stored"""
+
+    cache = SessionCache(maxsize=2)
+
+    generation = cache.generation
+    for username in ["user1", "user2", "user3"]:
+        cache.invalidate_user(username)
+    assert len(cache._invalidated) == 2
+
+    cache.set("token4", mock_auth("user4"), generation)
+    assert cache.get("token4") is None
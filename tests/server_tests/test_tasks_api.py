@@ -1,17 +1,19 @@
+import asyncio
+import pytest
 from fastapi.testclient import TestClient
-from mongomock import MongoClient
+from mongomock_motor import AsyncMongoMockClient
 
 from src.server.main import app
 from src.server.models import User, Project, Discrete_Task, Milestone_Task
 from src.server.dependencies import db_depend
-from src.server.database import Database
+from src.server.database import Database, RevisionConflict
 
 
 # mock database class
 class MockDatabase(Database):
     def __init__(self) -> None:
         super().__init__()
-        self.client = MongoClient()
+        self.client = AsyncMongoMockClient()
         self.db = self.client.tests
 
 
@@ -90,7 +92,7 @@ def test_setup() -> None:
     ).json()["token"]
 
     # make admin_user an admin
-    db.db.users.update_one(
+    db.db.delegate.users.update_one(
         {"username": admin_user.username}, {"$set": {"power": "admin"}}
     )
 
@@ -265,6 +267,293 @@ def test_update_task_completion() -> None:
     assert response.json()["detail"] == "Task completion updated successfully"
 
 
+def test_task_completion_saved() -> None:
+    """Check the completions set in the previous test were saved"""
+
+    project = Project(
+        **client.get(
+            f"/projects/{mockproject.name}",
+            headers={"content-type": "application/json", "token-uuid": token1},
+        ).json()
+    )
+    tasks = {task.name: task for task in project.tasks}
+
+    assert tasks[mock_discrete_task.name].completed is True
+    assert tasks[mock_milestone_task.name].completed == 5
+    assert tasks[extra_discrete_task.name].completed is True
+    assert project.progress == [7, 7]
+
+
+def test_targeted_task_update() -> None:
+    """Task updates only write the task they change, so an update made from an
+    outdated copy of the project does not overwrite other changes"""
+
+    outdated_project = asyncio.run(db.get_project(mockproject.name))
+
+    # another request changes the project in the meantime
+    db.db.delegate.projects.update_one(
+        {"name": mockproject.name}, {"$set": {"description": "changed meanwhile"}}
+    )
+
+    assert asyncio.run(
+        db.update_task_completion(outdated_project, mock_milestone_task.name, 4)
+    )
+
+    project = asyncio.run(db.get_project(mockproject.name))
+    tasks = {task.name: task for task in project.tasks}
+
+    assert project.description == "changed meanwhile"
+    assert tasks[mock_milestone_task.name].completed == 4
+
+    # the project has moved on, writes computed from the old copy are refused
+    with pytest.raises(RevisionConflict):
+        asyncio.run(
+            db.update_task_completion(outdated_project, mock_milestone_task.name, 5)
+        )
+
+    # the task must exist for the update to happen
+    assert (
+        asyncio.run(db.update_task_completion(project, "nonexistingtask", 1)) is False
+    )
+
+
+def test_project_list_progress() -> None:
+    """The progress counters used by the project list match the project's tasks"""
+
+    project = Project(
+        **client.get(
+            f"/projects/{mockproject.name}",
+            headers={"content-type": "application/json", "token-uuid": token1},
+        ).json()
+    )
+
+    response = client.get(
+        "/projects/all/",
+        headers={"content-type": "application/json", "token-uuid": token1},
+    )
+
+    assert response.status_code == 200
+    assert response.json()[mockproject.name] == project.progress
+
+
+def test_repair_progress() -> None:
+    """Recompute progress counters that went out of sync"""
+
+    db.db.delegate.projects.update_one(
+        {"name": mockproject.name}, {"$set": {"done": 100, "total": -1}}
+    )
+    assert asyncio.run(db.repair_progress()) == 1
+
+    test_project_list_progress()
+
+
+def test_trusted_reads(monkeypatch) -> None:
+    """Trusted reads build the same models as validated ones"""
+
+    url = f"/projects/{mockproject.name}"
+    headers = {"content-type": "application/json", "token-uuid": token1}
+    validated = asyncio.run(db.get_project(mockproject.name))
+    response = client.get(url, headers=headers).json()
+
+    monkeypatch.setattr("src.server.database.TRUSTED_READS", True)
+
+    trusted = asyncio.run(db.get_project(mockproject.name))
+    assert trusted == validated
+    assert trusted.model_dump() == validated.model_dump()
+    assert [type(task) for task in trusted.tasks] == [
+        type(task) for task in validated.tasks
+    ]
+    assert trusted.progress == validated.progress
+    assert trusted._document_id == validated._document_id
+    assert client.get(url, headers=headers).json() == response
+
+    user = asyncio.run(db.get_user_db(user1.username))
+    assert user.username == user1.username
+    assert user.update_projects is not None
+
+
+def test_task_pages() -> None:
+    """The tasks of a project can be paged through, in the order they were added"""
+
+    url = f"/projects/{mockproject.name}"
+    headers = {"content-type": "application/json", "token-uuid": token1}
+    project = client.get(url, headers=headers).json()
+    assert "X-Next-Cursor" not in client.get(url, headers=headers).headers
+
+    tasks = []
+    cursor = ""
+    for _ in range(len(project["tasks"])):
+        response = client.get(f"{url}?limit=1&cursor={cursor}", headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()["tasks"]) == 1
+        tasks += response.json()["tasks"]
+        cursor = response.headers.get("X-Next-Cursor")
+
+    # a full last page does not know it is the last one yet
+    response = client.get(f"{url}?limit=1&cursor={cursor}", headers=headers)
+    assert response.json()["tasks"] == []
+    assert "X-Next-Cursor" not in response.headers
+
+    assert tasks == project["tasks"]
+    assert response.json() == {**project, "tasks": []}
+
+    # tasks of a member
+    response = client.get(f"{url}?member={user3.username}", headers=headers)
+    assert response.json()["tasks"] == project["tasks"]
+    response = client.get(f"{url}?member={user2.username}", headers=headers)
+    assert response.json()["tasks"] == []
+
+    # the progress is the one of the whole project
+    page, _, following = asyncio.run(db.get_project_page(mockproject.name, limit=1))
+    full = asyncio.run(db.get_project(mockproject.name))
+    assert page.progress == full.progress
+    assert following is not None
+
+    response = client.get(f"{url}?limit=1&cursor=invalid", headers=headers)
+    assert response.status_code == 400
+
+
+def test_task_write_conflicts() -> None:
+    """Task writes only conflict with writes to the same task"""
+
+    asyncio.run(db.ensure_indexes())
+    outdated_project = asyncio.run(db.get_project(mockproject.name))
+    client.put(
+        f"/projects/{mockproject.name}/tasks/{mock_milestone_task.name}/completion?completion=2",
+        headers={"content-type": "application/json", "token-uuid": token1},
+    )
+    project = asyncio.run(db.get_project(mockproject.name))
+
+    # the task changed since it was loaded
+    for write, *args in [
+        (db.update_task_completion, mock_milestone_task.name, 3),
+        (db.delete_task, mock_milestone_task.name),
+        (db.add_task_member, mock_milestone_task.name, user2.username),
+    ]:
+        with pytest.raises(RevisionConflict):
+            asyncio.run(write(outdated_project, *args))
+
+    assert asyncio.run(db.get_project(mockproject.name)).model_dump() == (
+        project.model_dump()
+    )
+
+    # the other tasks did not, their writes go on top of the change
+    assert asyncio.run(db.add_task(outdated_project, Discrete_Task(name="new task")))
+    current = asyncio.run(db.get_project(mockproject.name))
+    assert current.revision == project.revision + 1
+    assert current.get_task(mock_milestone_task.name).completed == 2
+    assert current.has_task("new task")
+    test_project_list_progress()
+
+    # added by then
+    with pytest.raises(RevisionConflict):
+        asyncio.run(db.add_task(outdated_project, Discrete_Task(name="new task")))
+
+    assert asyncio.run(db.delete_task(current, "new task"))
+    test_project_list_progress()
+
+
+def test_task_write_order(monkeypatch) -> None:
+    """Task writes are stamped with the revision their project update moved
+    the project to, and left out of the change log when a later write to the
+    same task moved it on first"""
+
+    def task_revision(task_name: str) -> int:
+        return db.db.delegate.tasks.find_one(
+            {"project": mockproject.name, "name": task_name}
+        )["revision"]
+
+    # another write moved the project on between the load and the write
+    project = asyncio.run(db.get_project(mockproject.name))
+    assert asyncio.run(db.add_project_member(project, admin_user.username))
+    assert asyncio.run(db.update_task_completion(project, mock_milestone_task.name, 3))
+    assert task_revision(mock_milestone_task.name) == project.revision + 2
+    response = client.get(
+        f"/projects/{mockproject.name}/changes?since={project.revision}",
+        headers={"content-type": "application/json", "token-uuid": token1},
+    )
+    assert response.json()["revision"] == project.revision + 2
+    assert "changes" in response.json()
+
+    # a write to the same task made and committed between this one's task
+    # write and its project update
+    project = asyncio.run(db.get_project(mockproject.name))
+    commit_task_writes = db._commit_task_writes
+    other_write = []
+
+    async def interleaved(*args, **kwargs):
+        if not other_write:
+            other_write.append(True)
+            current = await db.get_project(mockproject.name)
+            await db.update_task_completion(current, mock_milestone_task.name, 4)
+        return await commit_task_writes(*args, **kwargs)
+
+    monkeypatch.setattr(db, "_commit_task_writes", interleaved)
+    assert asyncio.run(db.update_task_completion(project, mock_milestone_task.name, 1))
+    monkeypatch.undo()
+
+    # neither is undone, the last one written stays
+    current = asyncio.run(db.get_project(mockproject.name))
+    assert current.revision == project.revision + 2
+    assert current.get_task(mock_milestone_task.name).completed == 4
+    assert task_revision(mock_milestone_task.name) == project.revision + 1
+
+    # and clients catching up get a snapshot of it
+    response = client.get(
+        f"/projects/{mockproject.name}/changes?since={project.revision}",
+        headers={"content-type": "application/json", "token-uuid": token1},
+    )
+    assert response.json()["revision"] == current.revision
+    assert response.json()["snapshot"] == current.model_dump()
+    test_project_list_progress()
+
+    project = asyncio.run(db.get_project(mockproject.name))
+    assert asyncio.run(db.remove_project_member(project, admin_user.username))
+    assert asyncio.run(db.update_task_completion(current, mock_milestone_task.name, 2))
+
+
+def test_migrate_tasks() -> None:
+    """Tasks embedded in project documents are moved to the task collection"""
+
+    tasks = [
+        Milestone_Task(name="first", milestones=4, completed=1).model_dump(),
+        Discrete_Task(name="second", completed=True).model_dump(),
+    ]
+    for name in ["embedded project", "opened project"]:
+        db.db.delegate.projects.insert_one(
+            {"name": name, "members": [user1.username], "tasks": tasks}
+        )
+
+    # reading them does not move them
+    response = client.get(
+        "/projects/opened project",
+        headers={"content-type": "application/json", "token-uuid": token1},
+    )
+    assert response.status_code == 200
+    assert response.json()["tasks"] == tasks
+    assert "tasks" in db.db.delegate.projects.find_one({"name": "opened project"})
+
+    # projects are moved when they are loaded to be written to
+    project = asyncio.run(db.get_project("opened project"))
+    assert [task.model_dump() for task in project.tasks] == tasks
+    assert "tasks" not in db.db.delegate.projects.find_one({"name": "opened project"})
+
+    # and by the migration
+    assert asyncio.run(db.migrate_tasks()) == 1
+    assert asyncio.run(db.migrate_tasks()) == 0
+
+    document = db.db.delegate.projects.find_one({"name": "embedded project"})
+    assert "tasks" not in document
+    assert [document["done"], document["total"]] == [2, 5]
+    project = asyncio.run(db.get_project("embedded project"))
+    assert [task.model_dump() for task in project.tasks] == tasks
+    assert project.progress == [2, 5]
+
+    for name in ["embedded project", "opened project"]:
+        assert asyncio.run(db.delete_project(name))
+    assert db.db.delegate.tasks.count_documents({"project": "opened project"}) == 0
+
+
 def test_remove_member() -> None:
     """Test removing users from tasks as owner, moderator and admin"""
 
@@ -349,3 +638,10 @@ def test_remove_task() -> None:
 
     assert response.status_code == 200
     assert response.json()["detail"] == "Task deleted successfully"
+
+    # no tasks left
+    response = client.get(
+        "/projects/all/",
+        headers={"content-type": "application/json", "token-uuid": token1},
+    )
+    assert response.json()[mockproject.name] == [0, 0]
@@ -1,17 +1,21 @@
+import asyncio
+import json
+from datetime import timedelta
 from fastapi.testclient import TestClient
-from mongomock import MongoClient
+from mongomock_motor import AsyncMongoMockClient
 
 from src.server.main import app
-from src.server.models import User
+from src.server.models import User, Token
 from src.server.dependencies import db_depend, token_auth, admin_auth
 from src.server.database import Database
+from src.server.utils import encode_cursor
 
 
 # mock database class
 class MockDatabase(Database):
     def __init__(self) -> None:
         super().__init__()
-        self.client = MongoClient()
+        self.client = AsyncMongoMockClient()
         self.db = self.client.tests
 
 
@@ -99,6 +103,27 @@ def test_login() -> None:
     assert token
 
 
+def test_login_rotates_token() -> None:
+    """Test logging in again invalidates the previous session token"""
+
+    # use the current token so it gets cached
+    response = client.get(
+        f"/users/{mock_user.username}",
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+    assert response.status_code == 200
+
+    old_token = token
+    test_login()
+
+    response = client.get(
+        f"/users/{mock_user.username}",
+        headers={"content-type": "application/json", "token-uuid": old_token},
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token not found"
+
+
 def test_failed_login() -> None:
     """Test trying to log in with a non existing user/bad password"""
 
@@ -120,6 +145,41 @@ def test_failed_login() -> None:
     assert response.json()["detail"] == "Incorrect username or password"
 
 
+def test_auth_context() -> None:
+    """Test resolving a session token to its user and admin flag in one query"""
+
+    auth = asyncio.run(db.get_auth_context(token))
+
+    assert auth.user.username == mock_user.username
+    assert auth.admin is False
+    assert auth.token.check_alive()
+    assert (
+        auth.expiration
+        == db.db.delegate.sessions.find_one({"token": token})["expiration"]
+    )
+
+    # non existing token
+    assert asyncio.run(db.get_auth_context(Token.generate("baduser").token)) is None
+
+
+def test_expired_token() -> None:
+    """Test using an expired session token"""
+
+    # insert an expired session for the mock user
+    expired_token = Token.generate(mock_user.username)
+    token_db = expired_token.convert(asyncio.run(db.get_user_id(mock_user.username)))
+    token_db.expiration = token_db.expiration - timedelta(hours=96)
+    db.db.delegate.sessions.insert_one(token_db.model_dump())
+
+    response = client.get(
+        f"/users/{mock_user.username}",
+        headers={"content-type": "application/json", "token-uuid": token_db.token},
+    )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token is expired"
+
+
 def test_get_user() -> None:
     """Test getting user data"""
 
@@ -144,6 +204,182 @@ def test_get_missing_user() -> None:
     assert response.json()["detail"] == "User not found"
 
 
+def test_get_user_etag() -> None:
+    """A client sending the ETag of its copy gets a 304 until the user changes"""
+
+    headers = {"content-type": "application/json", "token-uuid": token}
+    response = client.get(f"/users/{mock_user.username}", headers=headers)
+    etag = response.headers["etag"]
+
+    response = client.get(
+        f"/users/{mock_user.username}", headers={**headers, "if-none-match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    response = client.get("/users/baduser", headers={**headers, "if-none-match": etag})
+    assert response.status_code == 404
+
+    # update the user, the old copy is not current anymore
+    response = client.put(
+        f"/users/{mock_user.username}",
+        headers=headers,
+        json={**mock_user.model_dump(), "full_name": "new full name"},
+    )
+    assert response.status_code == 200
+
+    response = client.get(
+        f"/users/{mock_user.username}",
+        headers={**headers, "if-none-match": f'W/{etag}, "other"'},
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["full_name"] == "new full name"
+
+    client.put(
+        f"/users/{mock_user.username}", headers=headers, json=mock_user.model_dump()
+    )
+
+
+def test_search_users() -> None:
+    """Search users, usernames starting with the search come first"""
+
+    for username in ["samwise", "osama", "samuel", "busams", "sa"]:
+        client.post(
+            "/users/",
+            json={
+                "user": {"username": username, "full_name": "search user"},
+                "password": mock_password,
+            },
+        )
+
+    response = client.get(
+        "/users/?search=sam",
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == ["samuel", "samwise", "busams", "osama"]
+    assert "X-Next-Cursor" not in response.headers
+
+    # substrings are case insensitive, short searches find them too
+    for search, expected in [
+        ("SAMS", ["busams"]),
+        ("sa", ["sa", "samuel", "samwise", "busams", "osama"]),
+        ("MA", ["osama"]),
+    ]:
+        response = client.get(
+            f"/users/?search={search}",
+            headers={"content-type": "application/json", "token-uuid": token},
+        )
+        assert response.json() == expected
+
+    # searches are not regular expressions
+    response = client.get(
+        "/users/?search=.*",
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+    assert response.json() == []
+
+
+def test_search_users_pages() -> None:
+    """Page through the search results with the cursor"""
+
+    results = []
+    cursor = None
+    for _ in range(5):
+        response = client.get(
+            "/users/",
+            params={"search": "sam", "limit": 2, "cursor": cursor},
+            headers={"content-type": "application/json", "token-uuid": token},
+        )
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        results += response.json()
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert results == ["samuel", "samwise", "busams", "osama"]
+
+
+def test_search_users_ndjson() -> None:
+    """Stream the search results as newline delimited json"""
+
+    response = client.get(
+        "/users/",
+        params={"search": "sam"},
+        headers={"accept": "application/x-ndjson", "token-uuid": token},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"username": "samuel"},
+        {"username": "samwise"},
+        {"username": "busams"},
+        {"username": "osama"},
+    ]
+
+    # with a limit, the last line is the cursor of the next page
+    response = client.get(
+        "/users/",
+        params={"search": "sam", "limit": 3},
+        headers={"accept": "application/x-ndjson", "token-uuid": token},
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 4
+
+    response = client.get(
+        "/users/",
+        params={"search": "sam", "cursor": lines[3]["next_cursor"]},
+        headers={"accept": "application/x-ndjson", "token-uuid": token},
+    )
+    assert response.text == '{"username": "osama"}\n'
+
+
+def test_search_users_limit() -> None:
+    """Pages are at most 100 users"""
+
+    response = client.get(
+        "/users/",
+        params={"search": "sam", "limit": 101},
+        headers={"content-type": "application/json", "token-uuid": token},
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Limit can be at most 100"
+
+
+def test_search_users_bad_cursor() -> None:
+    """Search with cursors that are not from the server"""
+
+    for cursor in ["notacursor", encode_cursor({"phase": "everything"})]:
+        response = client.get(
+            "/users/",
+            params={"search": "sam", "cursor": cursor},
+            headers={"content-type": "application/json", "token-uuid": token},
+        )
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_index_user_search() -> None:
+    """Users created before the search collection existed get added to it"""
+
+    db.db.delegate.users.insert_one(
+        {"username": "oldsamurai", "full_name": "old user", "password": "password"}
+    )
+
+    assert asyncio.run(db.index_user_search(only_missing=True)) == 1
+    assert asyncio.run(db.index_user_search(only_missing=True)) == 0
+
+    usernames, _ = asyncio.run(db.search_users("mura"))
+    assert usernames == ["oldsamurai"]
+
+
 def test_modify_user() -> None:
     """Test modifying the user"""
 
@@ -274,10 +510,9 @@ def test_deleting_bad_user() -> None:
 def test_make_admin() -> None:
     """Test making a user an admin (must be an admin yourself)"""
 
-    # make self admin
-    db.db.users.update_one(
-        {"username": mock_user.username}, {"$set": {"power": "admin"}}
-    )
+    # make self admin (through the database interface, so the cached session
+    # is invalidated)
+    assert asyncio.run(db.make_admin(mock_user.username))
 
     # make other user admin
     response = client.post(